@@ -1,7 +1,118 @@
-import splitfolders
 import os
+import io
+import json
+import random
+import tarfile
+import argparse
 
 input_folder = "../images/"
-os.makedirs("../images-final/", exist_ok=True)
+RATIO = (.7, .2, .1)
+SPLITS = ("train", "val", "test")
+SEED = 42
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
 
-splitfolders.ratio(input_folder, output="../images-final", seed=42, ratio=(.7, .2, .1), group_prefix=None)
+
+def split_class_files(class_dir, ratio=RATIO, seed=SEED):
+    """
+    Divide os arquivos de uma classe em train/val/test, na mesma ordem que o
+    splitfolders.ratio usa (lista ordenada, embaralhada com a semente).
+    """
+    files = sorted(
+        os.path.join(class_dir, f) for f in os.listdir(class_dir)
+        if f.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    random.seed(seed)
+    random.shuffle(files)
+    train_end = int(ratio[0] * len(files))
+    val_end = train_end + int(ratio[1] * len(files))
+    return {"train": files[:train_end], "val": files[train_end:val_end], "test": files[val_end:]}
+
+
+class ShardWriter:
+    """
+    Escreve amostras em arquivos .tar sequenciais de até 'max_bytes' cada.
+    Cada amostra são dois membros com a mesma chave: '<chave>.jpg' (bytes originais)
+    e '<chave>.cls' (índice da classe em texto), como no formato do WebDataset.
+    """
+
+    def __init__(self, output_dir, prefix, max_bytes):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.shards = []
+        self.tar = None
+
+    def _open_next(self):
+        self.close()
+        name = f"{self.prefix}-{len(self.shards):05d}.tar"
+        self.tmp_path = os.path.join(self.output_dir, name + ".tmp")
+        self.tar = tarfile.open(self.tmp_path, "w")
+        self.shards.append({"file": name, "count": 0, "bytes": 0})
+
+    def _add_member(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def write(self, key, image_bytes, label):
+        if self.tar is None or self.shards[-1]["bytes"] >= self.max_bytes:
+            self._open_next()
+        self._add_member(f"{key}.jpg", image_bytes)
+        self._add_member(f"{key}.cls", str(label).encode())
+        self.shards[-1]["count"] += 1
+        self.shards[-1]["bytes"] += len(image_bytes)
+
+    def close(self):
+        if self.tar is not None:
+            self.tar.close()
+            os.replace(self.tmp_path, self.tmp_path[:-len(".tmp")])
+            self.tar = None
+
+
+def write_shards(input_dir, output_dir, shard_size_mb=256, ratio=RATIO, seed=SEED):
+    """
+    Faz o split train/val/test e grava cada split em shards .tar sequenciais,
+    sem copiar as imagens para pastas. O índice fica em '<output_dir>/index.json'.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    classes = sorted(d for d in os.listdir(input_dir) if os.path.isdir(os.path.join(input_dir, d)))
+    class_to_idx = {c: i for i, c in enumerate(classes)}
+
+    samples = {split: [] for split in SPLITS}
+    for class_name in classes:
+        for split, files in split_class_files(os.path.join(input_dir, class_name), ratio, seed).items():
+            samples[split].extend((path, class_to_idx[class_name]) for path in files)
+
+    index = {"classes": classes, "class_to_idx": class_to_idx, "splits": {}}
+    for split in SPLITS:
+        # Mistura as classes antes de gravar, para cada shard ter todas as classes
+        random.Random(seed).shuffle(samples[split])
+        writer = ShardWriter(output_dir, split, shard_size_mb * 1024 * 1024)
+        for i, (path, label) in enumerate(samples[split]):
+            with open(path, "rb") as f:
+                writer.write(f"{i:08d}", f.read(), label)
+        writer.close()
+        index["splits"][split] = writer.shards
+        total_mb = sum(s["bytes"] for s in writer.shards) / 1e6
+        print(f"{split}: {len(samples[split])} imagens em {len(writer.shards)} shards ({total_mb:.1f} MB)")
+
+    with open(os.path.join(output_dir, "index.json"), "w") as f:
+        json.dump(index, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Divide ../images/ em train/val/test")
+    parser.add_argument("--format", choices=["folders", "shards"], default="folders",
+                        help="'folders' copia as imagens com splitfolders; 'shards' grava .tar sequenciais com índice")
+    parser.add_argument("--shard-size-mb", type=int, default=256)
+    parser.add_argument("--output", default=None, help="Padrão: ../images-final (folders) ou ../images-shards (shards)")
+    args = parser.parse_args()
+
+    if args.format == "shards":
+        write_shards(input_folder, args.output or "../images-shards/", args.shard_size_mb)
+    else:
+        import splitfolders
+
+        output = args.output or "../images-final"
+        os.makedirs(output, exist_ok=True)
+        splitfolders.ratio(input_folder, output=output, seed=SEED, ratio=RATIO, group_prefix=None)
@@ -0,0 +1,71 @@
+import cv2
+import numpy as np
+
+# Número de bits "1" em cada byte, usado para a distância de Hamming vetorizada
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def dhash_batch(frames, hash_size=8):
+    """
+    Calcula o dHash (hash perceptual de diferença, 64 bits) de um lote de frames BGR.
+
+    Cada frame é reduzido para tons de cinza em (hash_size+1)x(hash_size); o bit é 1
+    quando um pixel é mais claro que o vizinho da esquerda. Retorna um array uint64 (B,).
+    """
+    small = np.stack([
+        cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+        for frame in frames
+    ])
+    bits = small[:, :, 1:] > small[:, :, :-1]
+    packed = np.packbits(bits.reshape(len(frames), -1), axis=1)
+    return packed.view(">u8").ravel().astype(np.uint64)
+
+
+def hamming(a, b):
+    """
+    Distância de Hamming entre todos os pares de hashes: a (B,) x b (N,) -> (B, N).
+    """
+    x = np.bitwise_xor(a[:, None], b[None, :])
+    return _POPCOUNT[x.view(np.uint8)].reshape(*x.shape, 8).sum(axis=-1)
+
+
+class HashIndex:
+    """
+    Índice em memória de hashes já aceitos. Um frame é considerado duplicado quando
+    está a no máximo 'threshold' bits de algum hash do índice.
+    """
+
+    def __init__(self, threshold=5):
+        self.threshold = threshold
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def filter(self, hashes, batch_size=256):
+        """
+        Retorna a máscara dos hashes que não são duplicados e os adiciona ao índice.
+        Hashes do mesmo lote também são comparados entre si, em ordem.
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        keep = np.ones(len(hashes), dtype=bool)
+
+        for start in range(0, len(hashes), batch_size):
+            batch = hashes[start:start + batch_size]
+            if len(self.hashes):
+                dup = hamming(batch, self.hashes).min(axis=1) <= self.threshold
+            else:
+                dup = np.zeros(len(batch), dtype=bool)
+
+            close = hamming(batch, batch) <= self.threshold
+            kept = []
+            for i in range(len(batch)):
+                if not dup[i] and close[i, kept].any():
+                    dup[i] = True
+                if not dup[i]:
+                    kept.append(i)
+
+            keep[start:start + len(batch)] = ~dup
+            self.hashes = np.concatenate([self.hashes, batch[kept]])
+
+        return keep
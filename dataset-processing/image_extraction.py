@@ -1,30 +1,280 @@
-import cv2 
-import os 
+import cv2
+import os
+import sys
+import glob
+import time
+import argparse
+import numpy as np
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dedup import HashIndex, dhash_batch
 
-paths = ["bluelock_2", "bluelock_3", "bluelock_4","bluelock_5", "bluelock_6", "bluelock_7", "bluelock_8", "bluelock_9", "bluelock_10"]
+# Vídeos usados originalmente no dataset (Blue Lock). Usados quando nenhum vídeo é informado.
+DEFAULT_VIDEOS = ["../videos/*.mp4"]
+OUTPUT_DIR = "../images"
 
-for dir_vid in paths:
-    vid = cv2.VideoCapture(f"../videos/{dir_vid}.mp4")
-    count = 0
 
-    os.makedirs("../images", exist_ok=True)
-    os.makedirs(f"../images/{dir_vid}", exist_ok=True)
+def expand_videos(patterns):
+    """
+    Expande a lista de caminhos/globs informada em uma lista ordenada de vídeos.
+    """
+    videos = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        videos.extend(matches if matches else [pattern])
+    # Remove repetidos mantendo a ordem
+    return list(dict.fromkeys(videos))
 
-    while(True):
-        if count % 15 == 0:
-            success, frame = vid.read()
-            if not success: break 
-            cv2.imshow("Output", frame)
-            cv2.imwrite(f'../images/{dir_vid}/' + str(int(count/20)) + '.jpg', frame)
+
+def video_info(path):
+    """
+    Retorna (total de frames, fps) do vídeo, lidos do container.
+    """
+    vid = cv2.VideoCapture(path)
+    if not vid.isOpened():
+        raise IOError(f"Não foi possível abrir o vídeo: {path}")
+    total = int(vid.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = vid.get(cv2.CAP_PROP_FPS) or 30.0
+    vid.release()
+    return total, fps
+
+
+def sample_targets(start, end, fps, stride=None, every_seconds=None):
+    """
+    Gera os pares (n, índice do frame) a extrair no intervalo [start, end).
+
+    'n' é o índice global da amostra no vídeo, então os nomes dos arquivos
+    ({n}.jpg) não dependem de como o vídeo foi dividido entre os workers.
+    """
+    if every_seconds:
+        step = every_seconds * fps
+        n = int(-(-start // step))  # ceil(start / step)
+        while True:
+            idx = int(round(n * step))
+            if idx >= end:
+                break
+            if idx >= start:
+                yield n, idx
+            n += 1
+    else:
+        first = -(-start // stride) * stride
+        for idx in range(first, end, stride):
+            yield idx // stride, idx
+
+
+def plan_tasks(videos, stride, every_seconds, chunk_seconds):
+    """
+    Divide cada vídeo em intervalos de tempo de até 'chunk_seconds' segundos.
+    Vídeos curtos viram uma única tarefa (um vídeo por worker).
+    """
+    tasks = []
+    for path in videos:
+        total, fps = video_info(path)
+        if total <= 0:
+            # Container sem contagem de frames: lê o vídeo inteiro numa única tarefa
+            total, chunk_seconds_video = sys.maxsize, 0
+        else:
+            chunk_seconds_video = chunk_seconds
+        chunk = int(chunk_seconds_video * fps) if chunk_seconds_video else total
+        chunk = max(chunk, 1)
+        for start in range(0, total, chunk):
+            tasks.append({
+                "video": path,
+                "start": start,
+                "end": min(start + chunk, total),
+                "fps": fps,
+                "stride": stride,
+                "every_seconds": every_seconds,
+            })
+    return tasks
+
+
+def read_frames(vid, targets, seek_threshold=90):
+    """
+    Lê os frames (BGR) dos pares (n, índice) de 'targets', em ordem crescente de índice.
+    Gera (n, índice, frame) e para no fim do vídeo.
+
+    Saltos maiores que 'seek_threshold' frames usam seek (CAP_PROP_POS_FRAMES);
+    saltos menores usam grab(), que é mais barato que decodificar a partir do
+    keyframe anterior a cada amostra.
+    """
+    position = None  # índice do próximo frame que read()/grab() devolveria
+    for n, idx in targets:
+        gap = idx - position if position is not None else None
+        if gap is None or gap < 0 or gap > seek_threshold:
+            vid.set(cv2.CAP_PROP_POS_FRAMES, idx)
         else:
-            success = vid.grab()
-            if not success: break
+            for _ in range(gap):
+                if not vid.grab():
+                    break
+        success, frame = vid.read()
+        if not success:
+            return
+        position = idx + 1
+        yield n, idx, frame
+
+
+def _init_worker():
+    # Um processo por vídeo/intervalo: evita que o OpenCV crie threads extras em cada worker
+    cv2.setNumThreads(1)
+
+
+def extract_range(task, output_dir=OUTPUT_DIR, seek_threshold=90, jpeg_quality=95, dedup_threshold=None, hash_batch=32):
+    """
+    Extrai os frames amostrados de um intervalo do vídeo, sem interface gráfica
+    (leitura com seek/grab em read_frames).
+
+    Com 'dedup_threshold', os frames são agrupados em lotes de 'hash_batch', e os
+    quase-duplicados do intervalo (Hamming <= threshold) não chegam a ser gravados.
+    """
+    start_time = time.time()
+    video_name = os.path.splitext(os.path.basename(task["video"]))[0]
+    out_dir = os.path.join(output_dir, video_name)
+    os.makedirs(out_dir, exist_ok=True)
 
-        count +=1
+    vid = cv2.VideoCapture(task["video"])
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
+    index = HashIndex(dedup_threshold) if dedup_threshold is not None else None
 
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+    pending = []  # (n, frame) ainda não gravados
+    kept_n, kept_hashes, kept_sizes = [], [], []
+    dropped = 0
+
+    def flush():
+        nonlocal dropped
+        if not pending:
+            return
+        if index is not None:
+            hashes = dhash_batch([frame for _, frame in pending])
+            keep = index.filter(hashes)
+        else:
+            hashes = np.zeros(len(pending), dtype=np.uint64)
+            keep = np.ones(len(pending), dtype=bool)
+        for (n, frame), h, k in zip(pending, hashes, keep):
+            if not k:
+                dropped += 1
+                continue
+            path = os.path.join(out_dir, f"{n}.jpg")
+            cv2.imwrite(path, frame, params)
+            kept_n.append(n)
+            kept_hashes.append(h)
+            kept_sizes.append(os.path.getsize(path))
+        pending.clear()
+
+    targets = sample_targets(task["start"], task["end"], task["fps"], task["stride"], task["every_seconds"])
+    for n, _, frame in read_frames(vid, targets, seek_threshold):
+        pending.append((n, frame))
+        if len(pending) >= hash_batch:
+            flush()
+    flush()
 
     vid.release()
+    elapsed = time.time() - start_time
+    written = len(kept_n)
+    # Os frames descartados nunca foram codificados: estima os bytes pelo tamanho médio dos gravados
+    mean_size = sum(kept_sizes) / written if written else 0
+    return {
+        "video": video_name,
+        "start": task["start"],
+        "end": task["end"],
+        "frames": written + dropped,
+        "written": written,
+        "dropped": dropped,
+        "dropped_bytes": int(dropped * mean_size),
+        "n": np.array(kept_n, dtype=np.int64),
+        "hashes": np.array(kept_hashes, dtype=np.uint64),
+        "sizes": np.array(kept_sizes, dtype=np.int64),
+        "seconds": elapsed,
+        "pid": os.getpid(),
+    }
+
+
+def dedup_across_chunks(results, output_dir, threshold, scope="dataset"):
+    """
+    Segunda etapa da deduplicação, no processo principal: compara os frames
+    mantidos por cada worker com os de outros intervalos do mesmo vídeo
+    (scope="video") ou de todo o dataset (scope="dataset") e apaga os repetidos.
+
+    Retorna (frames removidos, bytes removidos).
+    """
+    indexes = {}
+    removed, removed_bytes = 0, 0
+    for stats in sorted(results, key=lambda r: (r["video"], r["start"])):
+        key = stats["video"] if scope == "video" else None
+        index = indexes.setdefault(key, HashIndex(threshold))
+        keep = index.filter(stats["hashes"])
+        for n, size in zip(stats["n"][~keep], stats["sizes"][~keep]):
+            os.remove(os.path.join(output_dir, stats["video"], f"{n}.jpg"))
+            removed += 1
+            removed_bytes += int(size)
+    return removed, removed_bytes
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extração paralela de frames dos vídeos para ../images/<video>/<n>.jpg")
+    parser.add_argument("videos", nargs="*", default=DEFAULT_VIDEOS, help="Caminhos ou globs dos vídeos")
+    parser.add_argument("--output", default=OUTPUT_DIR, help="Pasta de saída (padrão: ../images)")
+    sampling = parser.add_mutually_exclusive_group()
+    sampling.add_argument("--stride", type=int, default=15, help="Extrai um frame a cada N frames")
+    sampling.add_argument("--every-seconds", type=float, default=None, help="Extrai um frame a cada N segundos")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Número de processos")
+    parser.add_argument("--chunk-seconds", type=float, default=600, help="Divide vídeos longos em intervalos deste tamanho (0 desativa)")
+    parser.add_argument("--seek-threshold", type=int, default=90, help="Saltos maiores que isso (em frames) usam seek em vez de grab")
+    parser.add_argument("--quality", type=int, default=95, help="Qualidade JPEG")
+    parser.add_argument("--dedup", action="store_true", help="Descarta frames quase idênticos (hash perceptual)")
+    parser.add_argument("--dedup-threshold", type=int, default=5, help="Distância de Hamming máxima (de 64 bits) para considerar duplicado")
+    parser.add_argument("--dedup-scope", choices=["video", "dataset"], default="dataset", help="Compara frames dentro de cada vídeo ou no dataset inteiro")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    videos = expand_videos(args.videos)
+    if not videos:
+        print("Nenhum vídeo encontrado.")
+        return
+
+    os.makedirs(args.output, exist_ok=True)
+    tasks = plan_tasks(videos, args.stride, args.every_seconds, args.chunk_seconds)
+    print(f"{len(videos)} vídeos, {len(tasks)} tarefas, {args.workers} workers")
+
+    start_time = time.time()
+    per_worker = defaultdict(lambda: [0, 0.0])
+    total_frames = 0
+    results = []
+    dedup_threshold = args.dedup_threshold if args.dedup else None
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+        futures = [
+            pool.submit(extract_range, task, args.output, args.seek_threshold, args.quality, dedup_threshold)
+            for task in tasks
+        ]
+        for future in as_completed(futures):
+            stats = future.result()
+            results.append(stats)
+            total_frames += stats["frames"]
+            per_worker[stats["pid"]][0] += stats["frames"]
+            per_worker[stats["pid"]][1] += stats["seconds"]
+            fps = stats["frames"] / stats["seconds"] if stats["seconds"] else 0.0
+            print(f"[pid {stats['pid']}] {stats['video']} frames {stats['start']}-{stats['end']}: "
+                  f"{stats['frames']} frames em {stats['seconds']:.1f}s ({fps:.1f} frames/s), {stats['written']} gravados")
+
+    if args.dedup:
+        dropped = sum(r["dropped"] for r in results)
+        dropped_bytes = sum(r["dropped_bytes"] for r in results)
+        removed, removed_bytes = dedup_across_chunks(results, args.output, args.dedup_threshold, args.dedup_scope)
+        kept = sum(r["written"] for r in results) - removed
+        print("\nDeduplicação:")
+        print(f"  Dentro de cada intervalo: {dropped} frames descartados (~{dropped_bytes / 1e6:.1f} MB)")
+        print(f"  Entre intervalos ({args.dedup_scope}): {removed} frames removidos ({removed_bytes / 1e6:.1f} MB)")
+        print(f"  Mantidos: {kept} de {total_frames} frames ({(dropped + removed) / max(total_frames, 1):.1%} economizados)")
+
+    total_time = time.time() - start_time
+    print("\nResumo por worker:")
+    for pid, (frames, seconds) in sorted(per_worker.items()):
+        print(f"  pid {pid}: {frames} frames, {frames / seconds if seconds else 0.0:.1f} frames/s")
+    print(f"Total: {total_frames} frames em {total_time:.1f}s ({total_frames / total_time if total_time else 0.0:.1f} frames/s)")
+
 
-cv2.destroyAllWindows()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
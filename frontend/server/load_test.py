@@ -0,0 +1,54 @@
+import time
+import argparse
+import urllib.error
+import urllib.request
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+def send(url, data, timeout=None):
+    """
+    Envia uma imagem e retorna (latência em segundos, status HTTP).
+    Falhas de conexão (recusada, resetada, timeout) voltam com status None e contam como erro.
+    """
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/octet-stream"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:  # URLError, ConnectionResetError, timeout...
+        status = None
+    return time.perf_counter() - start, status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga do servidor de inferência")
+    parser.add_argument("image", help="Imagem enviada em todas as requisições")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/predict")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--requests", type=int, default=500, help="Requisições por nível de concorrência")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Timeout de cada requisição (s)")
+    args = parser.parse_args()
+
+    with open(args.image, "rb") as f:
+        data = f.read()
+
+    print(f"{'conc.':>6} {'req/s':>8} {'p50 (ms)':>9} {'p90 (ms)':>9} {'p99 (ms)':>9} {'503':>5} {'erros':>6}")
+    for concurrency in args.concurrency:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda _: send(args.url, data, args.timeout), range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+        latencies = np.array([lat for lat, status in results if status == 200]) * 1000
+        rejected = sum(status == 503 for _, status in results)
+        errors = sum(status not in (200, 503) for _, status in results)
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) if len(latencies) else (float("nan"),) * 3
+        print(f"{concurrency:>6} {len(latencies) / elapsed:>8.1f} {p50:>9.1f} {p90:>9.1f} {p99:>9.1f} {rejected:>5} {errors:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import io
+import os
+import sys
+import time
+import queue
+import asyncio
+import threading
+import torch
+from torchvision import transforms
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "model_choosing"))
+from backends import load_artifact
+from preprocessing import open_image
+from model_registry import load_model as registry_load_model
+
+# --------------------------------------------------------------------------
+# Servidor HTTP de inferência com micro-batching dinâmico
+# --------------------------------------------------------------------------
+# As requisições são decodificadas em paralelo e entram numa fila limitada. Threads
+# de inferência juntam o que estiver na fila em lotes de até MAX_BATCH_SIZE imagens,
+# esperando no máximo MAX_WAIT_MS pelo lote encher, e rodam um único forward por lote.
+# Com a fila cheia o servidor responde 503 (backpressure) em vez de acumular latência.
+#
+# Para rodar (a partir desta pasta):
+#   MODEL=mobilenet uvicorn server:app --host 0.0.0.0 --port 8000
+# Variáveis de ambiente: MODEL (mobilenet | efficientnet), CHECKPOINT_DIR, MAX_BATCH_SIZE,
+# MAX_WAIT_MS, MAX_QUEUE, INFERENCE_WORKERS.
+# MODEL_ARTIFACT carrega direto um artefato exportado no lugar do checkpoint .pth, por exemplo
+# o INT8 de model_choosing/quantize.py (MobileNetV2.int8.pt ou MobileNetV2.int8.onnx).
+
+MODEL = os.environ.get("MODEL", "mobilenet")
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "streamlit"))
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 32))
+MAX_WAIT_MS = float(os.environ.get("MAX_WAIT_MS", 10))
+MAX_QUEUE = int(os.environ.get("MAX_QUEUE", 256))
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", 1))
+MODEL_ARTIFACT = os.environ.get("MODEL_ARTIFACT")
+
+MAPPED_CLASSES = {0:'Black Clover', 1:'Blue Lock', 2:'Naruto'}
+
+TRANSFORM = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])])
+
+
+def load_model(model_name=MODEL, checkpoint_dir=CHECKPOINT_DIR, artifact=MODEL_ARTIFACT):
+    if artifact:
+        return load_artifact(artifact)
+    # Nomes curtos do servidor -> arquitetura do registro (model_choosing/model_registry.py)
+    architecture = "MobileNetV2" if model_name == "mobilenet" else "EfficientNetB0"
+    file_path = os.path.join(checkpoint_dir, f"best{architecture}-more-images-5unfrozen_100.pth")
+    return registry_load_model(architecture, file_path)
+
+
+def decode_image(data):
+    # Mesma decodificação do front-end (preprocessing.open_image): modo draft perto de
+    # 224x224 e limite de pixels contra imagens gigantes
+    return TRANSFORM(open_image(io.BytesIO(data), (224, 224)))
+
+
+class MicroBatcher:
+    """
+    Fila limitada de imagens já transformadas + threads que executam lotes dinâmicos.
+    submit() devolve um asyncio.Future resolvido com as probabilidades da imagem.
+    """
+
+    def __init__(self, model, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                 max_queue=MAX_QUEUE, num_workers=INFERENCE_WORKERS):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batches = 0
+        self.images = 0
+        self.rejected = 0
+        self._threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(num_workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, tensor, loop):
+        future = loop.create_future()
+        try:
+            self.queue.put_nowait((tensor, future, loop))
+        except queue.Full:
+            self.rejected += 1
+            raise
+        return future
+
+    def _collect(self):
+        items = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _worker(self):
+        while True:
+            items = self._collect()
+            try:
+                batch = torch.stack([tensor for tensor, _, _ in items])
+                with torch.no_grad():
+                    probabilities = torch.softmax(self.model(batch), dim=1)
+                self.batches += 1
+                self.images += len(items)
+                for (_, future, loop), probs in zip(items, probabilities.tolist()):
+                    loop.call_soon_threadsafe(_resolve, future, probs, len(items))
+            except Exception as e:
+                for _, future, loop in items:
+                    loop.call_soon_threadsafe(_fail, future, e)
+
+
+def _resolve(future, probs, batch_size):
+    if not future.done():
+        future.set_result((probs, batch_size))
+
+
+def _fail(future, error):
+    if not future.done():
+        future.set_exception(error)
+
+
+app = FastAPI(title="Animeletron 3000 - inferência")
+batcher = MicroBatcher(load_model())
+
+
+@app.post("/predict")
+async def predict(request: Request):
+    """
+    Corpo da requisição: bytes da imagem (JPG/PNG).
+    """
+    data = await request.body()
+    try:
+        tensor = await run_in_threadpool(decode_image, data)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Imagem inválida")
+
+    try:
+        future = batcher.submit(tensor, asyncio.get_running_loop())
+    except queue.Full:
+        raise HTTPException(status_code=503, detail="Fila cheia, tente novamente", headers={"Retry-After": "1"})
+
+    probs, batch_size = await future
+    predicted = max(range(len(probs)), key=probs.__getitem__)
+    return {
+        "prediction": MAPPED_CLASSES[predicted],
+        "probabilities": {MAPPED_CLASSES[i]: p for i, p in enumerate(probs)},
+        "batch_size": batch_size,
+    }
+
+
+@app.get("/health")
+def health():
+    return {
+        "model": MODEL_ARTIFACT or MODEL,
+        "queue": batcher.queue.qsize(),
+        "batches": batcher.batches,
+        "images": batcher.images,
+        "mean_batch_size": batcher.images / batcher.batches if batcher.batches else 0.0,
+        "rejected": batcher.rejected,
+    }
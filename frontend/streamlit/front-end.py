@@ -2,42 +2,171 @@ import streamlit as st
 from PIL import Image
 import time
 import torch 
-import torchvision.models as models
-import torch.nn as nn
 from torchvision import transforms
+import io
 import os
+import sys
+import json
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "model_choosing"))
+from backends import TorchBackend, OnnxRuntimeBackend, CascadeBackend, load_artifact
+from prediction_cache import PredictionCache, image_key, file_identity
+from preprocessing import open_image, preview_image
+from model_registry import load_model as registry_load_model, startup_report
+from predictions import checkpoint_hash
 
 # --- 1. CONFIGURAÇÃO DA PÁGINA ---
 Image.MAX_IMAGE_PIXELS = 100000000
 deeplearning_model = 1
+MODEL_NAME = "MobileNetV2" if deeplearning_model == 1 else "EfficientNetB0"
+INFERENCE_BATCH_SIZE = 32  # Imagens por forward no modo em lote
+MAPPED_CLASSES = {0:'Black Clover', 1:'Blue Lock', 2:'Naruto'}
+# "pytorch", "onnxruntime" (usa <modelo>.opt.onnx desta pasta, gerado com
+# python model_conversion.py --models MobileNetV2 --output-dir ../frontend/streamlit)
+# ou "int8" (usa <modelo>.int8.pt desta pasta, gerado com quantize.py)
+INFERENCE_BACKEND = "pytorch"
+# Cascata: roda a MobileNetV2 e só repassa à EfficientNetB0 as imagens com margem top-1
+# (p1 - p2) abaixo do limiar. Ignora deeplearning_model. O limiar vem de
+# python cascade.py (model_choosing/), que varre acurácia x latência média na validação
+# sobre os checkpoints desta pasta e grava CASCADE_CALIBRATION com o hash de cada um.
+# CASCADE_THRESHOLD = None usa esse limiar (e recusa se os checkpoints mudaram);
+# um número fixa o limiar à mão.
+CASCADE = False
+CASCADE_MODELS = ("MobileNetV2", "EfficientNetB0")
+CASCADE_THRESHOLD = None
+CASCADE_CALIBRATION = "cascade_threshold.json"
+# Cache de predições compartilhado entre as sessões (ver prediction_cache.py).
+# PREDICTION_CACHE_DB = "predictions.sqlite3" mantém as predições entre reinícios.
+PREDICTION_CACHE_ENTRIES = 10000
+PREDICTION_CACHE_MB = 64
+PREDICTION_CACHE_DB = None
+
+# Criado uma única vez, e não a cada clique
+TRANSFORM = transforms.Compose([
+    transforms.Resize((224, 224)), 
+    transforms.ToTensor(), 
+    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])])
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def checkpoint_path(model_name=MODEL_NAME):
+    return os.path.join(SCRIPT_PATH, f"best{model_name}-more-images-5unfrozen_100.pth")
+
+
+def artifact_path(model_name=MODEL_NAME):
+    """
+    Arquivo de onde o modelo é carregado, conforme INFERENCE_BACKEND e deeplearning_model.
+    """
+    if INFERENCE_BACKEND == "onnxruntime":
+        return os.path.join(SCRIPT_PATH, f"{model_name}.opt.onnx")
+    if INFERENCE_BACKEND == "int8":
+        return os.path.join(SCRIPT_PATH, f"{model_name}.int8.pt")
+    return checkpoint_path(model_name)
+
+
+@st.cache_resource
+def cascade_threshold():
+    """
+    Limiar da cascata. O calibrado por cascade.py só vale para os checkpoints em que foi
+    medido: se algum checkpoint servido mudou, é preciso calibrar de novo.
+    """
+    if CASCADE_THRESHOLD is not None:
+        return CASCADE_THRESHOLD
+    calibration_path = os.path.join(SCRIPT_PATH, CASCADE_CALIBRATION)
+    if not os.path.exists(calibration_path):
+        raise FileNotFoundError(f"{calibration_path} não existe: rode python cascade.py em model_choosing/ "
+                                "ou defina CASCADE_THRESHOLD")
+    with open(calibration_path) as f:
+        calibration = json.load(f)
+    for name in CASCADE_MODELS:
+        # Os artefatos ONNX/INT8 saem destes mesmos .pth
+        if calibration["checkpoints"].get(name) != checkpoint_hash(checkpoint_path(name)):
+            raise ValueError(f"O limiar de {calibration_path} foi calibrado com outro checkpoint de {name}: "
+                             "rode python cascade.py de novo")
+    return calibration["threshold"]
+
+
+def load_backend(model_name, device):
+    file_path = artifact_path(model_name)
+    if INFERENCE_BACKEND == "onnxruntime":
+        return OnnxRuntimeBackend(file_path)
+    if INFERENCE_BACKEND == "int8":
+        return load_artifact(file_path, device)
+    # Arquitetura vem do registro (model_choosing/model_registry.py), sem baixar pesos pré-treinados
+    model = registry_load_model(model_name, file_path, device)
+    # Movido uma vez; o modelo em cache já fica no device
+    return TorchBackend(model, device)
+
 
 @st.cache_resource 
 def load_model():
-    script_path = os.path.dirname(os.path.abspath(__file__))
-    if deeplearning_model == 1:
-        model = models.mobilenet_v2(weights='DEFAULT')
-        num_features = model.last_channel
-        model.classifier = nn.Sequential(
-        nn.Linear(num_features, 3)
-        )
-        file_path = os.path.join(script_path, "bestMobileNetV2-more-images-5unfrozen_100.pth")
-        checkpoint = torch.load(file_path, map_location=torch.device('cpu'))
-        model.load_state_dict(checkpoint)
-    else:
-        model = models.efficientnet_b0(weights='DEFAULT')
+    device = torch.device('cpu')
+    if CASCADE:
+        fast, accurate = CASCADE_MODELS
+        return CascadeBackend(load_backend(fast, device), load_backend(accurate, device), cascade_threshold()), device
+    return load_backend(MODEL_NAME, device), device
 
-        num_features = model.classifier[1].in_features 
 
-        model.classifier = nn.Sequential(
-            nn.Dropout(p=0.2, inplace=True), # Recomendado colocar de volta
-            nn.Linear(num_features, 3)
-        )
-        file_path = os.path.join(script_path, "bestEfficientNetB0-more-images-5unfrozen_100.pth")
-        checkpoint = torch.load(file_path, map_location=torch.device('cpu'))
-        model.load_state_dict(checkpoint)
-    model.eval()
-    device = torch.device('cpu')
-    return model, device 
+def decode_image(uploaded):
+    # Decodifica já perto de 224x224 (modo draft do JPEG), sem materializar a imagem inteira
+    return TRANSFORM(open_image(io.BytesIO(uploaded.getvalue()), (224, 224)))
+
+
+def predict_files(files, model, device, batch_size=INFERENCE_BATCH_SIZE):
+    """
+    Decodifica as imagens em paralelo (threads) e roda um forward por lote de 'batch_size'.
+    Retorna um tensor (N, 3) de probabilidades, na ordem dos arquivos.
+    """
+    probabilities = []
+    with ThreadPoolExecutor() as pool, torch.no_grad():
+        for start in range(0, len(files), batch_size):
+            batch = torch.stack(list(pool.map(decode_image, files[start:start + batch_size])))
+            outputs = model(batch.to(device))
+            probabilities.append(torch.nn.functional.softmax(outputs, dim=1))
+    return torch.cat(probabilities)
+
+
+@st.cache_resource
+def model_identity():
+    # Backend + arquivo + hash do conteúdo: outro checkpoint nunca reaproveita predições antigas
+    if CASCADE:
+        return f"cascade:{cascade_threshold()}:" + "+".join(file_identity(artifact_path(name), f"{INFERENCE_BACKEND}:")
+                                                          for name in CASCADE_MODELS)
+    return file_identity(artifact_path(), f"{INFERENCE_BACKEND}:")
+
+
+@st.cache_resource
+def get_prediction_cache():
+    return PredictionCache(PREDICTION_CACHE_ENTRIES, PREDICTION_CACHE_MB * 2 ** 20, PREDICTION_CACHE_DB)
+
+
+def predict_cached(files, model, device, cache):
+    """
+    Como predict_files, mas só decodifica e roda o modelo nas imagens que não estão no cache.
+    """
+    keys = [image_key(f.getvalue(), model_identity()) for f in files]
+    probabilities = [cache.get(key) for key in keys]
+    missing = [i for i, probs in enumerate(probabilities) if probs is None]
+    if missing:
+        computed = predict_files([files[i] for i in missing], model, device)
+        for i, probs in zip(missing, computed.tolist()):
+            cache.put(keys[i], probs)
+            probabilities[i] = probs
+    return torch.tensor(probabilities)
+
+
+def show_cache_stats():
+    stats = get_prediction_cache().stats()
+    text = (f"Cache de predições: {stats['hits']} acertos / {stats['misses']} falhas "
+            f"({stats['hit_rate']:.0%}) · {stats['entries']} entradas · {stats['bytes'] / 2 ** 20:.1f} MB")
+    if CASCADE:
+        cascade = load_model()[0]
+        text += (f"  \nCascata (limiar {cascade.threshold}): {cascade.escalated}/{cascade.images} imagens "
+                 f"escaladas para {CASCADE_MODELS[1]} ({cascade.escalation_rate():.0%})")
+    cache_stats.caption(text)
 
 st.set_page_config(
     page_title="Animeletron 3000",
@@ -134,6 +263,13 @@ with st.sidebar:
         
     )
     st.divider()
+    modo = st.radio("Modo de análise", ["Imagem única", "Lote (várias imagens)"])
+    st.divider()
+    cache_stats = st.empty()
+    show_cache_stats()
+    if startup_report():
+        # Custo da inicialização do modelo neste processo (imports sob demanda + construção + checkpoint)
+        st.caption("Inicialização: " + " · ".join(f"{name} {seconds:.2f}s" for name, seconds in startup_report().items()))
     st.caption("Desenvolvido com Streamlit & PyTorch")
 
 # --- 5. CABEÇALHO ---
@@ -146,6 +282,35 @@ with col_title:
 
 st.divider()
 
+# --- 6a. MODO EM LOTE ---
+if modo == "Lote (várias imagens)":
+    st.subheader("1. Carregue os frames")
+    uploaded_files = st.file_uploader("Solte as imagens aqui (JPG/PNG)", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
+
+    if uploaded_files and st.button(f"🔍 ANALISAR {len(uploaded_files)} IMAGENS 🔍", use_container_width=True):
+        model, device = load_model()
+        with st.spinner("Processando imagens..."):
+            start = time.time()
+            probabilities = predict_cached(uploaded_files, model, device, get_prediction_cache())
+            elapsed = time.time() - start
+        show_cache_stats()
+
+        predicted = torch.argmax(probabilities, dim=1).tolist()
+        results = pd.DataFrame({
+            "Arquivo": [f.name for f in uploaded_files],
+            "Predição": [MAPPED_CLASSES[p] for p in predicted],
+            "Naruto (%)": (probabilities[:, 2] * 100).tolist(),
+            "Black Clover (%)": (probabilities[:, 0] * 100).tolist(),
+            "Blue Lock (%)": (probabilities[:, 1] * 100).tolist(),
+        })
+
+        st.success(f"{len(uploaded_files)} imagens em {elapsed:.2f}s ({len(uploaded_files) / elapsed:.1f} imagens/s)")
+        st.dataframe(results, use_container_width=True, hide_index=True,
+                     column_config={c: st.column_config.NumberColumn(format="%.1f") for c in results.columns[2:]})
+        st.download_button("⬇️ Baixar CSV", results.to_csv(index=False).encode("utf-8"),
+                           file_name="predicoes.csv", mime="text/csv")
+    st.stop()
+
 # --- 6. ÁREA DE UPLOAD ---
 col_upload, col_preview = st.columns([1.2, 1])
 
@@ -158,7 +323,7 @@ with col_upload:
 
 with col_preview:
     if uploaded_file is not None:
-        image = Image.open(uploaded_file).convert('RGB')
+        image = preview_image(io.BytesIO(uploaded_file.getvalue()))  # Miniatura, não a imagem inteira
         st.markdown(
             f'<style>img {{border-radius: 15px; border: 2px solid rgba(255,255,255,0.2);}}</style>', 
             unsafe_allow_html=True
@@ -193,32 +358,28 @@ if uploaded_file is not None:
 
     if run_btn:
         progress_text = "Processando imagem..."
-        transform = transforms.Compose([
-        transforms.Resize((224, 224)), 
-        transforms.ToTensor(), 
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])])
-
-        image_transformed = transform(image)
-        input_image = image_transformed.unsqueeze(0)
-
-
         my_bar = st.progress(0, text=progress_text)
 
         model, device = load_model()
-        model = model.to(device)
-        input_image = input_image.to(device)    
+        cache = get_prediction_cache()
+        cache_key = image_key(uploaded_file.getvalue(), model_identity())
+        cached_probs = cache.get(cache_key)
         my_bar.progress(30, text="Carregando modelo...")
-        
-        with torch.no_grad():
-                outputs = model(input_image)
-        
-        probabilities = torch.nn.functional.softmax(outputs, dim=1)
-        predicted_class = torch.argmax(probabilities, dim=1).item()
 
-        mapped_classes = {0:'Black Clover', 1:'Blue Lock', 2:'Naruto'}
+        if cached_probs is None:
+            input_image = decode_image(uploaded_file).unsqueeze(0).to(device)
+            with torch.no_grad():
+                    outputs = model(input_image)
+            probabilities = torch.nn.functional.softmax(outputs, dim=1)
+            cache.put(cache_key, probabilities[0].tolist())
+        else:
+            # Mesma imagem e mesmo modelo: reaproveita a predição sem pré-processar nem rodar o modelo
+            probabilities = torch.tensor([cached_probs])
+        show_cache_stats()
+        predicted_class = torch.argmax(probabilities, dim=1).item()
 
         my_bar.progress(70, text="Realizando predição...")
-        resultado_final = mapped_classes[predicted_class]
+        resultado_final = MAPPED_CLASSES[predicted_class]
         probs = {"Naruto": probabilities[0][2].item(), "Black Clover": probabilities[0][0].item(), "Blue Lock": probabilities[0][1].item()}
         
         my_bar.progress(100, text="Análise concluída!")
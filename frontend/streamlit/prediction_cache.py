@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# --------------------------------------------------------------------------
+# Cache de predições do front-end
+# --------------------------------------------------------------------------
+# A chave é o SHA-256 dos bytes da imagem enviada + a identidade do modelo (backend,
+# arquivo e hash do checkpoint), então trocar de modelo nunca reaproveita resultados
+# antigos. Em memória é um LRU limitado por número de entradas e por bytes; com
+# 'db_path' as predições também vão para um SQLite local e sobrevivem a reinícios.
+# Uma única instância é compartilhada por todas as sessões (st.cache_resource).
+
+
+def image_key(data, model_identity):
+    return hashlib.sha256(data).hexdigest() + ":" + model_identity
+
+
+def file_identity(path, label=""):
+    """
+    Identidade de um checkpoint/artefato: nome + SHA-1 do conteúdo.
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return f"{label}{os.path.basename(path)}:{digest.hexdigest()[:16]}"
+
+
+def _entry_size(key, probs):
+    return sys.getsizeof(key) + sys.getsizeof(probs) + sum(sys.getsizeof(p) for p in probs)
+
+
+class PredictionCache:
+    """
+    LRU thread-safe de probabilidades por imagem, com persistência opcional em SQLite.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 2 ** 20, db_path=None, max_db_entries=100000):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_db_entries = max_db_entries
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, probs TEXT, last_used REAL)")
+            self._db.commit()
+
+    def get(self, key):
+        with self._lock:
+            probs = self.entries.get(key)
+            if probs is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return probs
+            if self._db is not None:
+                row = self._db.execute("SELECT probs FROM predictions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    probs = tuple(json.loads(row[0]))
+                    self._db.execute("UPDATE predictions SET last_used = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+                    self._insert(key, probs)
+                    self.hits += 1
+                    return probs
+            self.misses += 1
+            return None
+
+    def put(self, key, probs):
+        probs = tuple(float(p) for p in probs)
+        with self._lock:
+            self._insert(key, probs)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)", (key, json.dumps(probs), time.time()))
+                # Mantém o arquivo limitado descartando as predições usadas há mais tempo
+                self._db.execute("DELETE FROM predictions WHERE key IN (SELECT key FROM predictions ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                                 (self.max_db_entries,))
+                self._db.commit()
+
+    def _insert(self, key, probs):
+        if key in self.entries:
+            self.bytes -= _entry_size(key, self.entries.pop(key))
+        self.entries[key] = probs
+        self.bytes += _entry_size(key, probs)
+        while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+            old_key, old_probs = self.entries.popitem(last=False)
+            self.bytes -= _entry_size(old_key, old_probs)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,156 @@
+import os
+import time
+import numpy as np
+import torch
+
+# --------------------------------------------------------------------------
+# Backends de inferência intercambiáveis
+# --------------------------------------------------------------------------
+# Todo backend é chamável: recebe um lote normalizado (N, 3, H, W) em float e devolve
+# os logits (N, classes) como tensor do PyTorch. Assim o mesmo código de avaliação
+# (myutils.test) e de serving (front-end.py) roda em PyTorch eager ou no ONNX Runtime.
+# Os grafos .onnx são gerados por model_conversion.py.
+#
+# Este módulo não importa config/myutils para poder ser usado fora de model_choosing/.
+
+
+class TorchBackend:
+    """
+    Modelo do PyTorch em modo eval. Modelos do transformers (ViT) têm os logits extraídos.
+    """
+    name = "pytorch"
+
+    def __init__(self, model, device="cpu"):
+        self.device = torch.device(device)
+        self.model = model.to(self.device).eval()
+
+    def eval(self):
+        return self
+
+    def __call__(self, images):
+        with torch.no_grad():
+            outputs = self.model(images.to(self.device))
+        return outputs.logits if hasattr(outputs, "logits") else outputs
+
+
+class TorchScriptBackend(TorchBackend):
+    """
+    Modelo TorchScript salvo em disco (ex.: o INT8 de quantize.py), carregado sem o
+    código da arquitetura. O engine de quantização gravado no arquivo é reativado.
+    """
+    name = "torchscript"
+
+    def __init__(self, path, device="cpu"):
+        extra_files = {"quantized_engine": ""}
+        model = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+        engine = extra_files["quantized_engine"]
+        engine = engine.decode() if isinstance(engine, bytes) else engine
+        if engine:
+            torch.backends.quantized.engine = engine
+        super().__init__(model, device)
+
+
+class OnnxRuntimeBackend:
+    """
+    Sessão do ONNX Runtime sobre um .onnx com o lote dinâmico. 'intra_op_threads=None'
+    deixa o ONNX Runtime decidir; o grafo já otimizado offline dispensa reotimização.
+    """
+    name = "onnxruntime"
+
+    def __init__(self, onnx_path, providers=None, intra_op_threads=None):
+        import onnxruntime as ort  # Dependência opcional, só necessária para este backend
+
+        options = ort.SessionOptions()
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.onnx_path = onnx_path
+        self.session = ort.InferenceSession(onnx_path, options, providers=providers or ["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def eval(self):
+        return self
+
+    def __call__(self, images):
+        batch = np.ascontiguousarray(images.detach().float().cpu().numpy())
+        logits = self.session.run(None, {self.input_name: batch})[0]
+        return torch.from_numpy(logits).to(images.device)
+
+
+def top2_margin(probabilities):
+    """
+    Diferença entre as duas maiores probabilidades de cada linha (confiança do top-1).
+    """
+    top2 = probabilities.topk(2, dim=1).values
+    return top2[:, 0] - top2[:, 1]
+
+
+class CascadeBackend:
+    """
+    Roda o backend rápido em todo o lote e repassa ao preciso só as imagens com margem
+    top-1 (softmax) abaixo de 'threshold'. Devolve logits: os do preciso nas imagens
+    escaladas, os do rápido nas demais. O limiar sai de model_choosing/cascade.py.
+    """
+    name = "cascade"
+
+    def __init__(self, fast, accurate, threshold):
+        self.fast = fast
+        self.accurate = accurate
+        self.threshold = threshold
+        self.images = 0
+        self.escalated = 0
+
+    def eval(self):
+        return self
+
+    def __call__(self, images):
+        logits = self.fast(images).float()
+        escalate = top2_margin(torch.softmax(logits, dim=1)) < self.threshold
+        if escalate.any():
+            logits = logits.clone()
+            logits[escalate] = self.accurate(images[escalate.to(images.device)]).float().to(logits.device)
+        self.images += len(images)
+        self.escalated += int(escalate.sum())
+        return logits
+
+    def escalation_rate(self):
+        return self.escalated / self.images if self.images else 0.0
+
+
+def load_backend(kind, model=None, onnx_path=None, device="cpu"):
+    """
+    kind: "pytorch" (usa 'model') ou "onnxruntime" (usa 'onnx_path').
+    """
+    if kind == "pytorch":
+        return TorchBackend(model, device)
+    if kind == "onnxruntime":
+        if onnx_path is None or not os.path.exists(onnx_path):
+            raise FileNotFoundError(f"Grafo ONNX não encontrado: {onnx_path} (gere com model_conversion.py)")
+        return OnnxRuntimeBackend(onnx_path)
+    raise ValueError(f"Backend desconhecido: {kind}")
+
+
+def load_artifact(path, device="cpu"):
+    """
+    Backend a partir de um artefato exportado: .onnx no ONNX Runtime, .pt como TorchScript.
+    """
+    if path.endswith(".onnx"):
+        return OnnxRuntimeBackend(path)
+    return TorchScriptBackend(path, device)
+
+
+def measure_latency(backend, batch_size, resolution=224, warmup=3, repeats=20):
+    """
+    Latência por lote (mediana e p90, em ms) e vazão em imagens/s de um backend.
+    """
+    images = torch.randn(batch_size, 3, resolution, resolution)
+    for _ in range(warmup):
+        backend(images)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        backend(images)
+        times.append(time.perf_counter() - start)
+    times = np.array(times) * 1000
+    p50, p90 = np.percentile(times, [50, 90])
+    return {"backend": backend.name, "batch_size": batch_size, "p50_ms": p50, "p90_ms": p90,
+            "img_s": batch_size / (p50 / 1000)}
@@ -0,0 +1,175 @@
+import os
+import sys
+import time
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+from multiprocessing import get_context
+import pandas as pd
+import torch
+import config
+from eval_utils import append_results
+from model_registry import build_model
+from model_conversion import ZOO, LogitsOnly, export_onnx, optimize_onnx
+from backends import TorchBackend, OnnxRuntimeBackend, measure_latency
+from instrumentation import status_mb, reset_peak_rss
+
+# --------------------------------------------------------------------------
+# Benchmark de inferência na CPU para o zoo de modelos
+# --------------------------------------------------------------------------
+# Para cada modelo (construído por model_registry.build_model, sem baixar pesos), backend e número de
+# threads mede:
+#   - latência a frio: primeira chamada com lote 1 logo após criar o backend
+#     (inclui tracing/compilação/inicialização da sessão)
+#   - latência a quente (p50/p90) e vazão em cada tamanho de lote
+#   - pico de RSS durante a criação + medições, e o número de parâmetros
+# Cada modelo roda num processo novo, para o pico de memória não misturar modelos.
+# As linhas vão para ../results/bench_<modelo>.csv. Com um baseline salvo
+# (--update-baseline), a execução aponta regressões de latência acima de --tolerance
+# e termina com código 1.
+#
+# Ex.: python benchmark.py --models MobileNetV2 EfficientNetB0 --threads 1 4 --backends eager onnxruntime
+
+BACKENDS = ["eager", "torchscript", "compile", "onnxruntime"]
+BASELINE_KEY = ["Model", "Backend", "Threads", "Batch_Size"]
+
+
+def make_backend(kind, model, threads, resolution, workdir):
+    """
+    Cria o backend já com o número de threads aplicado. 'compile' e 'torchscript' envolvem
+    o mesmo modelo eager; 'onnxruntime' exporta e otimiza um grafo em 'workdir'.
+    """
+    torch.set_num_threads(threads)
+    if kind == "eager":
+        return TorchBackend(model)
+    if kind == "torchscript":
+        example = torch.randn(1, 3, resolution, resolution)
+        with torch.no_grad():
+            scripted = torch.jit.freeze(torch.jit.trace(LogitsOnly(model).eval(), example))
+        return TorchBackend(scripted)
+    if kind == "compile":
+        return TorchBackend(torch.compile(LogitsOnly(model)))
+    if kind == "onnxruntime":
+        name = f"model-{resolution}"
+        onnx_path = os.path.join(workdir, f"{name}.onnx")
+        if not os.path.exists(onnx_path):
+            export_onnx(model, onnx_path, resolution)
+            optimize_onnx(onnx_path, os.path.join(workdir, f"{name}.opt.onnx"))
+        return OnnxRuntimeBackend(os.path.join(workdir, f"{name}.opt.onnx"), intra_op_threads=threads)
+    raise ValueError(f"Backend desconhecido: {kind}")
+
+
+def bench_model(model_name, backends, threads_list, batch_sizes, repeats, resolution):
+    """
+    Todas as medições de um modelo (roda dentro de um processo próprio).
+    """
+    model = build_model(model_name, pretrained=False).eval()  # Pesos não mudam a latência
+    params = sum(p.numel() for p in model.parameters()) / 1e6
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for kind in backends:
+            for threads in threads_list:
+                reset_peak_rss()
+                baseline_rss = status_mb("VmRSS")
+                try:
+                    start = time.perf_counter()
+                    backend = make_backend(kind, model, threads, resolution, workdir)
+                    backend(torch.randn(1, 3, resolution, resolution))
+                    cold_ms = (time.perf_counter() - start) * 1000
+                    results = [measure_latency(backend, batch_size, resolution, repeats=repeats) for batch_size in batch_sizes]
+                except Exception as e:
+                    print(f"{model_name} | {kind} | {threads} threads: ignorado ({type(e).__name__}: {e})")
+                    continue
+                peak_rss = status_mb("VmHWM") - baseline_rss
+                for batch_size, result in zip(batch_sizes, results):
+                    rows.append({
+                        "Model": model_name,
+                        "Backend": kind,
+                        "Threads": threads,
+                        "Batch_Size": batch_size,
+                        "Cold_ms": cold_ms,
+                        "Latency_p50_ms": result["p50_ms"],
+                        "Latency_p90_ms": result["p90_ms"],
+                        "Throughput_img_s": result["img_s"],
+                        "Peak_RSS_MB": peak_rss,
+                        "Params_M": params,
+                        "Resolution": resolution,
+                        "Torch": torch.__version__,
+                        "Host": platform.node(),
+                        "Date": datetime.now().isoformat(timespec="seconds"),
+                    })
+                    print(f"{model_name:>14} | {kind:>11} | {threads:>2} thr | lote {batch_size:>3} | "
+                          f"p50 {result['p50_ms']:8.2f} ms | {result['img_s']:8.1f} img/s | "
+                          f"frio {cold_ms:8.1f} ms | pico {peak_rss:7.1f} MB")
+    return rows
+
+
+def check_regressions(rows, baseline_path, tolerance):
+    """
+    Compara o p50 de cada linha com o baseline da mesma chave (modelo, backend, threads, lote).
+    """
+    if not os.path.exists(baseline_path):
+        print(f"Sem baseline em {baseline_path} (crie com --update-baseline)")
+        return []
+    baseline = pd.read_csv(baseline_path).set_index(BASELINE_KEY)["Latency_p50_ms"]
+    regressions = []
+    for row in rows:
+        key = tuple(row[k] for k in BASELINE_KEY)
+        if key in baseline.index and row["Latency_p50_ms"] > baseline[key] * (1 + tolerance):
+            regressions.append((key, baseline[key], row["Latency_p50_ms"]))
+    for key, before, now in regressions:
+        print(f"REGRESSÃO {key}: {before:.2f} ms -> {now:.2f} ms ({now / before - 1:+.0%})")
+    return regressions
+
+
+def update_baseline(rows, baseline_path):
+    current = pd.DataFrame(rows)[BASELINE_KEY + ["Latency_p50_ms", "Throughput_img_s", "Host", "Date"]]
+    if os.path.exists(baseline_path):
+        previous = pd.read_csv(baseline_path)
+        current = pd.concat([previous, current]).drop_duplicates(BASELINE_KEY, keep="last")
+    current.to_csv(baseline_path, index=False)
+    print(f"Baseline atualizado em {baseline_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de inferência na CPU dos modelos do zoo")
+    parser.add_argument("--models", nargs="+", default=ZOO, choices=ZOO)
+    parser.add_argument("--backends", nargs="+", default=["eager", "torchscript", "onnxruntime"], choices=BACKENDS)
+    parser.add_argument("--threads", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--resolution", type=int, default=config.RESOLUTION)
+    parser.add_argument("--baseline", default="../results/bench_baseline.csv")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Aumento de p50 aceito antes de apontar regressão")
+    parser.add_argument("--update-baseline", action="store_true", help="Grava esta execução como o novo baseline")
+    args = parser.parse_args()
+
+    backends = list(args.backends)
+    if "onnxruntime" in backends:
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            print("onnxruntime não instalado, backend ignorado")
+            backends.remove("onnxruntime")
+
+    os.makedirs("../results", exist_ok=True)
+    all_rows = []
+    ctx = get_context("spawn")
+    for model_name in args.models:
+        with ctx.Pool(1) as pool:
+            rows = pool.apply(bench_model, (model_name, backends, args.threads, args.batch_sizes, args.repeats, args.resolution))
+        for row in rows:
+            append_results(row, f"../results/bench_{model_name}.csv")
+        all_rows += rows
+
+    if not all_rows:
+        return
+    if args.update_baseline:
+        update_baseline(all_rows, args.baseline)
+    elif check_regressions(all_rows, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import os
+import json
+import argparse
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import torch
+from torchvision import datasets
+import config
+from eval_utils import build_transform, build_loader
+from model_registry import load_model
+from loader_factory import tune, make_loader
+from predictions import store_path, load_predictions, probabilities, checkpoint_hash
+from backends import TorchBackend, measure_latency
+from myutils import test
+
+# --------------------------------------------------------------------------
+# Limiar da cascata MobileNetV2 -> EfficientNetB0 (backends.CascadeBackend)
+# --------------------------------------------------------------------------
+# A cascata roda o modelo rápido em toda imagem e escala para o preciso quando a margem
+# top-1 (p1 - p2 do softmax do rápido) fica abaixo do limiar. Este script:
+#   1. roda os dois modelos uma vez na validação, guardando as predições por amostra
+#      (predictions.py, tag "val"; execuções seguintes reaproveitam o arquivo)
+#   2. mede a latência de cada modelo na CPU com lote 1 (como no front-end)
+#   3. varre os limiares: taxa de escalonamento, acurácia e latência média esperada
+#      (rápido + taxa x preciso), sem rodar os modelos de novo
+# Por padrão os modelos são os checkpoints servidos pelo front-end (config.SERVING_CHECKPOINT),
+# os mesmos que a cascata vai usar. A tabela vai para ../results/cascade_<rápido>-<preciso>.csv
+# e o limiar sugerido (o de menor latência com acurácia a no máximo --max-drop da do modelo
+# preciso) é gravado em config.CASCADE_CALIBRATION junto com o hash de cada checkpoint; o
+# front-end só usa o limiar se os checkpoints servidos tiverem esses hashes.
+#
+# Ex.: python cascade.py --max-drop 0.005
+
+
+def val_predictions(model_name, checkpoint_path, resolution=config.RESOLUTION):
+    """
+    Predições do modelo na validação, do cache em disco ou rodando o teste uma vez.
+    """
+    path = store_path(model_name, checkpoint_path, tag="val")
+    if not os.path.exists(path):
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        dataset = datasets.ImageFolder(config.DATA_DIR_VAL, transform=build_transform(resolution, uint8=config.UINT8_BATCHES),
+                                       loader=build_loader(resolution))
+        settings = tune(dataset, config.BATCH_SIZE)
+        loader = make_loader(dataset, config.BATCH_SIZE, settings["num_workers"], settings["prefetch_factor"])
+        test(load_model(model_name, checkpoint_path, device), loader, model_name, device, precision=config.PRECISION,
+             predictions_path=path)
+    return load_predictions(path)
+
+
+def sweep(fast_store, accurate_store, fast_ms, accurate_ms, thresholds):
+    """
+    Uma linha por limiar, calculada só a partir das predições salvas.
+    """
+    if not np.array_equal(fast_store["labels"], accurate_store["labels"]):
+        raise ValueError("As predições dos dois modelos não são do mesmo conjunto/ordem de imagens")
+    labels = fast_store["labels"]
+    fast_probs = probabilities(fast_store)
+    top2 = np.sort(fast_probs, axis=1)[:, -2:]
+    margin = top2[:, 1] - top2[:, 0]
+    fast_correct = fast_probs.argmax(axis=1) == labels
+    accurate_correct = accurate_store["logits"].argmax(axis=1) == labels
+
+    rows = []
+    for threshold in thresholds:
+        escalate = margin < threshold
+        rate = escalate.mean()
+        latency = fast_ms + rate * accurate_ms
+        rows.append({
+            "Threshold": threshold,
+            "Escalation_Rate": rate,
+            "Accuracy": np.where(escalate, accurate_correct, fast_correct).mean(),
+            "Expected_Latency_ms": latency,
+            "Speedup_vs_Accurate": accurate_ms / latency,
+        })
+    return pd.DataFrame(rows)
+
+
+def save_calibration(path, threshold, checkpoints, **details):
+    """
+    Grava o limiar com o hash dos checkpoints sobre os quais ele foi calibrado.
+    """
+    calibration = {
+        "threshold": threshold,
+        "models": list(checkpoints),
+        "checkpoints": {name: checkpoint_hash(checkpoint_path) for name, checkpoint_path in checkpoints.items()},
+        "date": datetime.now().isoformat(timespec="seconds"),
+        **details,
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(calibration, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Varre o limiar de margem da cascata rápido -> preciso na validação")
+    parser.add_argument("--fast", default="MobileNetV2")
+    parser.add_argument("--accurate", default="EfficientNetB0")
+    parser.add_argument("--fast-checkpoint", help="Padrão: o checkpoint servido pelo front-end (config.SERVING_CHECKPOINT)")
+    parser.add_argument("--accurate-checkpoint", help="Padrão: o checkpoint servido pelo front-end (config.SERVING_CHECKPOINT)")
+    parser.add_argument("--calibration", default=config.CASCADE_CALIBRATION, help="Onde gravar o limiar sugerido")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=np.round(np.linspace(0, 1, 21), 2).tolist())
+    parser.add_argument("--max-drop", type=float, default=0.005, help="Perda de acurácia aceita em relação ao modelo preciso")
+    parser.add_argument("--resolution", type=int, default=config.RESOLUTION)
+    args = parser.parse_args()
+
+    checkpoints, stores, latencies = {}, {}, {}
+    for model_name, checkpoint_path in ((args.fast, args.fast_checkpoint), (args.accurate, args.accurate_checkpoint)):
+        checkpoints[model_name] = checkpoint_path or config.SERVING_CHECKPOINT.format(model=model_name)
+        stores[model_name] = val_predictions(model_name, checkpoints[model_name], args.resolution)
+        backend = TorchBackend(load_model(model_name, checkpoints[model_name]), "cpu")
+        latencies[model_name] = measure_latency(backend, 1, args.resolution)["p50_ms"]
+        print(f"{model_name}: {latencies[model_name]:.2f} ms por imagem (CPU, lote 1)")
+
+    table = sweep(stores[args.fast], stores[args.accurate], latencies[args.fast], latencies[args.accurate], args.thresholds)
+    fast_acc, accurate_acc = [(stores[name]["logits"].argmax(axis=1) == stores[name]["labels"]).mean()
+                              for name in (args.fast, args.accurate)]
+    print(f"\nAcurácia na validação: {args.fast} {fast_acc:.4f} | {args.accurate} {accurate_acc:.4f}")
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+
+    csv_path = f"../results/cascade_{args.fast}-{args.accurate}.csv"
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    table.to_csv(csv_path, index=False)
+    print(f"Tabela salva em {csv_path}")
+
+    eligible = table[table["Accuracy"] >= accurate_acc - args.max_drop]
+    if eligible.empty:
+        print(f"Nenhum limiar fica a {args.max_drop:.3f} da acurácia de {args.accurate}")
+        return
+    best = eligible.sort_values(["Expected_Latency_ms", "Threshold"]).iloc[0]
+    print(f"\nLimiar sugerido: {best['Threshold']:.2f} -> acurácia {best['Accuracy']:.4f}, "
+          f"{best['Escalation_Rate']:.0%} escaladas, {best['Expected_Latency_ms']:.2f} ms em média "
+          f"({best['Speedup_vs_Accurate']:.2f}x mais rápido que {args.accurate})")
+    save_calibration(args.calibration, float(best["Threshold"]), checkpoints, accuracy=float(best["Accuracy"]),
+                     escalation_rate=float(best["Escalation_Rate"]), max_drop=args.max_drop)
+    print(f"Limiar gravado em {args.calibration}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import os
+import re
+import glob
+import queue
+import random
+import threading
+import numpy as np
+import torch
+
+# --------------------------------------------------------------------------
+# Checkpoints completos e assíncronos do treino
+# --------------------------------------------------------------------------
+# O estado (modelo, otimizador, scheduler, GradScaler, época, paciência e RNGs) é
+# copiado para a CPU na thread do treino e gravado em disco por uma thread de fundo.
+# Cada arquivo é escrito num .tmp e renomeado, então um crash nunca deixa um
+# checkpoint pela metade. Ficam os últimos 'keep_last' checkpoints mais o melhor
+# (keep_last=None guarda todos; o mínimo é 1, que o --resume precisa).
+
+_EPOCH_PATTERN = re.compile(r"epoch(\d+)\.pt$")
+
+
+def _snapshot(obj):
+    """
+    Cópia recursiva com todos os tensores clonados na CPU, para que o treino possa
+    continuar alterando os originais enquanto a gravação acontece.
+    """
+    if torch.is_tensor(obj):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: _snapshot(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_snapshot(v) for v in obj)
+    return obj
+
+
+def _atomic_save(obj, path):
+    tmp_path = f"{path}.tmp"
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def capture_rng_state():
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state):
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+def epoch_checkpoints(checkpoint_dir):
+    """
+    Checkpoints de época existentes, do mais antigo para o mais recente.
+    """
+    paths = glob.glob(os.path.join(checkpoint_dir, "epoch*.pt"))
+    return sorted(paths, key=lambda p: int(_EPOCH_PATTERN.search(p).group(1)))
+
+
+def latest_checkpoint(checkpoint_dir):
+    paths = epoch_checkpoints(checkpoint_dir)
+    return paths[-1] if paths else None
+
+
+def load_checkpoint(path, device="cpu"):
+    # O checkpoint guarda estados de RNG e objetos do otimizador, não só tensores
+    return torch.load(path, map_location=device, weights_only=False)
+
+
+class AsyncCheckpointer:
+    """
+    Grava checkpoints numa thread de fundo. save() retorna assim que o snapshot
+    em CPU está pronto; wait() bloqueia até todas as gravações terminarem.
+    """
+
+    def __init__(self, checkpoint_dir, keep_last=3):
+        if keep_last is not None and keep_last < 1:
+            raise ValueError(f"keep_last deve ser >= 1 (ou None para guardar todos), recebido {keep_last}")
+        self.checkpoint_dir = checkpoint_dir
+        self.keep_last = keep_last
+        self.errors = []
+        self._queue = queue.Queue()
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                obj, path, prune = item
+                _atomic_save(obj, path)
+                if prune:
+                    self._prune()
+            except Exception as e:  # Não derruba o treino; o erro é relatado em wait()
+                self.errors.append(e)
+            finally:
+                self._queue.task_done()
+
+    def _prune(self):
+        if self.keep_last is None:
+            return
+        for path in epoch_checkpoints(self.checkpoint_dir)[:-self.keep_last]:
+            os.remove(path)
+
+    def submit(self, obj, path):
+        """
+        Grava um objeto qualquer (ex.: state_dict do modelo) de forma atômica em segundo plano.
+        """
+        self._queue.put((_snapshot(obj), path, False))
+
+    def save(self, state, epoch, is_best=False):
+        """
+        Salva o estado completo da época e, se for o melhor até agora, também best.pt.
+        """
+        snapshot = _snapshot(state)
+        self._queue.put((snapshot, os.path.join(self.checkpoint_dir, f"epoch{epoch:04d}.pt"), True))
+        if is_best:
+            self._queue.put((snapshot, os.path.join(self.checkpoint_dir, "best.pt"), False))
+
+    def wait(self):
+        self._queue.join()
+        if self.errors:
+            raise RuntimeError(f"Falha ao gravar checkpoint: {self.errors[0]}")
+
+    def close(self):
+        self.wait()
+        self._queue.put(None)
+        self._thread.join()
@@ -6,6 +6,14 @@ DATA_DIR_TRAIN = "../images-final/train"
 DATA_DIR_VAL = "../images-final/val"
 DATA_DIRS_ROOT = ["ufa"]
 
+# Formato dos dados de treino: "imagefolder" (JPEGs decodificados a cada época),
+# "cache" (uint8 pré-decodificado e memory-mapped, ver tensor_cache.py)
+# ou "shards" (.tar sequenciais de data_spliting.py --format shards, ver shard_dataset.py)
+DATA_FORMAT = "imagefolder"
+CACHE_DIR = "../images-cache"
+SHARDS_DIR = "../images-shards"
+SHUFFLE_BUFFER = 1000
+
 RANDOM_SEED = 42
 BATCH_SIZE = 32
 P = 0.35
@@ -18,3 +26,75 @@ MODEL_NAME = "EfficientNetB0"
 #MODEL_NAME = "ConvNext-Nano"
 #MODEL_NAME = "ViTB16"
 RESOLUTION = 224
+NUM_UNFROZEN = 5  # Partes finais de model.features treinadas (MobileNetV2/EfficientNetB0)
+
+# Precisão do treino/teste: "auto" (fp16 + GradScaler na CUDA, bfloat16 na CPU), "fp16", "bf16" ou "fp32"
+PRECISION = "auto"
+CHANNELS_LAST = False
+COMPILE_MODEL = False  # torch.compile do modelo antes do treino
+
+# Checkpoints completos em <save_dir>/checkpoints/: mantém os últimos N + o melhor
+KEEP_LAST_CHECKPOINTS = 3  # None guarda todos
+RESUME = False  # Também pode ser ligado com: python general_test.py --resume
+
+# Treino data-parallel com torch.distributed (gloo), ver distributed.py
+DISTRIBUTED = False
+DISTRIBUTED_WORKERS = 4  # Processos locais (ignorado quando lançado pelo torchrun)
+
+# Treina só a parte não congelada a partir de ativações pré-computadas (ver feature_cache.py)
+FEATURE_CACHE = False
+FEATURE_CACHE_DIR = "../features-cache"
+FEATURE_CACHE_FP16 = True
+# A ViTB16 é treinada inteira; com o cache ela treinaria só a cabeça (outro experimento,
+# marcado no CSV de resultados), então precisa desta opção
+FEATURE_CACHE_HEAD_ONLY = False
+
+# Backend usado no teste final: "pytorch" ou "onnxruntime" (exporta o melhor checkpoint
+# para ONNX_DIR e avalia o grafo otimizado, ver model_conversion.py e backends.py)
+INFERENCE_BACKEND = "pytorch"
+ONNX_DIR = "../onnx-models"
+ONNX_OPSET = 17
+
+# Quantização estática INT8 pós-treino (ver quantize.py)
+QUANTIZED_DIR = "../quantized-models"
+QUANTIZED_ENGINE = "x86"  # "qnnpack" para CPUs ARM
+CALIBRATION_SAMPLES = 512
+
+# Destilação de conhecimento (ver distillation.py)
+DISTILL_TEACHER = "EfficientNetB0"
+DISTILL_WIDTH_MULT = 1.0  # Largura da MobileNetV2 aluna (< 1.0 treina do zero)
+DISTILL_ALPHA = 0.7  # Peso da KL com o professor; 1 - alpha fica com a CE dos rótulos
+DISTILL_TEMPERATURE = 4.0
+DISTILL_CACHE_DIR = "../features-cache/teacher-logits"
+
+# Decodifica os JPEGs já perto de RESOLUTION (modo draft, ver preprocessing.py) nos ImageFolder
+DRAFT_DECODE = True
+
+# Logits/rótulos/caminhos de cada amostra do teste, por hash do checkpoint (ver predictions.py)
+PREDICTIONS_DIR = "../results/predictions"
+
+# Checkpoints servidos pelo front-end; cascade.py calibra o limiar da cascata sobre eles
+# e grava o limiar com o hash de cada checkpoint em CASCADE_CALIBRATION
+SERVING_CHECKPOINT = "../frontend/streamlit/best{model}-more-images-5unfrozen_100.pth"
+CASCADE_CALIBRATION = "../frontend/streamlit/cascade_threshold.json"
+
+# Classificação de vídeos inteiros (ver video_inference.py)
+VIDEO_EVERY_SECONDS = 0.5  # Um frame amostrado a cada N segundos
+VIDEO_BATCH_SIZE = 32
+VIDEO_QUEUE = 64  # Frames decodificados aguardando o modelo
+VIDEO_SEGMENT_SECONDS = 10
+VIDEO_SMOOTHING = 0.8  # Peso do histórico na média móvel exponencial das probabilidades
+VIDEO_STOP_CONFIDENCE = 0.95  # Para de ler o vídeo quando a confiança do clipe passa disso
+VIDEO_MIN_FRAMES = 32
+
+# Tempo por fase do treino/teste em <save_dir>/<modelo>_metrics.csv (ver instrumentation.py).
+# PROFILE_STEPS = (10, 15) grava um trace do torch.profiler desses passos de treino em <save_dir>/profile/
+PROFILE_STEPS = None
+
+# Workers/prefetch do DataLoader medidos por máquina e dataset (ver loader_factory.py)
+LOADER_TUNING_CACHE = "../results/loader_tuning.json"
+LOADER_TUNING_BATCHES = 20  # Lotes medidos por combinação candidata
+
+# Workers do DataLoader devolvem uint8 e a conversão + Normalize rodam uma vez por lote no
+# device (ver preprocessing.batch_collate e myutils.normalize_batch)
+UINT8_BATCHES = True
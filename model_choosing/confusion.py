@@ -2,75 +2,37 @@ import torch
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.metrics import confusion_matrix
 import os
-from torchvision import datasets, transforms
-import torchvision.models as models
+from torchvision import datasets
 import config 
-import torch.nn as nn
-import timm
-from torch.utils.data import DataLoader 
+from loader_factory import tune, make_loader
+from myutils import test
+from tensor_cache import cached_dataset
+from preprocessing import preview_image
+from eval_utils import build_transform, build_loader
+from model_registry import load_model
+from predictions import store_path, load_predictions, confusion_matrix, classification_report, calibration_curve, worst_mistakes
 
 # --------------------------------------------------------------------------
 # PARÂMETROS NECESSÁRIOS (Ajuste conforme o seu setup)
 # --------------------------------------------------------------------------
-# O objeto 'model' deve ser a instância do seu modelo (ResNet, ViT)
-# O objeto 'test_loader' deve ser o DataLoader com seus dados de teste
-# O objeto 'device' deve ser 'cuda' ou 'cpu'
-# Você precisará da lista de nomes das classes (animes)
+# As análises leem as predições por amostra salvas pelo teste (predictions.py), em
+# ../results/predictions/<modelo>-<hash do checkpoint>.npz. Só quando esse arquivo
+# ainda não existe o checkpoint é carregado e o teste roda (e grava o arquivo).
 # --------------------------------------------------------------------------
 
-def get_class_names(test_loader):
+def plot_confusion_matrix(store, model_name):
     """
-    Tenta obter os nomes das classes (animes) do dataset de teste.
-    Isso funciona se o dataset subjacente for uma ImageFolder.
+    Plota a Matriz de Confusão a partir das predições salvas (predictions.py).
     """
-    if isinstance(test_loader.dataset, torch.utils.data.Subset):
-        # Se for um subset (como após o random_split), acessa o dataset original
-        return test_loader.dataset.dataset.classes
-    elif isinstance(test_loader.dataset, datasets.ImageFolder):
-        return test_loader.dataset.classes
-    else:
-        # Retorna nomes genéricos se não conseguir identificar a classe exata
-        return [f'Classe {i}' for i in range(len(np.unique(test_loader.dataset.targets)))]
-
-
-def plot_confusion_matrix(model, test_loader, device, model_name):
-    """
-    Roda o modelo no conjunto de teste e plota a Matriz de Confusão.
-    """
-    all_preds = []
-    all_labels = []
-    
-    # 1. Coleta de Predições
-    model.eval()
-    cond1 = ('vit' in model_name.lower())
+    # 1. Matriz a partir dos logits salvos (sem rodar o modelo)
+    cm = confusion_matrix(store)
+    class_names = store["classes"]
     
-    with torch.no_grad():
-        for images, labels in test_loader:
-            images, labels = images.to(device), labels.to(device)
-            
-            # Execução do modelo (usando a lógica condicional do seu código)
-            with torch.amp.autocast('cuda'):
-                outputs = model(images)
-                if cond1:
-                    logits = outputs.logits
-                else:
-                    logits = outputs
-                    
-                preds = torch.argmax(logits, dim=1)
-                
-                all_preds.extend(preds.cpu().numpy())
-                all_labels.extend(labels.cpu().numpy())
-    
-    # 2. Geração da Matriz
-    cm = confusion_matrix(all_labels, all_preds)
-    class_names = get_class_names(test_loader)
-    
-    # 3. Normalização (Visualiza as taxas de erro em %)
+    # 2. Normalização (Visualiza as taxas de erro em %)
     cm_normalized = cm.astype('float') / cm.sum(axis=1)[:, np.newaxis]
     
-    # 4. Plotagem
+    # 3. Plotagem
     plt.figure(figsize=(8, 6))
     sns.heatmap(
         cm_normalized, 
@@ -91,6 +53,53 @@ def plot_confusion_matrix(model, test_loader, device, model_name):
     plt.show()
 
 
+def print_classification_report(store):
+    report = classification_report(store)
+    print(f"{'classe':>24} {'precisão':>9} {'recall':>7} {'f1':>7} {'suporte':>8}")
+    for key, row in report.items():
+        if key == "accuracy":
+            continue
+        name = store["classes"][int(key)] if key.isdigit() else key
+        print(f"{name:>24} {row['precision']:>9.4f} {row['recall']:>7.4f} {row['f1-score']:>7.4f} {row['support']:>8}")
+    print(f"{'acurácia':>24} {report['accuracy']:>9.4f}")
+
+
+def plot_calibration(store, model_name, num_bins=15):
+    confidence, accuracy, counts, ece = calibration_curve(store, num_bins)
+    filled = counts > 0
+    plt.figure(figsize=(6, 6))
+    plt.plot([0, 1], [0, 1], "--", color="gray")
+    plt.plot(confidence[filled], accuracy[filled], "o-")
+    plt.title(f'Calibração - {model_name} (ECE {ece:.3f})')
+    plt.xlabel('Confiança média')
+    plt.ylabel('Acurácia')
+    output_filename = f"calibration_{model_name}.png"
+    plt.savefig(output_filename)
+    print(f"✅ Curva de calibração salva como: {output_filename}")
+
+
+def plot_worst_mistakes(store, model_name, k=16):
+    """
+    Galeria dos erros mais confiantes; só essas 'k' imagens são decodificadas (em miniatura).
+    """
+    mistakes = [m for m in worst_mistakes(store, k) if m[0]]
+    if not mistakes:
+        print("Sem erros (ou sem caminhos salvos) para a galeria")
+        return
+    cols = 4
+    rows = (len(mistakes) + cols - 1) // cols
+    plt.figure(figsize=(3 * cols, 3 * rows))
+    for i, (path, true_name, pred_name, confidence) in enumerate(mistakes):
+        plt.subplot(rows, cols, i + 1)
+        plt.imshow(preview_image(path, max_side=256))
+        plt.title(f"{true_name} -> {pred_name}\n{confidence:.2f}", fontsize=8)
+        plt.axis("off")
+    plt.tight_layout()
+    output_filename = f"worst_mistakes_{model_name}.png"
+    plt.savefig(output_filename)
+    print(f"✅ Piores erros salvos como: {output_filename}")
+
+
 # --------------------------------------------------------------------------
 # EXEMPLO DE CHAMADA (INTEGRAÇÃO NO SEU SCRIPT PRINCIPAL)
 # --------------------------------------------------------------------------
@@ -100,59 +109,45 @@ save_model_name = f"best{model_name}"
 num_epochs = config.NUM_EPOCHS
 
 
-model = models.efficientnet_b0(weights='DEFAULT')
-
-num_features = model.classifier[1].in_features 
-
-model.classifier = nn.Sequential(
-     nn.Dropout(p=0.2, inplace=True), # Recomendado colocar de volta
-     nn.Linear(num_features, 3)
-     )
-         
 save_dir = f"../best_model/{model_name}/"
 save_model_name = f"best{model_name}-more-images-5unfrozen"
 checkpoint_filename = f"{save_model_name}_{num_epochs}.pth"
 checkpoint_path = os.path.join(save_dir, checkpoint_filename)
     
-# Carrega o modelo com o melhor desempenho de VALIDAÇÃO (o modelo salvo)
-print(f"\nCarregando o melhor checkpoint: {checkpoint_path}")
-checkpoint = torch.load(checkpoint_path)
-model.load_state_dict(checkpoint)
-
-# ----------------------------------------------------------------------
-# 2. TESTE FINAL (No modelo ideal)
-# ----------------------------------------------------------------------
-
-#loss, acc, prec, rec, f1 = test(model, test_loader, model_name, device)
-transform = transforms.Compose([
-transforms.Resize((224, 224)), 
-transforms.ToTensor(), 
-transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])])
-
-#print(f'Melhor acurácia de treinamento: {best_train_acc} atingida com {best_epoch} épocas')
-test_dataset = datasets.ImageFolder(
-        root = config.DATA_DIR_TEST, # Ex: 'animes_test/'
-        transform=transform
-)
-
+predictions_path = store_path(model_name, checkpoint_path)
+if not os.path.exists(predictions_path):
+    print(f"\nSem predições salvas para {checkpoint_path}, rodando o teste...")
+    # Modo uint8: a normalização roda por lote dentro do test (myutils.prepare_batch)
+    transform = build_transform(224, uint8=config.UINT8_BATCHES)
+
+    if config.DATA_FORMAT == "cache":
+        test_dataset = cached_dataset(config.DATA_DIR_TEST, resolution=224)
+    else:
+        test_dataset = datasets.ImageFolder(
+                root = config.DATA_DIR_TEST, # Ex: 'animes_test/'
+                transform=transform,
+                loader=build_loader(224)
+        )
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    # Carrega o modelo com o melhor desempenho de VALIDAÇÃO (o modelo salvo)
+    model = load_model(model_name, checkpoint_path, device)
+    settings = tune(test_dataset, config.BATCH_SIZE)
+    test_loader = make_loader(test_dataset, config.BATCH_SIZE, settings["num_workers"], settings["prefetch_factor"])
+    test(model, test_loader, model_name, device, precision=config.PRECISION, predictions_path=predictions_path)
+
+store = load_predictions(predictions_path)
 print("\n" + "="*40)
-print(f"📂 Total de imagens de teste: {len(test_dataset)}")
-print(f"🏷️  Classes encontradas (Ordem do Modelo): {test_dataset.classes}")
-print(f"🔢 Mapeamento (Nome -> Índice): {test_dataset.class_to_idx}")
+print(f"📂 Total de imagens de teste: {len(store['labels'])}")
+print(f"🏷️  Classes encontradas (Ordem do Modelo): {store['classes']}")
+print(f"💾 Predições: {predictions_path}")
 print("="*40 + "\n")
 
-
-
-# ----------------------------------------------------------------------
-# 3. GERAÇÃO DA MATRIZ DE CONFUSÃO (Análise de Erros)
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model = model.float() 
-model = model.to(device)
-# ----------------------------------------------------------------------
-test_loader = DataLoader(test_dataset, batch_size = config.BATCH_SIZE, shuffle=False, num_workers=8, pin_memory=True)
-
+print_classification_report(store)
 try:
-    plot_confusion_matrix(model, test_loader, device, model_name)
+    plot_confusion_matrix(store, model_name)
+    plot_calibration(store, model_name)
+    plot_worst_mistakes(store, model_name)
 except Exception as e:
-    print(f"Não foi possível gerar a Matriz de Confusão. Erro: {e}")
-    print("Verifique se as bibliotecas matplotlib e seaborn estão instaladas.")
\ No newline at end of file
+    print(f"Não foi possível gerar os gráficos. Erro: {e}")
+    print("Verifique se as bibliotecas matplotlib e seaborn estão instaladas.")
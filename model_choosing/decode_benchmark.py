@@ -0,0 +1,103 @@
+import os
+import glob
+import time
+import argparse
+import tempfile
+import numpy as np
+from multiprocessing import get_context
+from PIL import Image
+from torchvision import transforms
+from preprocessing import open_image
+from instrumentation import status_mb, reset_peak_rss
+
+# --------------------------------------------------------------------------
+# Benchmark: decodificação completa vs decodificação reduzida (preprocessing.py)
+# --------------------------------------------------------------------------
+# Mede, para cada modo, o tempo de decodificar + aplicar o transform de 224x224 e o pico
+# de memória (VmHWM, Linux). Cada modo roda num processo novo, então o pico não é
+# contaminado pelo outro modo. Sem --images, gera frames sintéticos em 4K e 8K (JPEG e PNG).
+#
+# Ex.: python decode_benchmark.py --images "../images-final/test/*/*.jpg" --limit 500
+
+Image.MAX_IMAGE_PIXELS = 100000000
+TRANSFORM = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])])
+
+
+def _full_decode(path):
+    return TRANSFORM(Image.open(path).convert("RGB"))
+
+
+def _draft_decode(path):
+    return TRANSFORM(open_image(path, (224, 224)))
+
+
+MODES = {"completa": _full_decode, "reduzida": _draft_decode}
+
+
+def _run_mode(mode, paths, repeats):
+    decode = MODES[mode]
+    TRANSFORM(Image.new("RGB", (256, 256)))  # Aquecimento do torch sem tocar nas imagens medidas
+    reset_peak_rss()
+    baseline = status_mb("VmRSS")
+    times = []
+    for _ in range(repeats):
+        for path in paths:
+            start = time.perf_counter()
+            decode(path)
+            times.append(time.perf_counter() - start)
+    return np.array(times) * 1000, status_mb("VmHWM") - baseline
+
+
+def synthetic_images(output_dir):
+    """
+    Frames com gradiente + ruído (comprimem como uma cena real, não como uma cor lisa).
+    """
+    paths = []
+    rng = np.random.default_rng(0)
+    for name, (width, height) in (("4k", (3840, 2160)), ("8k", (7680, 4320))):
+        x = np.linspace(0, 255, width, dtype=np.float32)
+        y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+        base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+        pixels = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+        for ext in ("jpg", "png"):
+            path = os.path.join(output_dir, f"{name}.{ext}")
+            Image.fromarray(pixels).save(path, quality=90) if ext == "jpg" else Image.fromarray(pixels).save(path)
+            paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo e memória da decodificação completa vs reduzida")
+    parser.add_argument("--images", help="Glob de imagens; sem ele usa frames sintéticos 4K/8K")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = sorted(glob.glob(args.images, recursive=True))[:args.limit] if args.images else synthetic_images(tmp)
+        if not paths:
+            raise SystemExit(f"Nenhuma imagem encontrada em {args.images}")
+        print(f"{len(paths)} imagens, {args.repeats} repetições")
+
+        groups = {"todas": paths}
+        if not args.images:
+            groups = {os.path.basename(p): [p] for p in paths}
+
+        ctx = get_context("spawn")
+        print(f"{'imagens':>10} {'modo':>9} {'p50 (ms)':>9} {'média (ms)':>11} {'pico (MB)':>10}")
+        for group, group_paths in groups.items():
+            results = {}
+            for mode in MODES:
+                with ctx.Pool(1) as pool:
+                    results[mode] = pool.apply(_run_mode, (mode, group_paths, args.repeats))
+            for mode, (times, peak) in results.items():
+                print(f"{group:>10} {mode:>9} {np.median(times):>9.1f} {times.mean():>11.1f} {peak:>10.1f}")
+            speedup = np.median(results["completa"][0]) / np.median(results["reduzida"][0])
+            print(f"{group:>10} {'speedup':>9} {speedup:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
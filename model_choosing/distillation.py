@@ -0,0 +1,205 @@
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torchvision.models as models
+from torch.utils.data import Dataset, DataLoader, IterableDataset
+import torch.backends.cudnn as cudnn
+import config
+from eval_utils import build_datasets, append_results
+from model_registry import build_model, best_checkpoint_path, load_model
+from feature_cache import is_deterministic
+from backends import TorchBackend, measure_latency
+from myutils import train, test, prepare_batch, get_logits
+from preprocessing import batch_collate
+
+# --------------------------------------------------------------------------
+# Destilação de conhecimento: professor grande -> aluno rápido (MobileNetV2)
+# --------------------------------------------------------------------------
+# Os logits do professor no conjunto de treino são calculados uma única vez e ficam
+# em cache (../features-cache/teacher-logits/). O aluno treina com myutils.train usando
+#   loss = alpha * T² * KL(softmax(professor/T) || softmax(aluno/T)) + (1 - alpha) * CE(aluno, rótulo)
+# e a validação continua com a CE pura, comparável à dos outros treinos.
+# No fim, professor e aluno passam pelo mesmo teste + medição de latência na CPU e a
+# comparação é adicionada em ../results/distillation.csv.
+#
+# Ex.: python distillation.py --teacher ConvNext-Nano --width-mult 0.5
+
+
+class DistillationLoss(nn.Module):
+    """
+    Mistura de CE com os rótulos e KL com temperatura contra os logits do professor.
+    Sem logits do professor (validação), devolve só a CE.
+    """
+
+    def __init__(self, alpha=config.DISTILL_ALPHA, temperature=config.DISTILL_TEMPERATURE):
+        super().__init__()
+        self.alpha = alpha
+        self.temperature = temperature
+
+    def forward(self, logits, labels, teacher_logits=None):
+        hard = F.cross_entropy(logits, labels)
+        if teacher_logits is None:
+            return hard
+        t = self.temperature
+        soft = F.kl_div(F.log_softmax(logits / t, dim=1), F.log_softmax(teacher_logits.float() / t, dim=1),
+                        reduction="batchmean", log_target=True) * t * t
+        return self.alpha * soft + (1 - self.alpha) * hard
+
+
+class TeacherLogitsDataset(Dataset):
+    """
+    Envolve o dataset de treino devolvendo (imagem, rótulo, logits do professor).
+    """
+
+    def __init__(self, dataset, teacher_logits):
+        assert len(dataset) == len(teacher_logits)
+        self.dataset = dataset
+        self.teacher_logits = teacher_logits
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, index):
+        image, label = self.dataset[index]
+        return image, label, torch.from_numpy(self.teacher_logits[index])
+
+
+def _fingerprint(checkpoint_path, dataset):
+    digest = hashlib.sha1(f"{len(dataset)}|draft={config.DRAFT_DECODE}".encode())
+    with open(checkpoint_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    for path, label in getattr(dataset, "samples", []):
+        digest.update(f"{path}|{label}\n".encode())
+    return digest.hexdigest()
+
+
+@torch.no_grad()
+def cache_teacher_logits(teacher, teacher_name, checkpoint_path, dataset, device, batch_size=config.BATCH_SIZE,
+                         num_workers=8, cache_dir=config.DISTILL_CACHE_DIR):
+    """
+    Roda o professor uma vez sobre o treino (na ordem do dataset) e guarda os logits em .npy.
+    Reaproveita o cache se o checkpoint e a lista de amostras forem os mesmos.
+    """
+    if isinstance(dataset, IterableDataset):
+        # Os logits são indexados pela posição no dataset; a ordem dos shards muda com a época,
+        # o processo e o worker do DataLoader
+        raise ValueError("A destilação precisa de um dataset indexável: use DATA_FORMAT = \"imagefolder\" ou \"cache\", "
+                         "não \"shards\"")
+    if not is_deterministic(dataset):
+        raise ValueError("O cache de logits do professor exige transformações determinísticas (sem Random*)")
+    fingerprint = _fingerprint(checkpoint_path, dataset)
+    path = os.path.join(cache_dir, f"{teacher_name}-{fingerprint[:16]}.npy")
+    if os.path.exists(path):
+        return np.load(path)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    teacher.eval()
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers, collate_fn=batch_collate)
+    logits = []
+    for images, _ in loader:
+        logits.append(get_logits(teacher(prepare_batch(images, device))).float().cpu().numpy())
+    logits = np.concatenate(logits)
+    np.save(path + ".tmp.npy", logits)
+    os.replace(path + ".tmp.npy", path)
+    with open(path + ".json", "w") as f:
+        json.dump({"teacher": teacher_name, "checkpoint": checkpoint_path, "fingerprint": fingerprint}, f)
+    return logits
+
+
+def build_student(width_mult=1.0):
+    """
+    width_mult=1.0: a MobileNetV2 pré-treinada de general_test (mesmo congelamento).
+    Menor que 1.0: MobileNetV2 estreita, sem pesos pré-treinados, toda treinável.
+    """
+    if width_mult == 1.0:
+        return build_model("MobileNetV2")
+    model = models.mobilenet_v2(weights=None, width_mult=width_mult)
+    model.classifier = nn.Sequential(nn.Dropout(p=0.2), nn.Linear(model.last_channel, 3))
+    return model
+
+
+def compare(models_by_role, test_loader, device, resolution=config.RESOLUTION):
+    """
+    Teste (acurácia/F1) e latência na CPU de cada modelo, no mesmo formato de linha.
+    """
+    rows = []
+    for role, (name, model) in models_by_role.items():
+        loss, acc, prec, rec, f1 = test(model, test_loader, name, device, precision=config.PRECISION)
+        backend = TorchBackend(model, "cpu")
+        single = measure_latency(backend, 1, resolution)
+        batched = measure_latency(backend, config.BATCH_SIZE, resolution)
+        model.to(device)
+        rows.append({
+            "Model": name,
+            "Role": role,
+            "Test_Loss": loss,
+            "Test_Acuracia": acc,
+            "Test_F1-Score": f1,
+            "Params_M": sum(p.numel() for p in model.parameters()) / 1e6,
+            "Latency_b1_ms": single["p50_ms"],
+            f"Throughput_b{config.BATCH_SIZE}_img_s": batched["img_s"],
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Destila um professor treinado numa MobileNetV2")
+    parser.add_argument("--teacher", default=config.DISTILL_TEACHER)
+    parser.add_argument("--teacher-checkpoint", help="Padrão: ../best_model/<professor>/best<professor>-more-images-<N>unfrozen_<épocas>.pth")
+    parser.add_argument("--width-mult", type=float, default=config.DISTILL_WIDTH_MULT, help="Largura da MobileNetV2 aluna")
+    parser.add_argument("--alpha", type=float, default=config.DISTILL_ALPHA, help="Peso da KL (1 - alpha fica com a CE)")
+    parser.add_argument("--temperature", type=float, default=config.DISTILL_TEMPERATURE)
+    parser.add_argument("--epochs", type=int, default=config.NUM_EPOCHS)
+    parser.add_argument("--lr", type=float, help="Padrão: 1e-5 para a MobileNetV2 pré-treinada, 1e-3 para a estreita")
+    parser.add_argument("--num-workers", type=int, default=8)
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    cudnn.benchmark = True
+    teacher_checkpoint = args.teacher_checkpoint or best_checkpoint_path(args.teacher)
+    teacher = load_model(args.teacher, teacher_checkpoint, device)
+
+    train_dataset, val_dataset, test_dataset = build_datasets(config.RESOLUTION, config.DATA_FORMAT)
+    teacher_logits = cache_teacher_logits(teacher, args.teacher, teacher_checkpoint, train_dataset, device,
+                                          num_workers=args.num_workers)
+    print(f"Logits do professor ({args.teacher}) prontos: {teacher_logits.shape}")
+
+    train_loader = DataLoader(TeacherLogitsDataset(train_dataset, teacher_logits), batch_size=config.BATCH_SIZE,
+                              shuffle=True, num_workers=args.num_workers, pin_memory=True, collate_fn=batch_collate)
+    val_loader = DataLoader(val_dataset, batch_size=config.BATCH_SIZE, shuffle=False, num_workers=args.num_workers, pin_memory=True,
+                            collate_fn=batch_collate)
+    test_loader = DataLoader(test_dataset, batch_size=config.BATCH_SIZE, shuffle=False, num_workers=args.num_workers, pin_memory=True,
+                             collate_fn=batch_collate)
+
+    # O nome contém "MobileNet" para o train escolher o otimizador da MobileNetV2
+    student_name = f"MobileNetV2-w{args.width_mult:g}-distilled-{args.teacher}"
+    save_dir = f"../best_model/{student_name}/"
+    student = build_student(args.width_mult).to(device)
+    lr = args.lr or (None if args.width_mult == 1.0 else 1e-3)
+    best_loss, best_epoch = train(student, args.epochs, train_loader, val_loader, device=device, output_dir=save_dir,
+                                  model_name=student_name, precision=config.PRECISION, channels_last=config.CHANNELS_LAST,
+                                  compile_model=config.COMPILE_MODEL, keep_last=config.KEEP_LAST_CHECKPOINTS,
+                                  criterion=DistillationLoss(args.alpha, args.temperature), lr=lr)
+    student.load_state_dict(torch.load(os.path.join(save_dir, f"{student_name}_{args.epochs}.pth"), map_location=device))
+    print(f"Melhor loss de validação do aluno: {best_loss:.4f} (época {best_epoch})")
+
+    csv_path = "../results/distillation.csv"
+    rows = compare({"teacher": (args.teacher, teacher), "student": (student_name, student)}, test_loader, device)
+    for row in rows:
+        row.update({"Alpha": args.alpha, "Temperature": args.temperature, "Epochs": args.epochs})
+        row["Delta_Acuracia"] = row["Test_Acuracia"] - rows[0]["Test_Acuracia"]
+        row["Speedup_b1"] = rows[0]["Latency_b1_ms"] / row["Latency_b1_ms"]
+        append_results(row, csv_path)
+        print(f"{row['Role']:>8} {row['Model']:<40} | acc {row['Test_Acuracia']:.4f} ({row['Delta_Acuracia']:+.4f}) | "
+              f"{row['Params_M']:6.2f}M parâmetros | {row['Latency_b1_ms']:7.2f} ms (lote 1, {row['Speedup_b1']:.2f}x)")
+    print(f"Comparação adicionada em {csv_path}")
+
+
+if __name__ == "__main__":
+    main()
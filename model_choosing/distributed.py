@@ -0,0 +1,117 @@
+import os
+import sys
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.nn.parallel import DistributedDataParallel
+
+# --------------------------------------------------------------------------
+# Treino data-parallel em CPU com torch.distributed (backend gloo)
+# --------------------------------------------------------------------------
+# Localmente, launch() abre N processos com torch.multiprocessing.spawn.
+# Entre máquinas, rode o mesmo script com torchrun (ele define RANK/WORLD_SIZE/
+# MASTER_ADDR/MASTER_PORT), por exemplo em cada nó:
+#   torchrun --nnodes 2 --nproc-per-node 4 --rdzv-endpoint <host>:29500 general_test.py
+# Cada processo usa cpu_count // processos_locais threads, para não disputar núcleos.
+
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank():
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size():
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process():
+    return get_rank() == 0
+
+
+def get_local_world_size():
+    return int(os.environ.get("LOCAL_WORLD_SIZE", 1)) if is_distributed() else 1
+
+
+def launched_by_torchrun():
+    return "RANK" in os.environ and "WORLD_SIZE" in os.environ
+
+
+def _setup(rank, world_size, local_world_size, backend):
+    os.environ.setdefault("MASTER_ADDR", "127.0.0.1")
+    os.environ.setdefault("MASTER_PORT", "29500")
+    os.environ["LOCAL_WORLD_SIZE"] = str(local_world_size)
+    dist.init_process_group(backend, rank=rank, world_size=world_size)
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // local_world_size))
+    if rank != 0:
+        # Só o rank 0 escreve no terminal
+        sys.stdout = open(os.devnull, "w")
+
+
+def _worker(rank, world_size, fn, args, backend):
+    _setup(rank, world_size, world_size, backend)
+    try:
+        fn(*args)
+    finally:
+        dist.destroy_process_group()
+
+
+def launch(fn, num_workers, *args, backend="gloo"):
+    """
+    Executa fn(*args) em cada processo do grupo. Sob torchrun usa o processo atual;
+    caso contrário abre 'num_workers' processos locais. 'fn' precisa ser uma função
+    de módulo (picklable) para o spawn.
+    """
+    if launched_by_torchrun():
+        local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", os.environ["WORLD_SIZE"]))
+        _setup(int(os.environ["RANK"]), int(os.environ["WORLD_SIZE"]), local_world_size, backend)
+        try:
+            fn(*args)
+        finally:
+            dist.destroy_process_group()
+    else:
+        mp.spawn(_worker, args=(num_workers, fn, args, backend), nprocs=num_workers, join=True)
+
+
+def wrap_model(model, device):
+    """
+    Envolve o modelo em DistributedDataParallel (gradientes somados com all-reduce).
+    """
+    device = torch.device(device)
+    device_ids = [device.index] if device.type == "cuda" and device.index is not None else None
+    return DistributedDataParallel(model, device_ids=device_ids)
+
+
+def all_reduce_sum(tensor):
+    if is_distributed():
+        dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor
+
+
+def barrier():
+    if is_distributed():
+        dist.barrier()
+
+
+def broadcast_flag(flag):
+    """
+    Decisão tomada no rank 0 (ex.: early stopping) repassada para todos os processos.
+    """
+    if not is_distributed():
+        return flag
+    tensor = torch.tensor([int(flag)])
+    dist.broadcast(tensor, src=0)
+    return bool(tensor.item())
+
+
+def broadcast_object(obj):
+    """
+    Objeto (picklable) calculado no rank 0 repassado para todos os processos.
+    """
+    if not is_distributed():
+        return obj
+    objects = [obj]
+    dist.broadcast_object_list(objects, src=0)
+    return objects[0]
@@ -0,0 +1,81 @@
+import os
+import pandas as pd
+from torchvision import datasets, transforms
+import config
+from tensor_cache import cached_dataset
+from shard_dataset import ShardedImageDataset
+from preprocessing import image_loader, to_uint8_array
+
+# --------------------------------------------------------------------------
+# Transform, datasets e tabela de resultados compartilhados pelos scripts
+# --------------------------------------------------------------------------
+# general_test, quantize, model_conversion, cascade, distillation, benchmark, confusion e
+# video_inference importam daqui, sem carregar o general_test (e tudo o que ele importa
+# para treinar) só para montar o transform ou gravar uma linha no CSV.
+
+
+def build_transform(resolution=config.RESOLUTION, uint8=False):
+    if uint8:
+        # Worker devolve uint8 HWC; float + Normalize rodam no lote, no device (preprocessing.batch_collate)
+        return transforms.Compose([transforms.Resize((resolution, resolution)), to_uint8_array])
+    return transforms.Compose([
+    transforms.Resize((resolution, resolution)),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])])
+
+
+def build_loader(resolution=config.RESOLUTION):
+    # Decodificação reduzida perto da resolução final (preprocessing.py) ou a completa do torchvision
+    return image_loader(resolution) if config.DRAFT_DECODE else datasets.folder.default_loader
+
+
+def build_datasets(resolution=config.RESOLUTION, data_format=config.DATA_FORMAT):
+    """
+    Retorna (train, val, test) no formato escolhido em config.DATA_FORMAT.
+    """
+    transform = build_transform(resolution, uint8=config.UINT8_BATCHES)
+    if data_format == "cache":
+        # Decodifica os JPEGs uma única vez; as épocas leem uint8 do memmap
+        train_dataset = cached_dataset(config.DATA_DIR_TRAIN, resolution=resolution)
+        val_dataset = cached_dataset(config.DATA_DIR_VAL, resolution=resolution)
+        test_dataset = cached_dataset(config.DATA_DIR_TEST, resolution=resolution)
+    elif data_format == "shards":
+        # Leitura sequencial dos shards; o embaralhamento é feito pelo próprio dataset
+        decode_resolution = resolution if config.DRAFT_DECODE else None
+        train_dataset = ShardedImageDataset("train", transform=transform, shuffle=True, buffer_size=config.SHUFFLE_BUFFER,
+                                            resolution=decode_resolution)
+        val_dataset = ShardedImageDataset("val", transform=transform, resolution=decode_resolution)
+        test_dataset = ShardedImageDataset("test", transform=transform, resolution=decode_resolution)
+    else:
+        train_dataset = datasets.ImageFolder(
+            root = config.DATA_DIR_TRAIN,
+            transform=transform,
+            loader=build_loader(resolution)
+        )
+
+        val_dataset = datasets.ImageFolder(
+            root = config.DATA_DIR_VAL,
+            transform=transform,
+            loader=build_loader(resolution)
+        )
+
+        test_dataset = datasets.ImageFolder(
+            root = config.DATA_DIR_TEST, # Ex: 'animes_test/'
+            transform=transform,
+            loader=build_loader(resolution)
+        )
+    return train_dataset, val_dataset, test_dataset
+
+
+def append_results(data, csv_path):
+    test_df = pd.DataFrame([data])
+
+    if os.path.exists(csv_path):
+        columns = pd.read_csv(csv_path, nrows=0).columns.tolist()
+        if columns == test_df.columns.tolist():
+            test_df.to_csv(csv_path, mode='a', header=False, index=False)
+        else:
+            # Coluna nova (ex.: Feature_Cache): regrava o arquivo para não desalinhar as linhas antigas
+            pd.concat([pd.read_csv(csv_path), test_df], ignore_index=True).to_csv(csv_path, index=False)
+    else:
+        test_df.to_csv(csv_path, mode='w', header=True, index=False)
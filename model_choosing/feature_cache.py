@@ -0,0 +1,263 @@
+import os
+import json
+import hashlib
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.data import Dataset
+from torch.utils.data.distributed import DistributedSampler
+import config
+from myutils import train, normalize_batch, trainable_parameters
+from loader_factory import make_loader, tune
+from distributed import is_distributed, is_main_process, barrier
+
+# --------------------------------------------------------------------------
+# Treino a partir de ativações pré-computadas da parte congelada do modelo
+# --------------------------------------------------------------------------
+# Em transfer learning só o final da rede é treinado (as últimas NUM_UNFROZEN partes
+# de model.features + classifier na MobileNetV2/EfficientNetB0, só a cabeça na ResNet18
+# e na ConvNext-Nano). O prefixo congelado produz sempre a mesma saída para a mesma
+# imagem, então ele roda uma única vez por split; as épocas treinam só o sufixo a partir
+# do cache em disco.
+# Diferença em relação ao treino normal: o prefixo roda em modo eval, então as
+# estatísticas das BatchNorm congeladas não são mais atualizadas durante o treino.
+#
+# O prefixo só conta como congelado se nenhum parâmetro dele estiver entre os que o
+# myutils.train otimiza (myutils.trainable_parameters). Na ViTB16, treinada inteira, o
+# cache mudaria o experimento para "só a cabeça": exige FEATURE_CACHE_HEAD_ONLY e
+# general_test marca a linha de resultados com Feature_Cache = "Head only".
+#
+# No treino distribuído o rank 0 gera o cache do split inteiro e os demais esperam numa
+# barreira; depois cada processo treina na sua fatia (DistributedSampler).
+
+
+class _ViTPrefix(nn.Module):
+    """
+    Backbone do ViT (HuggingFace) até o token CLS normalizado, entrada do classifier.
+    """
+
+    def __init__(self, vit):
+        super().__init__()
+        self.vit = vit
+
+    def forward(self, x):
+        return self.vit(x).last_hidden_state[:, 0]
+
+
+class _ConvSuffix(nn.Module):
+    """
+    Últimos blocos de model.features + pooling + classifier (MobileNetV2/EfficientNetB0).
+    Usa os mesmos módulos do modelo original, então treinar o sufixo treina o modelo.
+    """
+
+    def __init__(self, features, classifier):
+        super().__init__()
+        self.features = features
+        self.classifier = classifier
+
+    def forward(self, x):
+        x = self.features(x)
+        x = F.adaptive_avg_pool2d(x, 1).flatten(1)
+        return self.classifier(x)
+
+
+class _HeadSuffix(nn.Module):
+    """
+    Só a cabeça do modelo, registrada com o mesmo nome do atributo original (fc, head, classifier)
+    para que myutils.train escolha os mesmos parâmetros para o otimizador.
+    """
+
+    def __init__(self, head_name, head):
+        super().__init__()
+        self.head_name = head_name
+        self.add_module(head_name, head)
+
+    def forward(self, x):
+        return getattr(self, self.head_name)(x)
+
+
+def split_frozen_prefix(model, model_name, num_unfrozen=config.NUM_UNFROZEN):
+    """
+    Divide o modelo em (prefixo congelado, sufixo treinável), compartilhando os módulos.
+    """
+    if model_name in ("MobileNetV2", "EfficientNetB0"):
+        blocks = list(model.features.children())
+        prefix = nn.Sequential(*blocks[:-num_unfrozen])
+        suffix = _ConvSuffix(nn.Sequential(*blocks[-num_unfrozen:]), model.classifier)
+    elif model_name == "ResNet18":
+        prefix = nn.Sequential(
+            model.conv1, model.bn1, model.relu, model.maxpool,
+            model.layer1, model.layer2, model.layer3, model.layer4,
+            model.avgpool, nn.Flatten(1),
+        )
+        suffix = _HeadSuffix("fc", model.fc)
+    elif model_name == "ConvNext-Nano":
+        # Mesmo caminho de forward_features do timm; a head faz pooling + norm + fc
+        prefix = nn.Sequential(model.stem, model.stages, model.norm_pre)
+        suffix = _HeadSuffix("head", model.head)
+    elif model_name == "ViTB16":
+        prefix = _ViTPrefix(model.vit)
+        suffix = _HeadSuffix("classifier", model.classifier)
+    else:
+        raise ValueError(f"Modelo sem divisão prefixo/sufixo conhecida: {model_name}")
+    return prefix, suffix
+
+
+def is_deterministic(dataset):
+    """
+    O cache só é válido se a transformação não tiver aumentos aleatórios.
+    """
+    transform = getattr(dataset, "transform", None)
+    steps = getattr(transform, "transforms", [transform] if transform is not None else [])
+    return not any(type(step).__name__.startswith("Random") for step in steps)
+
+
+def _fingerprint(prefix, model_name, num_unfrozen, dataset, dtype):
+    digest = hashlib.sha1(f"{model_name}|{num_unfrozen}|{len(dataset)}|{dtype}|draft={config.DRAFT_DECODE}".encode())
+    for path, label in getattr(dataset, "samples", []):
+        digest.update(f"{path}|{label}\n".encode())
+    for name, tensor in prefix.state_dict().items():
+        digest.update(name.encode())
+        digest.update(tensor.detach().cpu().numpy().tobytes())
+    return digest.hexdigest()
+
+
+@torch.no_grad()
+def cache_features(prefix, loader, cache_path, fingerprint, device, fp16=True):
+    """
+    Roda o prefixo uma vez sobre o loader e grava as ativações num memmap.
+    Reaproveita o cache existente se a impressão digital for a mesma.
+    """
+    meta_path = cache_path + ".json"
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f)["fingerprint"] == fingerprint:
+                return cache_path
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    prefix.eval()
+    total = len(loader.dataset)
+    dtype = np.float16 if fp16 else np.float32
+    features, labels, shape = None, np.zeros(total, dtype=np.int64), None
+    offset = 0
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+
+    for images, batch_labels in loader:
+        out = prefix(normalize_batch(images.to(device)))
+        if features is None:
+            shape = (total,) + tuple(out.shape[1:])
+            features = np.memmap(tmp_path, dtype=dtype, mode="w+", shape=shape)
+        n = out.shape[0]
+        features[offset:offset + n] = out.float().cpu().numpy().astype(dtype)
+        labels[offset:offset + n] = batch_labels.numpy()
+        offset += n
+
+    if features is None:
+        raise ValueError(f"Loader vazio: nenhuma imagem para gerar o cache {cache_path}")
+    features.flush()
+    del features
+    os.replace(tmp_path, cache_path)
+    np.save(tmp_path + ".npy", labels[:offset])
+    os.replace(tmp_path + ".npy", cache_path + ".labels.npy")
+    # O .json vai por último: só existe quando o cache está completo
+    with open(tmp_path + ".json", "w") as f:
+        json.dump({"fingerprint": fingerprint, "shape": [offset] + list(shape[1:]), "dtype": np.dtype(dtype).name}, f)
+    os.replace(tmp_path + ".json", meta_path)
+    return cache_path
+
+
+class FeatureDataset(Dataset):
+    """
+    Ativações pré-computadas de um split (memmap) com os respectivos rótulos.
+    """
+
+    def __init__(self, cache_path):
+        with open(cache_path + ".json") as f:
+            meta = json.load(f)
+        self.cache_path = cache_path
+        self.shape = tuple(meta["shape"])
+        self.dtype = meta["dtype"]
+        self.targets = np.load(cache_path + ".labels.npy")
+        self._features = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        if self._features is None:
+            self._features = np.memmap(self.cache_path, dtype=self.dtype, mode="r", shape=self.shape)
+        return torch.from_numpy(self._features[index].astype(np.float32)), int(self.targets[index])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_features"] = None
+        return state
+
+
+def prefix_is_frozen(model, model_name, save_model_name, num_unfrozen=config.NUM_UNFROZEN):
+    """
+    True se o treino normal não otimiza nenhum parâmetro do prefixo (o cache não muda o experimento).
+    """
+    prefix, _ = split_frozen_prefix(model, model_name, num_unfrozen)
+    trained = {id(p) for p in trainable_parameters(model, save_model_name)}
+    return not any(id(p) in trained for p in prefix.parameters())
+
+
+def cache_mode(model, model_name, save_model_name, num_unfrozen=config.NUM_UNFROZEN, enabled=config.FEATURE_CACHE):
+    """
+    Valor da coluna Feature_Cache dos resultados: "No", "Yes" (prefixo já congelado) ou "Head only".
+    """
+    if not enabled:
+        return "No"
+    return "Yes" if prefix_is_frozen(model, model_name, save_model_name, num_unfrozen) else "Head only"
+
+
+def train_with_feature_cache(model, model_name, num_epochs, train_loader, val_loader, output_dir, save_model_name,
+                             device, num_unfrozen=config.NUM_UNFROZEN, cache_dir=config.FEATURE_CACHE_DIR,
+                             fp16=config.FEATURE_CACHE_FP16, resume=False, weight_decay=None,
+                             head_only=config.FEATURE_CACHE_HEAD_ONLY):
+    """
+    Mesmo contrato de myutils.train, mas treinando só o sufixo a partir do cache de ativações.
+    No fim, o checkpoint salvo contém o state_dict do modelo completo, como no treino normal.
+    'head_only=True' libera o cache quando o treino normal também otimiza o prefixo (congela o backbone).
+    """
+    if not head_only and not prefix_is_frozen(model, model_name, save_model_name, num_unfrozen):
+        raise ValueError(f"{model_name} treina parâmetros do prefixo; o cache de features os congelaria. "
+                         "Use FEATURE_CACHE_HEAD_ONLY = True para treinar só a cabeça de propósito")
+    for loader in (train_loader, val_loader):
+        if not is_deterministic(loader.dataset):
+            raise ValueError("O cache de features exige transformações determinísticas (sem Random*)")
+        if is_distributed() and hasattr(loader.dataset, "set_epoch"):
+            raise ValueError("O cache de features precisa do split inteiro; os shards já vêm divididos por processo")
+
+    prefix, suffix = split_frozen_prefix(model, model_name, num_unfrozen)
+    loaders = []
+    for split, loader in (("train", train_loader), ("val", val_loader)):
+        path = os.path.join(cache_dir, model_name, f"{split}-{num_unfrozen}unfrozen.bin")
+        if is_main_process():
+            # Passada sequencial pelo split inteiro (o loader do treino pode ter um DistributedSampler)
+            full_loader = make_loader(loader.dataset, loader.batch_size, loader.num_workers, loader.prefetch_factor or 2)
+            fingerprint = _fingerprint(prefix, model_name, num_unfrozen, loader.dataset, "fp16" if fp16 else "fp32")
+            cache_features(prefix, full_loader, path, fingerprint, device, fp16)
+        barrier()
+        features = FeatureDataset(path)
+        sampler = DistributedSampler(features, shuffle=(split == "train"), seed=config.RANDOM_SEED) if is_distributed() else None
+        # Workers/prefetch medidos para o cache de features, como nos demais loaders (loader_factory.tune)
+        settings = tune(features, loader.batch_size)
+        loaders.append(make_loader(features, loader.batch_size, settings["num_workers"], settings["prefetch_factor"],
+                                   shuffle=(split == "train" and sampler is None), sampler=sampler))
+    print("Cache de features pronto, treinando apenas o sufixo...")
+
+    best_loss, best_epoch = train(suffix, num_epochs, loaders[0], loaders[1], device=device,
+                                  output_dir=output_dir, model_name=save_model_name, precision=config.PRECISION,
+                                  channels_last=config.CHANNELS_LAST, compile_model=config.COMPILE_MODEL,
+                                  resume=resume, keep_last=config.KEEP_LAST_CHECKPOINTS, weight_decay=weight_decay,
+                                  profile_steps=config.PROFILE_STEPS)
+
+    # O train salvou só o sufixo: carrega o melhor e regrava o modelo completo no mesmo arquivo
+    if is_main_process():
+        checkpoint_path = os.path.join(output_dir, f"{save_model_name}_{num_epochs}.pth")
+        suffix.load_state_dict(torch.load(checkpoint_path, map_location=device))
+        torch.save(model.state_dict(), checkpoint_path)
+    return best_loss, best_epoch
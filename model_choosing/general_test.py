@@ -1,150 +1,98 @@
 import torch 
-import torch.nn as nn
-import torch.nn.functional as F
-import pandas as pd 
-import numpy as np 
-from torchvision import datasets, transforms
-import torchvision.models as models
-from torch.utils.data import DataLoader 
-import torch.optim as optim
-from sklearn.metrics import classification_report, roc_auc_score
-import timm
-import time
+from torch.utils.data.distributed import DistributedSampler
 import os
 import torch.backends.cudnn as cudnn
+import argparse
 import config 
-from transformers import get_cosine_schedule_with_warmup
-from PIL import Image
 from myutils import train, test
-from transformers import ViTForImageClassification
+from feature_cache import train_with_feature_cache, cache_mode
+from distributed import launch, is_distributed, is_main_process, get_rank
+from model_registry import build_model
+from predictions import store_path
+from instrumentation import Instrumentation, metrics_path
+from loader_factory import build_loaders
+from eval_utils import build_datasets, append_results
 
 
 
-model_name = config.MODEL_NAME
-save_dir = f"../best_model/{model_name}/"
-test_dataset_dir = f"../results/general_{model_name}.csv"
-
-num_epochs = config.NUM_EPOCHS
-transform = transforms.Compose([
-transforms.Resize((224, 224)), 
-transforms.ToTensor(), 
-transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])])
-
-
 VAL_SPLIT_PERCENT = 0.10  
 
-for data_root_path in config.DATA_DIRS_ROOT:  
-    
-    train_dataset = datasets.ImageFolder(
-        root = config.DATA_DIR_TRAIN, 
-        transform=transform
-    )
-    
-    val_dataset = datasets.ImageFolder(
-        root = config.DATA_DIR_VAL, 
-        transform=transform
-    )
-
-    test_dataset = datasets.ImageFolder(
-        root = config.DATA_DIR_TEST, # Ex: 'animes_test/'
-        transform=transform
-    )
 
+def run_experiment(model_name=config.MODEL_NAME, num_epochs=config.NUM_EPOCHS, batch_size=config.BATCH_SIZE,
+                   dropout=None, weight_decay=None, resolution=config.RESOLUTION, num_unfrozen=config.NUM_UNFROZEN,
+                   save_dir=None, save_model_name=None, data_format=config.DATA_FORMAT, num_workers=None, resume=False):
+    """
+    Treina, recarrega o melhor checkpoint e testa. Retorna a linha de resultados (dict).
+    'num_workers=None' usa os workers/prefetch medidos por loader_factory.tune.
+    """
+    save_dir = save_dir or f"../best_model/{model_name}/"
+    save_model_name = save_model_name or f"best{model_name}-more-images-{num_unfrozen}unfrozen"
+    checkpoint_filename = f"{save_model_name}_{num_epochs}.pth"
 
+    train_dataset, val_dataset, test_dataset = build_datasets(resolution, data_format)
     print(f"Divisão: Treino ({len(train_dataset)}), Validação ({len(val_dataset)}), Teste ({len(test_dataset)})")
 
-    test_loader = DataLoader(test_dataset, batch_size = config.BATCH_SIZE, shuffle=False, num_workers=8, pin_memory=True)
-    val_loader = DataLoader(val_dataset, batch_size = config.BATCH_SIZE, shuffle=False, num_workers=8, pin_memory=True)
-    train_loader = DataLoader(train_dataset, batch_size = config.BATCH_SIZE, shuffle=True, num_workers=8, pin_memory=True)
+    if is_distributed() and data_format != "shards":
+        # Cada processo vê só a sua fatia de treino/validação; os shards já se dividem por rank
+        train_sampler = DistributedSampler(train_dataset, shuffle=True, seed=config.RANDOM_SEED)
+        val_sampler = DistributedSampler(val_dataset, shuffle=False)
+    else:
+        train_sampler = val_sampler = None
+    train_loader, val_loader, test_loader = build_loaders(train_dataset, val_dataset, test_dataset, batch_size, num_workers,
+                                                         shuffle_train=(data_format != "shards"), train_sampler=train_sampler,
+                                                         val_sampler=val_sampler)
     
     print("Dados carregados com sucesso...")
 
-    save_model_name = f"best{model_name}-more-images-5unfrozen"
-    checkpoint_filename = f"{save_model_name}_{num_epochs}.pth"
-         
-    if model_name == "ResNet18":
-        model = models.resnet18(weights='DEFAULT')
-        num_features = model.fc.in_features
-        model.fc = nn.Sequential(
-        nn.Linear(num_features, 3)
-        )
-    elif model_name == "EfficientNetB0":
-        model = models.efficientnet_b0(weights='DEFAULT')
-
-        num_features = model.classifier[1].in_features 
-
-        model.classifier = nn.Sequential(
-             nn.Dropout(p=0.2, inplace=True), # Recomendado colocar de volta
-             nn.Linear(num_features, 3)
-         )
-         
-    elif model_name == "ConvNext-Nano":
-        model = timm.create_model('convnext_nano',pretrained=True,num_classes=3,in_chans=3)
-        checkpoint = torch.load(checkpoint_path)
-        model.load_state_dict(checkpoint)  
-
-    elif model_name == "ViTB16":
-        model = ViTForImageClassification.from_pretrained(
-                "google/vit-base-patch16-224",  # Modelo pré-treinado para 224x224
-                num_labels=3,ignore_mismatched_sizes=True  # Classificação binária
-    )
-    elif model_name == "MobileNetV2":
-        model = models.mobilenet_v2(weights='DEFAULT')
-        num_features = model.last_channel
-        model.classifier = nn.Sequential(
-        nn.Linear(num_features, 3)
-        )
-        checkpoint_path = "../best_model/MobileNetV2/bestMobileNetV2-more-images_100.pth"
-        checkpoint = torch.load(checkpoint_path)
-        model.load_state_dict(checkpoint)
-
-    #for params in model.parameters():
-        #params.requires_grad = False
-
-    if model_name == "ResNet18":    
-        for params in model.fc.parameters():
-            params.requires_grad = True
-
-    elif model_name == "MobileNetV2" or "EfficientNetB0":
-
-        for child in list(model.features.children())[:-5]: # Deixa só as ultimas 5 "partes" soltas
-            for param in child.parameters():
-                param.requires_grad = False
-
-        for params in model.classifier.parameters():
-            params.requires_grad = True
-
-
-
-    elif model_name == "ConvNext-Nano":
-        for params in model.head.parameters():
-            params.requires_grad = True
-        
-            
-    elif model_name == "ViTB16":
-        for params in model.classifier.parameters():
-            params.requires_grad = True
+    model = build_model(model_name, num_unfrozen, dropout)
         
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    if is_distributed() and device.type == "cuda":
+        device = torch.device("cuda", get_rank() % torch.cuda.device_count())
     cudnn.benchmark = True
             
     model = model.to(device)
+    feature_cache = cache_mode(model, model_name, save_model_name, num_unfrozen)
         
-    best_train_acc, best_epoch= train(model, num_epochs, train_loader, val_loader, device=device, output_dir=save_dir, model_name=save_model_name)
+    if config.FEATURE_CACHE:
+        # Roda o prefixo congelado uma única vez e treina só o sufixo a partir do cache
+        best_train_acc, best_epoch = train_with_feature_cache(model, model_name, num_epochs, train_loader, val_loader, save_dir, save_model_name, device,
+                                                              num_unfrozen=num_unfrozen, resume=resume, weight_decay=weight_decay)
+    else:
+        best_train_acc, best_epoch= train(model, num_epochs, train_loader, val_loader, device=device, output_dir=save_dir, model_name=save_model_name,
+                                          precision=config.PRECISION, channels_last=config.CHANNELS_LAST, compile_model=config.COMPILE_MODEL,
+                                          resume=resume, keep_last=config.KEEP_LAST_CHECKPOINTS, weight_decay=weight_decay,
+                                          profile_steps=config.PROFILE_STEPS)
+
+    if not is_main_process():
+        return None  # O teste final roda só no rank 0
 
     checkpoint_path = os.path.join(save_dir, checkpoint_filename)    
     checkpoint = torch.load(checkpoint_path)
     model.load_state_dict(checkpoint)
+    predictions_path = store_path(model_name, checkpoint_path)
+
+    if config.INFERENCE_BACKEND == "onnxruntime":
+        # Avalia o grafo ONNX otimizado do melhor checkpoint em vez do modelo eager
+        from model_conversion import export_onnx, optimize_onnx
+        from backends import OnnxRuntimeBackend
+        os.makedirs(config.ONNX_DIR, exist_ok=True)
+        onnx_path = export_onnx(model.cpu(), os.path.join(config.ONNX_DIR, f"{save_model_name}.onnx"), resolution)
+        model = OnnxRuntimeBackend(optimize_onnx(onnx_path, os.path.join(config.ONNX_DIR, f"{save_model_name}.opt.onnx")))
+        device = torch.device("cpu")
+        predictions_path = store_path(model_name, checkpoint_path, tag="onnx")
 
-    loss, acc, prec, rec, f1 = test(model, test_loader, model_name, device)
+    loss, acc, prec, rec, f1 = test(model, test_loader, model_name, device, precision=config.PRECISION, channels_last=config.CHANNELS_LAST,
+                                    predictions_path=predictions_path,
+                                    instrumentation=Instrumentation(metrics_path(save_dir, save_model_name), device=device))
 
 
     print(f'Melhor acurácia de treinamento: {best_train_acc} atingida com {best_epoch} épocas')
 
             #---- Chamada das funcoes.
-    data = {
-            "Model": model_name+"5unfrozen", 
-            "Epochs": config.NUM_EPOCHS,
+    return {
+            "Model": model_name+f"{num_unfrozen}unfrozen", 
+            "Epochs": num_epochs,
             "Test_Loss":loss,
             "Test_Acuracia": acc, 
             "Test_Precisao": prec, 
@@ -154,14 +102,30 @@ for data_root_path in config.DATA_DIRS_ROOT:
             "Best_Acc_Train":best_train_acc,
             "Best_Epoch_Acc":best_epoch,
             "Num_Samples":config.NUM_SAMPLES,
-            "Dropout":config.P,
-           "Resolution":config.RESOLUTION,
+            "Dropout":config.P if dropout is None else dropout,
+           "Resolution":resolution,
             "Data Normalization": 'Yes', 
+            "Feature_Cache": feature_cache,
             }
 
-    test_df = pd.DataFrame([data])
 
-    if os.path.exists(test_dataset_dir):
-        test_df.to_csv(test_dataset_dir, mode='a', header=False, index=False)
+def _main(resume):
+    model_name = config.MODEL_NAME
+    test_dataset_dir = f"../results/general_{model_name}.csv"
+
+    for data_root_path in config.DATA_DIRS_ROOT:  
+        data = run_experiment(model_name, resume=resume)
+        if data is not None:
+            append_results(data, test_dataset_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Treina e testa config.MODEL_NAME")
+    parser.add_argument("--resume", action="store_true", default=config.RESUME, help="Retoma do último checkpoint completo")
+    args = parser.parse_args()
+
+    if config.DISTRIBUTED:
+        # Data-parallel em CPU (gloo): N processos locais ou os processos criados pelo torchrun
+        launch(_main, config.DISTRIBUTED_WORKERS, args.resume)
     else:
-        test_df.to_csv(test_dataset_dir, mode='w', header=True, index=False)
+        _main(args.resume)
@@ -0,0 +1,172 @@
+import os
+import time
+from contextlib import contextmanager, nullcontext
+import pandas as pd
+import torch
+from distributed import is_main_process
+
+# --------------------------------------------------------------------------
+# Tempo por fase do treino/teste
+# --------------------------------------------------------------------------
+# myutils.train/test marcam cada fase do passo com instrumentation.phase(nome):
+#   data (espera pelo DataLoader), h2d (cópia + normalização), forward, backward,
+#   optimizer, metrics (loss + matriz de confusão) e report (all-reduce + métricas da época).
+# Ao fim de cada época, o tempo total e por passo de cada fase, imagens/s, fração do
+# tempo esperando dados e o pico de memória (CUDA: max_memory_allocated; CPU: VmHWM)
+# vão para <output_dir>/<modelo>_metrics.csv, ao lado do checkpoint.
+#
+# Com profile_steps=(primeiro, último), os passos de treino desse intervalo (contados
+# desde o início do treino) rodam dentro do torch.profiler, com as fases como
+# record_function, e o trace (chrome://tracing ou Perfetto) vai para <output_dir>/profile/.
+# Com sync_cuda=True, cada fase espera a GPU terminar (tempos exatos, treino mais lento).
+#
+# Para outros coletores (ex.: TensorBoard), basta sobrescrever log().
+
+
+def status_mb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024  # kB
+    return 0.0
+
+
+def reset_peak_rss():
+    """
+    Zera o pico de RSS do processo (Linux). Sem isso o pico medido incluiria o import do
+    torch e tudo o que o processo fez antes da medição.
+    """
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def metrics_path(output_dir, model_name):
+    return os.path.join(output_dir, f"{model_name}_metrics.csv")
+
+
+class Instrumentation:
+
+    def __init__(self, metrics_path=None, profile_steps=None, trace_dir=None, device=None, sync_cuda=False):
+        self.metrics_path = metrics_path
+        self.profile_steps = profile_steps
+        self.trace_dir = trace_dir or (os.path.join(os.path.dirname(metrics_path), "profile") if metrics_path else ".")
+        self.device = torch.device(device) if device is not None else None
+        self.sync_cuda = sync_cuda and self.device is not None and self.device.type == "cuda"
+        self.global_step = 0
+        self._profiler = None
+        self.start("train")
+
+    def start(self, split):
+        """
+        Zera os contadores no início de uma passada (época de treino, validação ou teste).
+        """
+        self.split = split
+        self.phases = {}
+        self.steps = 0
+        self.images = 0
+        if self.device is not None and self.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(self.device)
+        else:
+            try:
+                reset_peak_rss()
+            except OSError:
+                pass  # Fora do Linux o pico fica acumulado desde o início do processo
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        label = torch.profiler.record_function(name) if self._profiler is not None else nullcontext()
+        start = time.perf_counter()
+        with label:
+            yield
+            if self.sync_cuda:
+                torch.cuda.synchronize(self.device)
+        self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def batches(self, loader):
+        """
+        Itera o loader contando o tempo de espera de cada lote como a fase 'data'.
+        """
+        iterator = iter(loader)
+        while True:
+            self._maybe_start_profiler()
+            with self.phase("data"):
+                try:
+                    batch = next(iterator)
+                except StopIteration:
+                    return
+            yield batch
+
+    def step(self, num_images):
+        self.steps += 1
+        self.images += num_images
+        if self.split == "train":
+            self.global_step += 1
+            if self._profiler is not None:
+                self._profiler.step()
+                if self.global_step > self.profile_steps[1]:
+                    self._stop_profiler()
+
+    def _maybe_start_profiler(self):
+        if (self.split != "train" or self._profiler is not None or not self.profile_steps
+                or self.global_step != self.profile_steps[0] or not is_main_process()):
+            return
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if self.device is not None and self.device.type == "cuda":
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self._profiler = torch.profiler.profile(activities=activities, profile_memory=True, record_shapes=True)
+        self._profiler.__enter__()
+
+    def _stop_profiler(self):
+        profiler, self._profiler = self._profiler, None
+        profiler.__exit__(None, None, None)
+        os.makedirs(self.trace_dir, exist_ok=True)
+        trace_path = os.path.join(self.trace_dir, f"trace_steps{self.profile_steps[0]}-{self.profile_steps[1]}.json")
+        profiler.export_chrome_trace(trace_path)
+        print(f"Trace do profiler salvo em {trace_path}")
+        print(profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=15))
+
+    def peak_memory_mb(self):
+        if self.device is not None and self.device.type == "cuda":
+            return torch.cuda.max_memory_allocated(self.device) / 2 ** 20
+        try:
+            return status_mb("VmHWM")
+        except OSError:
+            return float("nan")
+
+    def end(self):
+        """
+        Fecha a passada atual: imprime a divisão do tempo por fase e devolve as métricas
+        com o prefixo do split (train_forward_s, val_images_s, ...).
+        """
+        elapsed = time.perf_counter() - self._start
+        prefix = self.split
+        stats = {
+            f"{prefix}_seconds": elapsed,
+            f"{prefix}_steps": self.steps,
+            f"{prefix}_images_s": self.images / elapsed if elapsed else 0.0,
+            f"{prefix}_data_wait": self.phases.get("data", 0.0) / elapsed if elapsed else 0.0,
+            f"{prefix}_peak_mem_mb": self.peak_memory_mb(),
+        }
+        for name, seconds in self.phases.items():
+            stats[f"{prefix}_{name}_s"] = seconds
+            stats[f"{prefix}_{name}_ms_step"] = seconds / max(self.steps, 1) * 1000
+        print(f"Fases ({prefix}): " + " | ".join(f"{name} {seconds / elapsed:.0%}" for name, seconds in self.phases.items())
+              + f" | {stats[f'{prefix}_images_s']:.1f} img/s | pico {stats[f'{prefix}_peak_mem_mb']:.0f} MB")
+        return stats
+
+    def log(self, row):
+        """
+        Acrescenta uma linha ao arquivo de métricas (só no processo principal).
+        """
+        if not self.metrics_path or not is_main_process():
+            return
+        frame = pd.DataFrame([row])
+        if os.path.exists(self.metrics_path):
+            frame = pd.concat([pd.read_csv(self.metrics_path), frame], ignore_index=True)
+        os.makedirs(os.path.dirname(self.metrics_path) or ".", exist_ok=True)
+        frame.to_csv(self.metrics_path, index=False)
+
+    def close(self):
+        if self._profiler is not None:
+            self._stop_profiler()
@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import enum
+import hashlib
+import argparse
+import platform
+from datetime import datetime
+import torch
+from torch.utils.data import DataLoader
+import config
+from preprocessing import batch_collate
+from distributed import is_main_process, get_local_world_size, broadcast_object
+
+# --------------------------------------------------------------------------
+# DataLoaders com workers/prefetch ajustados para a máquina e o dataset
+# --------------------------------------------------------------------------
+# Em vez de num_workers=8 fixo, tune() mede uma janela curta de lotes do treino para cada
+# combinação candidata de num_workers x prefetch_factor e fica com a mais rápida (img/s).
+# A escolha é guardada em LOADER_TUNING_CACHE por host + dataset + tamanho do lote, então
+# só a primeira execução paga a medição. build_loaders() monta os três loaders com
+# persistent_workers: os workers sobrevivem entre as épocas e entre treino e validação,
+# em vez de serem recriados a cada passada.
+#
+# Datasets com set_epoch (shards) ficam sem persistent_workers: o worker guarda uma cópia
+# do dataset e não veria a época nova.
+#
+# No treino distribuído só o rank 0 mede (com no máximo cpu_count // processos locais
+# workers, a fatia de CPU de cada processo) e grava o cache; os outros processos esperam
+# e recebem a mesma escolha, sem abrir pools de workers concorrentes.
+#
+# Ex.: python loader_factory.py --retune   (mede de novo e mostra a tabela)
+
+
+def candidate_workers(max_workers=None):
+    max_workers = max_workers or os.cpu_count() or 1
+    candidates = {0, max_workers}
+    n = 1
+    while n < max_workers:
+        candidates.add(n)
+        n *= 2
+    return sorted(candidates)
+
+
+def _plain(value):
+    # Só valores simples entram na chave; enums viram o nome (ex.: InterpolationMode.BILINEAR)
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return True
+    if isinstance(value, (tuple, list)):
+        return all(_plain(v) for v in value)
+    return False
+
+
+def describe_transform(transform):
+    """
+    Descrição estável do transform (nome + parâmetros numéricos de cada passo). O repr
+    padrão traz endereços de memória (ex.: <function to_uint8_array at 0x...>), que mudam
+    a cada processo e fariam o cache nunca ser reaproveitado.
+    """
+    if transform is None:
+        return ""
+    steps = getattr(transform, "transforms", [transform])
+    parts = []
+    for step in steps:
+        name = getattr(step, "__qualname__", None) or type(step).__qualname__
+        params = {key: value for key, value in sorted(getattr(step, "__dict__", {}).items())
+                  if not key.startswith("_") and key != "training" and (_plain(value) or isinstance(value, enum.Enum))}
+        parts.append(name + "(" + ", ".join(f"{key}={value.name if isinstance(value, enum.Enum) else value}"
+                                            for key, value in params.items()) + ")")
+    return " > ".join(parts)
+
+
+def dataset_key(dataset, batch_size):
+    """
+    Identifica host + dataset (tipo, tamanho, origem, transform) + lote.
+    """
+    source = getattr(dataset, "root", None) or getattr(dataset, "cache_path", None) or getattr(dataset, "shards_dir", "")
+    description = f"{type(dataset).__name__}|{len(dataset)}|{os.path.abspath(source) if source else ''}|" \
+                  f"{describe_transform(getattr(dataset, 'transform', None))}|{batch_size}"
+    host = f"{platform.node()}|{os.cpu_count()}"
+    return hashlib.sha1(f"{host}|{description}".encode()).hexdigest()[:16]
+
+
+def _supports_persistent(dataset, num_workers):
+    return num_workers > 0 and not hasattr(dataset, "set_epoch")
+
+
+def make_loader(dataset, batch_size, num_workers=0, prefetch_factor=2, shuffle=False, sampler=None):
+    options = {}
+    if num_workers > 0:
+        options = {"prefetch_factor": prefetch_factor, "persistent_workers": _supports_persistent(dataset, num_workers)}
+    return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, sampler=sampler, num_workers=num_workers,
+                      pin_memory=torch.cuda.is_available(), collate_fn=batch_collate, **options)
+
+
+def measure(dataset, batch_size, num_workers, prefetch_factor, window=config.LOADER_TUNING_BATCHES, warmup=3):
+    """
+    img/s de uma janela de lotes embaralhados, sem contar a subida dos workers.
+    """
+    loader = make_loader(dataset, batch_size, num_workers, prefetch_factor, shuffle=not hasattr(dataset, "set_epoch"))
+    warmup = min(warmup, len(loader) - 1)  # Dataset pequeno: sobra pelo menos um lote medido
+    iterator = iter(loader)
+    images, start = 0, None
+    try:
+        for _ in range(warmup):
+            next(iterator)
+        start = time.perf_counter()
+        for _ in range(window):
+            batch = next(iterator)
+            images += len(batch[0])
+    except StopIteration:
+        pass  # Dataset menor que a janela: mede o que houver
+    elapsed = time.perf_counter() - start if start is not None else 0.0
+    del iterator, loader  # Encerra os workers antes da próxima candidata
+    return images / elapsed if elapsed and images else 0.0
+
+
+def _read_cache(cache_path):
+    if not os.path.exists(cache_path):
+        return {}
+    with open(cache_path) as f:
+        return json.load(f)
+
+
+def tune(dataset, batch_size, cache_path=config.LOADER_TUNING_CACHE, max_workers=None, prefetch_factors=(2, 4),
+         retune=False, verbose=True):
+    """
+    Melhor {"num_workers", "prefetch_factor"} para o dataset nesta máquina (em cache por host + dataset).
+    """
+    choice = None
+    if is_main_process():
+        max_workers = max_workers or max(1, (os.cpu_count() or 1) // get_local_world_size())
+        choice = _tune(dataset, batch_size, cache_path, max_workers, prefetch_factors, retune, verbose)
+    return broadcast_object(choice)
+
+
+def _tune(dataset, batch_size, cache_path, max_workers, prefetch_factors, retune, verbose):
+    key = dataset_key(dataset, batch_size)
+    cache = _read_cache(cache_path)
+    if key in cache and not retune:
+        return cache[key]
+
+    results = []
+    for num_workers in candidate_workers(max_workers):
+        for prefetch_factor in (prefetch_factors if num_workers > 0 else (2,)):
+            img_s = measure(dataset, batch_size, num_workers, prefetch_factor)
+            results.append((img_s, num_workers, prefetch_factor))
+            if verbose:
+                print(f"  workers {num_workers:>3} | prefetch {prefetch_factor} | {img_s:8.1f} img/s")
+    img_s, num_workers, prefetch_factor = max(results)
+    choice = {
+        "num_workers": num_workers,
+        "prefetch_factor": prefetch_factor,
+        "img_s": img_s,
+        "dataset": type(dataset).__name__,
+        "size": len(dataset),
+        "batch_size": batch_size,
+        "host": platform.node(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+    }
+    cache = _read_cache(cache_path)  # Outra execução pode ter gravado no meio tempo
+    cache[key] = choice
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"  # Execuções simultâneas não escrevem no mesmo temporário
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, cache_path)
+    if verbose:
+        print(f"DataLoader: {num_workers} workers, prefetch {prefetch_factor} ({img_s:.1f} img/s), salvo em {cache_path}")
+    return choice
+
+
+def build_loaders(train_dataset, val_dataset, test_dataset, batch_size, num_workers=None, shuffle_train=True,
+                  train_sampler=None, val_sampler=None):
+    """
+    (train, val, test) com persistent_workers. Sem 'num_workers', usa a configuração
+    medida por tune() sobre o treino (a mesma para os três splits).
+    """
+    if num_workers is None:
+        settings = tune(train_dataset, batch_size)
+        num_workers, prefetch_factor = settings["num_workers"], settings["prefetch_factor"]
+    else:
+        prefetch_factor = 2
+    train_loader = make_loader(train_dataset, batch_size, num_workers, prefetch_factor,
+                               shuffle=shuffle_train and train_sampler is None, sampler=train_sampler)
+    val_loader = make_loader(val_dataset, batch_size, num_workers, prefetch_factor, sampler=val_sampler)
+    test_loader = make_loader(test_dataset, batch_size, num_workers, prefetch_factor)
+    return train_loader, val_loader, test_loader
+
+
+def main():
+    from eval_utils import build_datasets
+
+    parser = argparse.ArgumentParser(description="Mede workers/prefetch do DataLoader para esta máquina e dataset")
+    parser.add_argument("--data-format", default=config.DATA_FORMAT)
+    parser.add_argument("--batch-size", type=int, default=config.BATCH_SIZE)
+    parser.add_argument("--max-workers", type=int)
+    parser.add_argument("--retune", action="store_true", help="Ignora a escolha em cache e mede de novo")
+    args = parser.parse_args()
+
+    train_dataset, _, _ = build_datasets(config.RESOLUTION, args.data_format)
+    choice = tune(train_dataset, args.batch_size, max_workers=args.max_workers, retune=args.retune)
+    print(json.dumps(choice, indent=2))
+
+
+if __name__ == "__main__":
+    main()
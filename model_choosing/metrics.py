@@ -0,0 +1,101 @@
+import numpy as np
+import torch
+from distributed import all_reduce_sum
+
+# --------------------------------------------------------------------------
+# Métricas acumuladas no device
+# --------------------------------------------------------------------------
+# A matriz de confusão fica no mesmo device do modelo e é atualizada com um único
+# bincount por lote, sem criar objetos Python por amostra e sem sincronizar com a CPU.
+# Acurácia, precisão/recall por classe e F1 macro/ponderado saem da matriz ao fim
+# da época, com as mesmas chaves do classification_report(output_dict=True) do sklearn.
+
+
+class ConfusionMatrix:
+    """
+    Acumulador de matriz de confusão (linhas = rótulo real, colunas = predito).
+    O número de classes é inferido dos logits no primeiro update, se não for informado.
+    """
+
+    def __init__(self, num_classes=None, device=None):
+        self.num_classes = num_classes
+        self.matrix = None
+        if num_classes is not None:
+            self.matrix = torch.zeros(num_classes, num_classes, dtype=torch.long, device=device)
+
+    def update(self, logits, labels):
+        if self.matrix is None:
+            self.num_classes = logits.shape[1]
+            self.matrix = torch.zeros(self.num_classes, self.num_classes, dtype=torch.long, device=logits.device)
+        preds = torch.argmax(logits.detach(), dim=1)
+        idx = labels.to(self.matrix.device) * self.num_classes + preds.to(self.matrix.device)
+        self.matrix += torch.bincount(idx, minlength=self.num_classes ** 2).view(self.num_classes, self.num_classes)
+
+    def all_reduce(self):
+        """
+        Soma as matrizes de todos os processos no treino distribuído (no-op fora dele).
+        """
+        if self.matrix is not None:
+            all_reduce_sum(self.matrix)
+
+    def reset(self):
+        if self.matrix is not None:
+            self.matrix.zero_()
+
+    def numpy(self):
+        """
+        Única sincronização com a CPU: copia a matriz acumulada.
+        """
+        if self.matrix is None:
+            return np.zeros((0, 0), dtype=np.int64)
+        return self.matrix.cpu().numpy()
+
+    def report(self):
+        return classification_report_from_matrix(self.numpy())
+
+
+def _safe_div(num, den):
+    return np.divide(num, den, out=np.zeros_like(num, dtype=float), where=den != 0)
+
+
+def classification_report_from_matrix(cm):
+    """
+    Equivalente ao sklearn.metrics.classification_report(..., output_dict=True),
+    calculado a partir da matriz de confusão. Como no sklearn, só entram no
+    relatório as classes que aparecem nos rótulos reais ou nas predições.
+    """
+    cm = np.asarray(cm, dtype=np.int64)
+    present = np.flatnonzero((cm.sum(axis=0) + cm.sum(axis=1)) > 0)
+    cm = cm[np.ix_(present, present)]
+
+    tp = np.diag(cm).astype(float)
+    support = cm.sum(axis=1)
+    predicted = cm.sum(axis=0)
+    precision = _safe_div(tp, predicted)
+    recall = _safe_div(tp, support)
+    f1 = _safe_div(2 * precision * recall, precision + recall)
+    total = support.sum()
+
+    report = {}
+    for i, label in enumerate(present):
+        report[str(label)] = {
+            "precision": precision[i],
+            "recall": recall[i],
+            "f1-score": f1[i],
+            "support": int(support[i]),
+        }
+    report["accuracy"] = tp.sum() / total if total else 0.0
+    report["macro avg"] = {
+        "precision": precision.mean() if len(present) else 0.0,
+        "recall": recall.mean() if len(present) else 0.0,
+        "f1-score": f1.mean() if len(present) else 0.0,
+        "support": int(total),
+    }
+    weights = _safe_div(support.astype(float), np.full(len(support), float(total)))
+    report["weighted avg"] = {
+        "precision": float((precision * weights).sum()),
+        "recall": float((recall * weights).sum()),
+        "f1-score": float((f1 * weights).sum()),
+        "support": int(total),
+    }
+    return report
@@ -1,15 +1,156 @@
-import torch 
-import torchvision.models as models
+import os
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+import torch
 import torch.nn as nn
+from torchvision import datasets
+import config
+from eval_utils import build_transform, build_loader
+from model_registry import ARCHITECTURES, best_checkpoint_path, load_model
+from myutils import get_logits
+from backends import TorchBackend, OnnxRuntimeBackend, measure_latency
 
-model = models.mobilenet_v2(weights=None)
-num_features = model.last_channel
-model.classifier = nn.Sequential(
-    nn.Linear(num_features, 3)
-)
-checkpoint = torch.load("../frontend/streamlit/bestMobileNetV2-more-images-5unfrozen_100.pth")
-model.load_state_dict(checkpoint)
-model.eval()
-
-dummy_input = torch.zeros(1,3,224,224)
-torch.onnx.export(model, dummy_input, "mobilenetforjs.onnx", verbose=True)
\ No newline at end of file
+# --------------------------------------------------------------------------
+# Exportação dos modelos do zoo para ONNX + otimização offline no ONNX Runtime
+# --------------------------------------------------------------------------
+# Para cada modelo gera, em --output-dir:
+#   <modelo>.onnx      grafo exportado (lote dinâmico, opset fixo)
+#   <modelo>.opt.onnx  grafo já otimizado pelo ONNX Runtime (fusões, constant folding),
+#                      carregado por backends.OnnxRuntimeBackend sem reotimizar
+# Depois confere a paridade numérica com o PyTorch num lote de amostra e compara a
+# latência dos dois backends (../results/onnx_latency.csv).
+# A MobileNetV2 também é copiada para mobilenetforjs.onnx, usado pelo front-end web.
+#
+# Ex.: python model_conversion.py --models MobileNetV2 EfficientNetB0 --output-dir ../frontend/streamlit
+
+ZOO = list(ARCHITECTURES)
+WEB_MODEL = "mobilenetforjs.onnx"
+
+
+class LogitsOnly(nn.Module):
+    """
+    Deixa a saída do grafo só com os logits (o ViT do transformers devolve um objeto).
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, images):
+        return get_logits(self.model(images))
+
+
+def default_checkpoint(model_name):
+    if model_name == "MobileNetV2":
+        return "../frontend/streamlit/bestMobileNetV2-more-images-5unfrozen_100.pth"
+    return best_checkpoint_path(model_name)
+
+
+def export_onnx(model, onnx_path, resolution=config.RESOLUTION, opset=config.ONNX_OPSET):
+    """
+    Exporta o modelo com a dimensão do lote dinâmica (entrada 'input', saída 'logits').
+    """
+    model.eval()
+    dummy_input = torch.randn(2, 3, resolution, resolution)
+    torch.onnx.export(LogitsOnly(model), dummy_input, onnx_path, input_names=["input"], output_names=["logits"],
+                      dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}}, opset_version=opset, dynamo=False)
+    return onnx_path
+
+
+def optimize_onnx(onnx_path, optimized_path):
+    """
+    Aplica as otimizações de grafo do ONNX Runtime uma única vez e salva o resultado.
+    Usa o nível EXTENDED: o ALL inclui transformações de layout específicas do hardware
+    de quem exporta, que não valem para outra máquina.
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    options.optimized_model_filepath = optimized_path
+    ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+    return optimized_path
+
+
+def sample_batch(resolution=config.RESOLUTION, num_images=16, data_dir=config.DATA_DIR_VAL):
+    """
+    Lote de imagens reais da validação (com o transform do treino); ruído se a pasta não existir.
+    """
+    if not os.path.isdir(data_dir):
+        return torch.randn(num_images, 3, resolution, resolution)
+    dataset = datasets.ImageFolder(data_dir, transform=build_transform(resolution), loader=build_loader(resolution))
+    indices = np.linspace(0, len(dataset) - 1, min(num_images, len(dataset))).astype(int)
+    return torch.stack([dataset[i][0] for i in indices])
+
+
+def check_parity(torch_backend, onnx_backend, images, atol=1e-3):
+    expected = torch_backend(images)
+    actual = onnx_backend(images)
+    max_abs_diff = (expected - actual).abs().max().item()
+    argmax_agreement = (expected.argmax(dim=1) == actual.argmax(dim=1)).float().mean().item()
+    return {"max_abs_diff": max_abs_diff, "argmax_agreement": argmax_agreement, "ok": max_abs_diff <= atol and argmax_agreement == 1.0}
+
+
+def convert(model_name, output_dir, checkpoint_path=None, resolution=config.RESOLUTION, atol=1e-3,
+            batch_sizes=(1, 8, 32), repeats=20):
+    """
+    Exporta, otimiza, valida e mede um modelo. Retorna as linhas do relatório de latência.
+    """
+    checkpoint_path = checkpoint_path or default_checkpoint(model_name)
+    model = load_model(model_name, checkpoint_path)
+
+    onnx_path = export_onnx(model, os.path.join(output_dir, f"{model_name}.onnx"), resolution)
+    optimized_path = optimize_onnx(onnx_path, os.path.join(output_dir, f"{model_name}.opt.onnx"))
+    if model_name == "MobileNetV2":
+        # O onnxruntime-web recebe o grafo sem as fusões específicas do ONNX Runtime nativo
+        shutil.copyfile(onnx_path, WEB_MODEL)
+
+    torch_backend = TorchBackend(model, "cpu")
+    onnx_backend = OnnxRuntimeBackend(optimized_path)
+    parity = check_parity(torch_backend, onnx_backend, sample_batch(resolution), atol)
+    status = "OK" if parity["ok"] else "FALHOU"
+    print(f"{model_name}: paridade {status} (diferença máx. {parity['max_abs_diff']:.2e}, "
+          f"argmax igual em {parity['argmax_agreement'] * 100:.1f}%)")
+
+    rows = []
+    for batch_size in batch_sizes:
+        for backend in (torch_backend, onnx_backend):
+            row = measure_latency(backend, batch_size, resolution, repeats=repeats)
+            rows.append({"model": model_name, **row, "max_abs_diff": parity["max_abs_diff"]})
+            print(f"  {backend.name:>11} | lote {batch_size:>3} | p50 {row['p50_ms']:8.2f} ms | "
+                  f"p90 {row['p90_ms']:8.2f} ms | {row['img_s']:8.1f} img/s")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta os modelos do zoo para ONNX e compara com o PyTorch")
+    parser.add_argument("--models", nargs="+", default=ZOO, choices=ZOO)
+    parser.add_argument("--checkpoint", help="Checkpoint (.pth) a usar; só com um modelo em --models")
+    parser.add_argument("--output-dir", default=config.ONNX_DIR)
+    parser.add_argument("--resolution", type=int, default=config.RESOLUTION)
+    parser.add_argument("--atol", type=float, default=1e-3, help="Diferença máxima aceita entre os logits")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--report", default="../results/onnx_latency.csv")
+    args = parser.parse_args()
+    if args.checkpoint and len(args.models) > 1:
+        parser.error("--checkpoint só pode ser usado com um único modelo")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    rows = []
+    for model_name in args.models:
+        rows += convert(model_name, args.output_dir, args.checkpoint, args.resolution, args.atol, args.batch_sizes, args.repeats)
+
+    report = pd.DataFrame(rows)
+    os.makedirs(os.path.dirname(args.report), exist_ok=True)
+    report.to_csv(args.report, index=False)
+    speedup = report.pivot_table(index=["model", "batch_size"], columns="backend", values="p50_ms")
+    print("\nSpeedup do ONNX Runtime (p50 PyTorch / p50 ONNX Runtime):")
+    print((speedup["pytorch"] / speedup["onnxruntime"]).round(2).to_string())
+    print(f"Relatório salvo em {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import os
+import sys
+import time
+import argparse
+import importlib
+import subprocess
+from functools import lru_cache
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import config
+
+# --------------------------------------------------------------------------
+# Registro único dos modelos do zoo
+# --------------------------------------------------------------------------
+# Cada arquitetura tem um builder que importa as bibliotecas pesadas (timm, transformers)
+# só quando ela é pedida: treinar uma ResNet18 não paga o import do transformers.
+#   build_model(): modelo novo, com a cabeça de 3 classes e o congelamento do treino
+#   load_model():  modelo treinado (checkpoint) em eval, em cache por processo
+# Os tempos de import e construção ficam em TIMINGS. Para medir o custo de inicialização
+# de cada script em processos novos:
+#   python model_registry.py --startup
+
+TIMINGS = {}
+ARCHITECTURES = {}
+ENTRY_POINTS = ["general_test", "model_conversion", "quantize", "distillation", "benchmark", "sweep"]
+
+
+def register(name):
+    def decorator(builder):
+        ARCHITECTURES[name] = builder
+        return builder
+    return decorator
+
+
+def _import(module):
+    """
+    Import sob demanda; guarda o tempo da primeira importação.
+    """
+    already_loaded = module in sys.modules
+    start = time.perf_counter()
+    mod = importlib.import_module(module)
+    if not already_loaded:
+        TIMINGS.setdefault(f"import {module}", time.perf_counter() - start)
+    return mod
+
+
+class DropoutLinear(nn.Linear):
+    """
+    nn.Linear com Dropout na entrada. O state_dict tem as mesmas chaves (weight, bias) de
+    um nn.Linear, então o checkpoint carrega em build_model(dropout=None) seja qual for
+    o dropout usado no treino.
+    """
+
+    def __init__(self, linear, p):
+        super().__init__(linear.in_features, linear.out_features, bias=linear.bias is not None,
+                         device=linear.weight.device, dtype=linear.weight.dtype)
+        self.load_state_dict(linear.state_dict())
+        self.p = p
+
+    def forward(self, x):
+        return super().forward(F.dropout(x, self.p, self.training))
+
+    def extra_repr(self):
+        return f"{super().extra_repr()}, p={self.p}"
+
+
+def _with_dropout(linear, p):
+    # Cabeça com Dropout opcional antes da camada linear final; a linear fica sempre no índice 0
+    return nn.Sequential(DropoutLinear(linear, p) if p else linear)
+
+
+@register("ResNet18")
+def _resnet18(pretrained, dropout):
+    models = _import("torchvision.models")
+    model = models.resnet18(weights='DEFAULT' if pretrained else None)
+    model.fc = _with_dropout(nn.Linear(model.fc.in_features, 3), dropout)
+    return model
+
+
+@register("EfficientNetB0")
+def _efficientnet_b0(pretrained, dropout):
+    models = _import("torchvision.models")
+    model = models.efficientnet_b0(weights='DEFAULT' if pretrained else None)
+    num_features = model.classifier[1].in_features
+    model.classifier = nn.Sequential(
+        nn.Dropout(p=0.2 if dropout is None else dropout, inplace=True), # Recomendado colocar de volta
+        nn.Linear(num_features, 3)
+    )
+    return model
+
+
+@register("MobileNetV2")
+def _mobilenet_v2(pretrained, dropout):
+    models = _import("torchvision.models")
+    model = models.mobilenet_v2(weights='DEFAULT' if pretrained else None)
+    model.classifier = nn.Sequential(nn.Linear(model.last_channel, 3))
+    checkpoint_path = "../best_model/MobileNetV2/bestMobileNetV2-more-images_100.pth"
+    if pretrained and os.path.exists(checkpoint_path):
+        # Parte de uma MobileNetV2 já ajustada ao dataset
+        model.load_state_dict(torch.load(checkpoint_path))
+    if dropout:
+        model.classifier = _with_dropout(model.classifier[0], dropout)
+    return model
+
+
+@register("ConvNext-Nano")
+def _convnext_nano(pretrained, dropout):
+    timm = _import("timm")
+    return timm.create_model('convnext_nano', pretrained=pretrained, num_classes=3, in_chans=3, drop_rate=dropout or 0.0)
+
+
+@register("ViTB16")
+def _vit_b16(pretrained, dropout):
+    transformers = _import("transformers")
+    if pretrained:
+        model = transformers.ViTForImageClassification.from_pretrained(
+            "google/vit-base-patch16-224",  # Modelo pré-treinado para 224x224
+            num_labels=3, ignore_mismatched_sizes=True
+        )
+    else:
+        # A configuração padrão do ViTConfig é a do vit-base-patch16-224: não precisa baixar nada
+        model = transformers.ViTForImageClassification(transformers.ViTConfig(num_labels=3))
+    if dropout:
+        model.classifier = DropoutLinear(model.classifier, dropout)
+    return model
+
+
+def _freeze(model, model_name, num_unfrozen):
+    if model_name in ("MobileNetV2", "EfficientNetB0"):
+        for child in list(model.features.children())[:-num_unfrozen]: # Deixa só as ultimas 'num_unfrozen' "partes" soltas
+            for param in child.parameters():
+                param.requires_grad = False
+
+
+def build_model(model_name, num_unfrozen=config.NUM_UNFROZEN, dropout=None, pretrained=True):
+    """
+    Cria o modelo com a cabeça de 3 classes e congela o que não é treinado.
+    'dropout=None' mantém as cabeças originais (Dropout 0.2 só na EfficientNetB0);
+    'num_unfrozen' só vale para MobileNetV2/EfficientNetB0. 'pretrained=False' pula o
+    download dos pesos (quando um checkpoint treinado vai ser carregado por cima).
+    """
+    if model_name not in ARCHITECTURES:
+        raise ValueError(f"Modelo desconhecido: {model_name}")
+    start = time.perf_counter()
+    model = ARCHITECTURES[model_name](pretrained, dropout)
+    _freeze(model, model_name, num_unfrozen)
+    TIMINGS[f"build {model_name}"] = time.perf_counter() - start
+    return model
+
+
+def best_checkpoint_path(model_name, num_unfrozen=config.NUM_UNFROZEN, num_epochs=config.NUM_EPOCHS):
+    """
+    Caminho padrão do melhor checkpoint salvo por general_test.run_experiment.
+    """
+    return f"../best_model/{model_name}/best{model_name}-more-images-{num_unfrozen}unfrozen_{num_epochs}.pth"
+
+
+@lru_cache(maxsize=None)
+def _load_model(model_name, checkpoint_path, mtime, device):
+    model = build_model(model_name, pretrained=False)
+    start = time.perf_counter()
+    model.load_state_dict(torch.load(checkpoint_path, map_location=device))
+    TIMINGS[f"load {os.path.basename(checkpoint_path)}"] = time.perf_counter() - start
+    return model.to(device).eval()
+
+
+def load_model(model_name, checkpoint_path=None, device="cpu"):
+    """
+    Modelo treinado em modo eval. Fica em cache no processo: chamadas repetidas com o
+    mesmo checkpoint (não modificado desde então) devolvem o mesmo objeto.
+    """
+    checkpoint_path = os.path.abspath(checkpoint_path or best_checkpoint_path(model_name))
+    return _load_model(model_name, checkpoint_path, os.path.getmtime(checkpoint_path), str(device))
+
+
+def startup_report():
+    return dict(TIMINGS)
+
+
+def _measure(code):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de inicialização dos scripts e de construção de cada modelo")
+    parser.add_argument("--startup", action="store_true", help="Mede o import de cada script em um processo novo")
+    parser.add_argument("--models", nargs="*", default=list(ARCHITECTURES), help="Modelos a construir (sem baixar pesos)")
+    args = parser.parse_args()
+
+    baseline = _measure("import torch")
+    print(f"{'interpretador + torch':>28}: {baseline:6.2f} s")
+    if args.startup:
+        for module in ENTRY_POINTS:
+            print(f"{'import ' + module:>28}: {_measure(f'import {module}'):6.2f} s")
+    for model_name in args.models:
+        code = f"import model_registry as r; r.build_model({model_name!r}, pretrained=False); print(r.startup_report())"
+        print(f"{'build ' + model_name:>28}: {_measure(code):6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,75 +1,202 @@
 import torch 
 import torch.nn as nn
-import torch.nn.functional as F
-from sklearn.metrics import classification_report, roc_auc_score
-from transformers import get_cosine_schedule_with_warmup
 import os 
 import time
 from tqdm import tqdm 
+from metrics import ConfusionMatrix
+from distributed import is_distributed, is_main_process, get_world_size, wrap_model, all_reduce_sum, broadcast_flag
+from checkpointing import AsyncCheckpointer, latest_checkpoint, load_checkpoint, capture_rng_state, restore_rng_state
+from predictions import save_predictions, sample_paths
+from instrumentation import Instrumentation, metrics_path
 
-def train(model, num_epochs, train_loader, val_loader, output_dir, model_name, device='cuda'): 
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+def normalize_batch(images, channels_last=False):
+        """
+        Converte um lote uint8 (0-255) para float e normaliza com a média/desvio do ImageNet,
+        uma vez por lote e já no device. Lotes float (ImageFolder com Normalize) passam direto.
+        O layout (channels_last ou contíguo) é acertado ainda em uint8, antes da conversão.
+        """
+        if images.dtype != torch.uint8:
+            return images
+        if images.dim() == 4:
+            images = images.contiguous(memory_format=torch.channels_last if channels_last else torch.contiguous_format)
+        mean = torch.tensor(IMAGENET_MEAN, device=images.device).view(1, -1, 1, 1) * 255
+        std = torch.tensor(IMAGENET_STD, device=images.device).view(1, -1, 1, 1) * 255
+        return (images.float() - mean) / std
+
+def prepare_batch(images, device, channels_last=False):
+        """
+        Copia o lote para o device, normaliza e, se pedido, converte para channels_last.
+        """
+        images = normalize_batch(images.to(device, non_blocking=True), channels_last)
+        if channels_last and images.dim() == 4:
+            images = images.contiguous(memory_format=torch.channels_last)
+        return images
+
+def precision_policy(device, precision='auto'):
+        """
+        Escolhe a precisão a partir do device. 'auto' usa fp16 + GradScaler na CUDA e
+        bfloat16 na CPU; também aceita 'fp16', 'bf16' e 'fp32'.
+        Retorna (tipo do device, dtype do autocast ou None para fp32, usa GradScaler).
+        """
+        device_type = torch.device(device).type
+        if precision == 'auto':
+            precision = {'cuda': 'fp16', 'cpu': 'bf16'}.get(device_type, 'fp32')
+        if precision == 'fp16':
+            return device_type, torch.float16, device_type == 'cuda'
+        if precision == 'bf16':
+            return device_type, torch.bfloat16, False
+        return device_type, None, False
+
+def autocast(device, precision='auto'):
+        device_type, dtype, _ = precision_policy(device, precision)
+        return torch.autocast(device_type, dtype=dtype, enabled=dtype is not None)
+
+def prepare_model(model, channels_last=False, compile_model=False):
+        """
+        Aplica channels_last e/ou torch.compile. Retorna o módulo usado no forward;
+        o state_dict continua sendo salvo a partir do modelo original.
+        """
+        if channels_last:
+            model = model.to(memory_format=torch.channels_last)
+        return torch.compile(model) if compile_model else model
+
+def get_logits(outputs):
+        """
+        Modelos do HuggingFace (ViT) devolvem um objeto com .logits; os demais, o tensor direto.
+        """
+        return getattr(outputs, 'logits', outputs)
+
+def trainable_parameters(model, model_name):
+        """
+        Parâmetros que o train entrega ao otimizador: só a cabeça (fc/head) na ResNet18 e na
+        ConvNext, os que têm requires_grad na ViT, MobileNetV2 e EfficientNetB0. O restante
+        fica congelado durante o treino.
+        """
+        name = model_name.lower()
+        if 'convnext' in name:
+            return list(model.head.parameters())
+        if 'vit' in name or 'mob' in name or 'eff' in name:
+            return [p for p in model.parameters() if p.requires_grad]
+        return list(model.fc.parameters())
+
+def train(model, num_epochs, train_loader, val_loader, output_dir, model_name, device='cuda',
+          precision='auto', channels_last=False, compile_model=False, resume=False, keep_last=3, weight_decay=None,
+          criterion=None, lr=None, instrumentation=None, profile_steps=None): 
+        """
+        'criterion' substitui a CrossEntropyLoss; se o train_loader entregar tensores extras
+        além de (imagens, rótulos), eles são repassados ao criterion (ex.: logits do professor
+        na destilação, ver distillation.py). Na validação o criterion recebe só (logits, rótulos).
+        'lr' substitui a taxa de aprendizado padrão da arquitetura.
+        Tempo por fase, imagens/s e pico de memória de cada época vão para
+        <output_dir>/<model_name>_metrics.csv (instrumentation.py); 'profile_steps=(a, b)'
+        grava um trace do torch.profiler desses passos de treino.
+        """
         start_time = time.time()
         patience=10
-        print(f'Iniciando treinamento...')
+        device_type, amp_dtype, use_scaler = precision_policy(device, precision)
+        print(f'Iniciando treinamento... (device: {device_type}, autocast: {amp_dtype or "fp32"}, GradScaler: {use_scaler})')
         curr_epoch = 0
-        criterion = torch.nn.CrossEntropyLoss()
-        scaler = torch.amp.GradScaler('cuda')
+        criterion = criterion or torch.nn.CrossEntropyLoss()
+        scaler = torch.amp.GradScaler(device_type, enabled=use_scaler)
+        # No modo distribuído o forward passa pelo DDP; o state_dict continua vindo de 'model'
+        runner = prepare_model(wrap_model(model, device) if is_distributed() else model, channels_last, compile_model)
+        world_size = get_world_size()
+        instrumentation = instrumentation or Instrumentation(metrics_path(output_dir, model_name), profile_steps, device=device)
         
         cond1 = ('vit' in model_name.lower())
         cond2 = ('convnext' in model_name.lower())
         cond3 = ('mob' in model_name.lower())
         cond4 = ('eff' in model_name.lower())
         condition = cond1 or cond2 or cond3 or cond4
+        params = trainable_parameters(model, model_name)
         if condition:
             if cond1 or cond3 or cond4:
-                optimizer = torch.optim.AdamW(filter(lambda p: p.requires_grad, model.parameters()), lr=1e-5)
+                optimizer = torch.optim.AdamW(params, lr=lr or 1e-5,
+                                              weight_decay=0.01 if weight_decay is None else weight_decay)
             elif cond2:
-                optimizer = torch.optim.AdamW(model.head.parameters(), lr=0.001, weight_decay=0.05)
+                optimizer = torch.optim.AdamW(params, lr=lr or 0.001, weight_decay=0.05 if weight_decay is None else weight_decay)
+            from transformers import get_cosine_schedule_with_warmup  # Import pesado, só quando usado
             scheduler = get_cosine_schedule_with_warmup(
             optimizer,
             num_warmup_steps=0.1 * num_epochs * len(train_loader),  # Warmup de 5 épocas
             num_training_steps=num_epochs * len(train_loader),  # Total de épocas
             )
         else:
-            optimizer = torch.optim.AdamW(model.fc.parameters(), lr=0.001, weight_decay=0.05)
+            optimizer = torch.optim.AdamW(params, lr=lr or 0.001, weight_decay=0.05 if weight_decay is None else weight_decay)
             scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer,mode = 'max', patience = 10, factor = 0.1)
 
         best_epoch = 0
         best_loss = float('+inf')
         current_lr = 0
         patience_limit = 0
+        start_epoch = 0
+
+        # Checkpoints completos (para retomar o treino) ficam em <output_dir>/checkpoints/<model_name>/
+        checkpoint_dir = os.path.join(output_dir, 'checkpoints', model_name)
+        checkpointer = AsyncCheckpointer(checkpoint_dir, keep_last=keep_last)
+        checkpoint_path = latest_checkpoint(checkpoint_dir) if resume else None
+        if checkpoint_path is not None:
+            state = load_checkpoint(checkpoint_path, device)
+            model.load_state_dict(state['model'])
+            optimizer.load_state_dict(state['optimizer'])
+            scheduler.load_state_dict(state['scheduler'])
+            scaler.load_state_dict(state['scaler'])
+            restore_rng_state(state['rng'])
+            start_epoch = state['epoch'] + 1
+            best_loss, best_epoch = state['best_loss'], state['best_epoch']
+            patience_limit, current_lr = state['patience_limit'], state['current_lr']
+            curr_epoch = start_epoch
+            print(f'Retomando de {checkpoint_path} (época {start_epoch + 1})')
+        elif resume:
+            print(f'Nenhum checkpoint em {checkpoint_dir}, começando do zero')
         
-        for epoch in tqdm(range(num_epochs)):
+        for epoch in tqdm(range(start_epoch, num_epochs)):
             model.train()
-            running_loss = 0.0
+            running_loss = torch.zeros((), device=device)
+            train_images = 0
+            train_start = time.time()
             
-            all_preds, all_labels, all_proba = [], [], []
+            train_cm = ConfusionMatrix(device=device)
+            instrumentation.start('train')
             print(f'Epoch: {epoch + 1}....')
+            if hasattr(train_loader.dataset, 'set_epoch'):
+                train_loader.dataset.set_epoch(epoch)  # Nova ordem dos shards a cada época
+            if hasattr(train_loader.sampler, 'set_epoch'):
+                train_loader.sampler.set_epoch(epoch)  # DistributedSampler
 
-            for images, labels in train_loader:
-                images, labels = images.to(device), labels.to(device)
-                optimizer.zero_grad()
-                with torch.amp.autocast('cuda'):
-                    outputs = model(images)
-                    if cond1:
-                        logits = outputs.logits
-                    else:
-                        logits = outputs
-                    loss = criterion(logits, labels)
-                scaler.scale(loss).backward()  
-                scaler.step(optimizer)
-                scaler.update()
-                if condition:
-                    scheduler.step()
-                running_loss += loss.item()
-                train_pred_class = torch.argmax(logits, dim=1)
-                probabilities = torch.softmax(logits, dim=1)
-
-                all_proba.extend(probabilities[:, 1].detach().cpu().numpy())
-                all_preds.extend(train_pred_class.detach().cpu().numpy())
-                all_labels.extend(labels.cpu().numpy())
-
-            train_report_dict = classification_report(all_labels, all_preds, output_dict=True)
+            for images, labels, *extra in instrumentation.batches(train_loader):
+                with instrumentation.phase('h2d'):
+                    images, labels = prepare_batch(images, device, channels_last), labels.to(device, non_blocking=True)
+                    extra = [tensor.to(device, non_blocking=True) for tensor in extra]
+                with instrumentation.phase('forward'):
+                    optimizer.zero_grad()
+                    with autocast(device, precision):
+                        outputs = runner(images)
+                        logits = get_logits(outputs)
+                        loss = criterion(logits, labels, *extra)
+                with instrumentation.phase('backward'):
+                    scaler.scale(loss).backward()  
+                with instrumentation.phase('optimizer'):
+                    scaler.step(optimizer)
+                    scaler.update()
+                    if condition:
+                        scheduler.step()
+                with instrumentation.phase('metrics'):
+                    running_loss += loss.detach()
+                    train_cm.update(logits, labels)
+                train_images += labels.shape[0]
+                instrumentation.step(labels.shape[0])
+
+            # Distribuído: soma perdas e matrizes de todos os processos antes das métricas
+            with instrumentation.phase('report'):
+                running_loss = all_reduce_sum(running_loss).item() / world_size
+                train_cm.all_reduce()
+                train_report_dict = train_cm.report()
+            train_throughput = train_images / (time.time() - train_start)
+            train_stats = instrumentation.end()
 
             
             train_accuracy = train_report_dict['accuracy']
@@ -79,29 +206,34 @@ def train(model, num_epochs, train_loader, val_loader, output_dir, model_name, d
 
             
             model.eval()
-            val_loss = 0.0
-            va_preds, va_labels, va_proba = [], [], []
+            val_loss = torch.zeros((), device=device)
+            val_cm = ConfusionMatrix(device=device)
+            val_images = 0
+            val_start = time.time()
+            instrumentation.start('val')
 
             with torch.no_grad():
-                for images, labels in val_loader:
-                    images, labels = images.to(device), labels.to(device)
-
-                    with torch.amp.autocast('cuda'):
-                        outputs = model(images)
-                        if cond1:
-                            logits = outputs.logits
-                        else:
-                            logits = outputs
-                        loss = criterion(logits, labels)
-                    val_loss += loss.item()
+                for images, labels in instrumentation.batches(val_loader):
+                    with instrumentation.phase('h2d'):
+                        images, labels = prepare_batch(images, device, channels_last), labels.to(device, non_blocking=True)
 
-                    pred_class = torch.argmax(logits, dim=1)
-                    probabilities = torch.softmax(logits, dim=1)
-                    va_proba.extend(probabilities[:, 1].detach().cpu().numpy())
-                    va_preds.extend(pred_class.detach().cpu().numpy())
-                    va_labels.extend(labels.cpu().numpy())
+                    with instrumentation.phase('forward'):
+                        with autocast(device, precision):
+                            outputs = runner(images)
+                            logits = get_logits(outputs)
+                            loss = criterion(logits, labels)
+                    with instrumentation.phase('metrics'):
+                        val_loss += loss.detach()
+                        val_cm.update(logits, labels)
+                    val_images += labels.shape[0]
+                    instrumentation.step(labels.shape[0])
             
-            val_report_dict = classification_report(va_labels, va_preds, output_dict=True)
+            with instrumentation.phase('report'):
+                val_loss = all_reduce_sum(val_loss).item() / world_size
+                val_cm.all_reduce()
+                val_report_dict = val_cm.report()
+            val_throughput = val_images / (time.time() - val_start)
+            val_stats = instrumentation.end()
 
             
             val_accuracy = val_report_dict['accuracy']
@@ -112,12 +244,14 @@ def train(model, num_epochs, train_loader, val_loader, output_dir, model_name, d
             if not condition:
                 scheduler.step(val_loss)
 
-            if val_loss < best_loss:
+            is_best = val_loss < best_loss
+            if is_best:
                 best_loss = val_loss
                 best_epoch = epoch + 1
                 patience_limit  = 0# Salva o limiar ótimo
                 os.makedirs(output_dir, exist_ok=True)
-                torch.save(model.state_dict(), os.path.join(output_dir, f"{model_name}_{num_epochs}.pth"))
+                if is_main_process():
+                    checkpointer.submit(model.state_dict(), os.path.join(output_dir, f"{model_name}_{num_epochs}.pth"))
             else:
                 patience_limit+=1
             # Logs de treinamento
@@ -130,51 +264,99 @@ def train(model, num_epochs, train_loader, val_loader, output_dir, model_name, d
                 f"Val Prec: {val_precision_class_0:.4f} | "
                 f"Val Rec: {val_recall_macro_avg:.4f} | "
                 f"Val F1: {val_f1_weighted_avg:.4f}|")
+            print(f"Throughput: {train_throughput:.1f} img/s (treino) | {val_throughput:.1f} img/s (validação)")
+            
+            instrumentation.log({
+                'epoch': epoch + 1,
+                'train_loss': running_loss / len(train_loader),
+                'train_accuracy': train_accuracy,
+                'val_loss': val_loss / len(val_loader),
+                'val_accuracy': val_accuracy,
+                'lr': optimizer.param_groups[0]['lr'],
+                **train_stats,
+                **val_stats,
+            })
             
             if current_lr != optimizer.param_groups[0]['lr']:
                 for i, group in enumerate(optimizer.param_groups):
                     print(f"Grupo {i}: LR = {group['lr']}, Parâmetros = {len(group['params'])}")
                 current_lr = optimizer.param_groups[0]['lr']
-            if patience_limit >=patience:
+
+            if is_main_process():
+                checkpointer.save({
+                    'model': model.state_dict(),
+                    'optimizer': optimizer.state_dict(),
+                    'scheduler': scheduler.state_dict(),
+                    'scaler': scaler.state_dict(),
+                    'rng': capture_rng_state(),
+                    'epoch': epoch,
+                    'best_loss': best_loss,
+                    'best_epoch': best_epoch,
+                    'patience_limit': patience_limit,
+                    'current_lr': current_lr,
+                }, epoch + 1, is_best=is_best)
+            # O rank 0 decide o early stopping e repassa a decisão aos demais processos
+            if broadcast_flag(patience_limit >=patience):
                 print(f"Early Stopping triggered with {epoch} epochs!")
                 break
             curr_epoch+=1
 
+        instrumentation.close()
+        checkpointer.close()  # Espera as gravações pendentes antes de quem chamou ler o .pth
         total_time = (time.time() - start_time) / 60
         
         print(f'Training Took: {total_time:.2f} minutes!')
-        print(f'With an average of {total_time /curr_epoch:.2f} minutes per epoch!')
+        print(f'With an average of {total_time / max(curr_epoch - start_epoch, 1):.2f} minutes per epoch!')
         
         return best_loss, best_epoch
 
     #----Função de Teste do modelo.
-def test(model, test_loader, model_name, device='cuda'):
-        test_preds = []
-        test_labels = []
-        test_proba = []
-        test_loss = 0.0
+def test(model, test_loader, model_name, device='cuda', precision='auto', channels_last=False, compile_model=False,
+         predictions_path=None, instrumentation=None):
+        """
+        'model' pode ser um nn.Module ou um backend de backends.py (TorchBackend/OnnxRuntimeBackend).
+        Com 'predictions_path', grava logits, rótulos e caminhos de cada amostra (predictions.py).
+        Com uma 'instrumentation' que tenha arquivo de métricas, o tempo por fase entra nele
+        numa linha 'test'.
+        """
+        test_cm = ConfusionMatrix(device=device)
+        test_loss = torch.zeros((), device=device)
         criterion = nn.CrossEntropyLoss()
-        model.eval()  
-        cond1 = ('vit' in model_name.lower())
+        if isinstance(model, nn.Module):
+            model.eval()  
+            runner = prepare_model(model, channels_last, compile_model)
+        else:
+            # Backend de inferência (backends.py), ex.: sessão do ONNX Runtime
+            runner = model
+        test_images = 0
+        all_logits, all_labels = [], []  # Ficam no device; uma cópia para a CPU no fim
+        instrumentation = instrumentation or Instrumentation(device=device)
+        instrumentation.start('test')
+        test_start = time.time()
         with torch.no_grad():  
-            for images, labels in test_loader:
-                images, labels = images.to(device), labels.to(device)
-
-                with torch.amp.autocast('cuda'):
-                    outputs = model(images)
-                    if cond1:
-                        logits = outputs.logits
-                    else:
-                        logits = outputs
-                    loss = criterion(logits, labels)
-                test_loss += loss.item()
-                test_pred_class = torch.argmax(logits, dim=1)
-                probabilities = torch.softmax(logits, dim=1)
-                test_proba.extend(probabilities[:,1].detach().cpu().numpy())
-                test_preds.extend(test_pred_class.detach().cpu().numpy())
-                test_labels.extend(labels.cpu().numpy())
+            for images, labels in instrumentation.batches(test_loader):
+                with instrumentation.phase('h2d'):
+                    images, labels = prepare_batch(images, device, channels_last), labels.to(device, non_blocking=True)
+
+                with instrumentation.phase('forward'):
+                    with autocast(device, precision):
+                        outputs = runner(images)
+                        logits = get_logits(outputs)
+                        loss = criterion(logits, labels)
+                with instrumentation.phase('metrics'):
+                    test_loss += loss.detach()
+                    test_cm.update(logits, labels)
+                test_images += labels.shape[0]
+                instrumentation.step(labels.shape[0])
+                if predictions_path:
+                    all_logits.append(logits.detach().float())
+                    all_labels.append(labels)
                
-        test_report_dict = classification_report(test_labels, test_preds, output_dict=True)
+        with instrumentation.phase('report'):
+            test_loss = test_loss.item()
+            test_report_dict = test_cm.report()
+        test_throughput = test_images / (time.time() - test_start)
+        test_stats = instrumentation.end()
 
             
         test_accuracy = test_report_dict['accuracy']
@@ -189,6 +371,12 @@ def test(model, test_loader, model_name, device='cuda'):
             f"Test Rec: {test_recall_macro_avg:.4f} | "
             f"Test F1: {test_f1_weighted_avg:.4f}|")
           #  f"Test ROC-AUC: {test_auc:.4f}")
+        print(f"Throughput: {test_throughput:.1f} img/s (teste)")
+        if predictions_path:
+            save_predictions(predictions_path, torch.cat(all_logits).cpu().numpy(), torch.cat(all_labels).cpu().numpy(),
+                             sample_paths(test_loader), getattr(test_loader.dataset, 'classes', None), model=model_name)
+            print(f"Predições por amostra salvas em {predictions_path}")
+        instrumentation.log({'epoch': 'test', 'test_loss': test_loss / len(test_loader), 'test_accuracy': test_accuracy, **test_stats})
 
 
         return test_loss / len(test_loader), test_accuracy, test_precision_class_0, test_recall_macro_avg, test_f1_weighted_avg
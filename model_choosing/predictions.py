@@ -0,0 +1,116 @@
+import os
+import json
+import hashlib
+import numpy as np
+from torch.utils.data import SequentialSampler
+import config
+from metrics import classification_report_from_matrix
+
+# --------------------------------------------------------------------------
+# Predições por amostra do teste, salvas em disco
+# --------------------------------------------------------------------------
+# myutils.test(..., predictions_path=...) grava os logits, rótulos e caminhos de cada
+# imagem do teste num .npz em PREDICTIONS_DIR, com o hash do checkpoint no nome
+# (<modelo>-<hash>.npz). Matriz de confusão, classification report, curva de
+# calibração e os piores erros saem desse arquivo em milissegundos, sem carregar o
+# modelo nem decodificar imagens (ver confusion.py).
+
+
+def checkpoint_hash(checkpoint_path):
+    digest = hashlib.sha1()
+    with open(checkpoint_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def store_path(model_name, checkpoint_path, tag="", predictions_dir=config.PREDICTIONS_DIR):
+    """
+    Caminho do .npz das predições do checkpoint. 'tag' separa avaliações do mesmo
+    checkpoint por outros backends (ex.: "onnx").
+    """
+    name = f"{model_name}-{tag}" if tag else model_name
+    return os.path.join(predictions_dir, f"{name}-{checkpoint_hash(checkpoint_path)}.npz")
+
+
+def sample_paths(loader):
+    """
+    Caminhos das amostras na ordem em que o loader as entrega; vazios quando a ordem
+    não é a do dataset (shuffle, sampler distribuído, shards).
+    """
+    samples = getattr(loader.dataset, "samples", None)
+    if samples is None or not isinstance(loader.sampler, SequentialSampler):
+        return None
+    return [path for path, _ in samples]
+
+
+def save_predictions(path, logits, labels, paths=None, classes=None, **meta):
+    logits = np.asarray(logits, dtype=np.float32)
+    labels = np.asarray(labels, dtype=np.int64)
+    if paths is None or len(paths) != len(labels):
+        paths = [""] * len(labels)
+    classes = classes or [str(i) for i in range(logits.shape[1])]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path[:-len(".npz")] + ".tmp.npz"
+    np.savez_compressed(tmp_path, logits=logits, labels=labels, paths=np.asarray(paths, dtype=str),
+                        classes=np.asarray(classes, dtype=str), meta=np.asarray(json.dumps(meta)))
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_predictions(path):
+    """
+    Retorna dict com logits (N x C), labels (N), paths (N), classes (C) e meta.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        store = {key: data[key] for key in ("logits", "labels", "paths", "classes")}
+        store["meta"] = json.loads(str(data["meta"]))
+    store["classes"] = store["classes"].tolist()
+    return store
+
+
+def probabilities(store):
+    logits = store["logits"] - store["logits"].max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def confusion_matrix(store):
+    num_classes = len(store["classes"])
+    preds = store["logits"].argmax(axis=1)
+    idx = store["labels"] * num_classes + preds
+    return np.bincount(idx, minlength=num_classes ** 2).reshape(num_classes, num_classes)
+
+
+def classification_report(store):
+    return classification_report_from_matrix(confusion_matrix(store))
+
+
+def calibration_curve(store, num_bins=15):
+    """
+    Confiança média x acurácia por faixa de confiança da classe predita.
+    Retorna (confiança, acurácia, amostras por faixa, ECE).
+    """
+    probs = probabilities(store)
+    confidence = probs.max(axis=1)
+    correct = (probs.argmax(axis=1) == store["labels"]).astype(float)
+    bins = np.minimum((confidence * num_bins).astype(int), num_bins - 1)
+    counts = np.bincount(bins, minlength=num_bins)
+    with np.errstate(invalid="ignore"):
+        mean_confidence = np.bincount(bins, weights=confidence, minlength=num_bins) / counts
+        accuracy = np.bincount(bins, weights=correct, minlength=num_bins) / counts
+    ece = np.nansum(np.abs(accuracy - mean_confidence) * counts) / max(counts.sum(), 1)
+    return mean_confidence, accuracy, counts, ece
+
+
+def worst_mistakes(store, k=16):
+    """
+    Os 'k' erros com maior confiança na classe errada: [(caminho, real, predito, confiança)].
+    """
+    probs = probabilities(store)
+    preds = probs.argmax(axis=1)
+    wrong = np.flatnonzero(preds != store["labels"])
+    order = wrong[np.argsort(-probs[wrong, preds[wrong]])][:k]
+    classes = store["classes"]
+    return [(str(store["paths"][i]), classes[store["labels"][i]], classes[preds[i]], float(probs[i, preds[i]]))
+            for i in order]
@@ -0,0 +1,98 @@
+import math
+from functools import partial
+import numpy as np
+import torch
+from torch.utils.data import default_collate
+from PIL import Image
+
+# --------------------------------------------------------------------------
+# Decodificação de imagens perto da resolução de destino
+# --------------------------------------------------------------------------
+# Um frame 4K decodificado inteiro em RGB ocupa ~25 MB só para virar 224x224 logo depois.
+# Aqui o JPEG é decodificado em modo draft (o decoder já reduz por 1/2, 1/4 ou 1/8 no
+# domínio DCT) e os demais formatos passam por Image.reduce (média em blocos), sempre
+# mantendo pelo menos o tamanho pedido. O Resize do transform continua fazendo o ajuste fino.
+# A imagem resultante também é limitada a 'max_pixels'. Em PNG o ganho é só no Resize:
+# o formato não permite decodificar em escala reduzida, então o pico de memória não muda.
+#
+# Usado pelo front-end (prévia e inferência) e pelos ImageFolder do treino/teste.
+#
+# Lotes uint8: com to_uint8_array no fim do transform, os workers do DataLoader devolvem
+# a imagem como uint8 HWC (1/4 dos bytes de um float32 na memória compartilhada) e
+# batch_collate monta o lote (N, 3, H, W) uint8. Conversão para float e Normalize rodam
+# uma vez por lote, já no device (myutils.normalize_batch).
+# Não importa config, para poder ser usado fora de model_choosing/.
+
+MAX_DECODE_PIXELS = 4096 * 4096
+PREVIEW_SIDE = 1024
+
+
+def _reduce_to(image, width, height, max_pixels):
+    """
+    Maior redução inteira que mantém o tamanho >= (width, height) e respeita max_pixels.
+    """
+    factor = max(1, min(image.width // max(width, 1), image.height // max(height, 1)))
+    if max_pixels and image.width * image.height > max_pixels:
+        factor = max(factor, math.ceil(math.sqrt(image.width * image.height / max_pixels)))
+    return image.reduce(factor) if factor > 1 else image
+
+
+def open_image(source, target_size=None, max_pixels=MAX_DECODE_PIXELS):
+    """
+    Abre 'source' (caminho ou arquivo) em RGB, decodificando o mais perto possível de
+    target_size=(largura, altura). Sem target_size, só aplica o limite de pixels.
+    """
+    image = Image.open(source)
+    width, height = target_size or image.size
+    if max_pixels and width * height > max_pixels:
+        scale = math.sqrt(max_pixels / (width * height))
+        width, height = max(1, int(width * scale)), max(1, int(height * scale))
+    image.draft("RGB", (width, height))  # Só tem efeito em JPEG
+    image = image.convert("RGB")
+    return _reduce_to(image, width, height, max_pixels)
+
+
+def preview_image(source, max_side=PREVIEW_SIDE):
+    """
+    Miniatura para exibição com o lado maior <= max_side, sem decodificar a imagem inteira.
+    """
+    with Image.open(source) as probe:
+        scale = min(1.0, max_side / max(probe.size))
+        size = (max(1, int(probe.width * scale)), max(1, int(probe.height * scale)))
+    if hasattr(source, "seek"):
+        source.seek(0)
+    image = open_image(source, size)
+    image.thumbnail((max_side, max_side))
+    return image
+
+
+def _load_path(path, target_size, max_pixels):
+    with open(path, "rb") as f:
+        return open_image(f, target_size, max_pixels)
+
+
+def image_loader(resolution, max_pixels=MAX_DECODE_PIXELS):
+    """
+    'loader' para datasets.ImageFolder que decodifica perto de resolution x resolution.
+    Picklable, então funciona com os workers do DataLoader.
+    """
+    return partial(_load_path, target_size=(resolution, resolution), max_pixels=max_pixels)
+
+
+def to_uint8_array(image):
+    """
+    Último passo do transform no modo uint8: PIL RGB -> array uint8 HxWx3.
+    """
+    return np.array(image, dtype=np.uint8)
+
+
+def batch_collate(batch):
+    """
+    collate_fn que aceita as amostras de to_uint8_array: empilha em (N, H, W, 3) uint8 (na
+    memória compartilhada quando roda num worker) e devolve a vista (N, 3, H, W), que já
+    está em channels_last. Demais amostras (tensores float, cache uint8) seguem o collate padrão.
+    """
+    if not isinstance(batch[0][0], np.ndarray):
+        return default_collate(batch)
+    images = default_collate([torch.from_numpy(sample[0]) for sample in batch]).permute(0, 3, 1, 2)
+    return [images, *default_collate([sample[1:] for sample in batch])]
@@ -0,0 +1,151 @@
+import os
+import copy
+import argparse
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Subset
+from torchvision import datasets
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+from onnxruntime.quantization.shape_inference import quant_pre_process
+import config
+from eval_utils import build_transform, build_loader, append_results
+from model_registry import best_checkpoint_path, load_model
+from model_conversion import export_onnx
+from backends import TorchBackend, load_artifact, measure_latency
+from myutils import test
+
+# --------------------------------------------------------------------------
+# Quantização estática INT8 pós-treino (CPU)
+# --------------------------------------------------------------------------
+# 1. Carrega o checkpoint treinado de ../best_model/<modelo>/
+# 2. PyTorch (FX): funde conv/bn/relu, insere observadores, calibra com amostras de
+#    config.DATA_DIR_VAL e converte para INT8 -> <modelo>.int8.pt (TorchScript)
+# 3. ONNX: exporta o fp32 e quantiza no ONNX Runtime (formato QDQ) com as mesmas
+#    amostras de calibração -> <modelo>.int8.onnx
+# 4. Roda myutils.test no fp32 e nos dois INT8 e registra acurácia, diferença para o
+#    fp32, tamanho e latência em ../results/quantization_<modelo>.csv
+#
+# Os artefatos INT8 são carregados direto por backends.load_artifact (servidor e front-end).
+# O ViT não entra: o modelo do transformers não é rastreável pelo FX.
+
+QUANTIZABLE = ["MobileNetV2", "EfficientNetB0", "ResNet18", "ConvNext-Nano"]
+
+
+def calibration_batches(num_samples, batch_size=config.BATCH_SIZE, resolution=config.RESOLUTION, data_dir=config.DATA_DIR_VAL):
+    """
+    Amostra aleatória (semente fixa) da validação, já com o transform do treino.
+    """
+    dataset = datasets.ImageFolder(data_dir, transform=build_transform(resolution), loader=build_loader(resolution))
+    rng = np.random.default_rng(config.RANDOM_SEED)
+    indices = rng.choice(len(dataset), size=min(num_samples, len(dataset)), replace=False)
+    loader = DataLoader(Subset(dataset, indices.tolist()), batch_size=batch_size, num_workers=4)
+    return [images for images, _ in loader]
+
+
+def quantize_fx(model, batches, engine="x86"):
+    """
+    prepare_fx faz a fusão conv/bn/relu e insere os observadores; convert_fx gera os kernels INT8.
+    """
+    torch.backends.quantized.engine = engine
+    model.eval()
+    prepared = prepare_fx(model, get_default_qconfig_mapping(engine), (batches[0],))
+    with torch.no_grad():
+        for images in batches:
+            prepared(images)
+    return convert_fx(prepared)
+
+
+def save_torchscript(quantized, example, path, engine):
+    with torch.no_grad():
+        traced = torch.jit.trace(quantized, example)
+    torch.jit.save(traced, path, _extra_files={"quantized_engine": engine})
+    return path
+
+
+class _CalibrationReader(CalibrationDataReader):
+    def __init__(self, batches, input_name="input"):
+        self._batches = iter([{input_name: images.numpy()} for images in batches])
+
+    def get_next(self):
+        return next(self._batches, None)
+
+
+def quantize_onnx(model, batches, output_dir, model_name, resolution=config.RESOLUTION):
+    """
+    fp32 -> ONNX -> pré-processamento (shape inference + otimização) -> INT8 QDQ.
+    """
+    onnx_path = export_onnx(model, os.path.join(output_dir, f"{model_name}.onnx"), resolution)
+    prep_path = os.path.join(output_dir, f"{model_name}.prep.onnx")
+    quant_pre_process(onnx_path, prep_path)
+    int8_path = os.path.join(output_dir, f"{model_name}.int8.onnx")
+    quantize_static(prep_path, int8_path, _CalibrationReader(batches), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+    os.remove(prep_path)
+    return int8_path
+
+
+def evaluate(name, backend, size_bytes, test_loader, model_name, resolution):
+    """
+    Teste em fp32 (sem autocast, para comparar só o efeito da quantização) + latência na CPU.
+    """
+    loss, acc, prec, rec, f1 = test(backend, test_loader, model_name, "cpu", precision="fp32")
+    single = measure_latency(backend, 1, resolution)
+    batched = measure_latency(backend, config.BATCH_SIZE, resolution)
+    return {
+        "Model": model_name,
+        "Variant": name,
+        "Test_Loss": loss,
+        "Test_Acuracia": acc,
+        "Test_F1-Score": f1,
+        "Size_MB": size_bytes / 2 ** 20,
+        "Latency_b1_ms": single["p50_ms"],
+        f"Throughput_b{config.BATCH_SIZE}_img_s": batched["img_s"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantização estática INT8 (PyTorch e ONNX) de um modelo treinado")
+    parser.add_argument("--model", default="MobileNetV2", choices=QUANTIZABLE)
+    parser.add_argument("--checkpoint", help="Padrão: ../best_model/<modelo>/best<modelo>-more-images-<N>unfrozen_<épocas>.pth")
+    parser.add_argument("--calibration-samples", type=int, default=config.CALIBRATION_SAMPLES)
+    parser.add_argument("--engine", default=config.QUANTIZED_ENGINE, choices=["x86", "fbgemm", "qnnpack", "onednn"])
+    parser.add_argument("--output-dir", default=config.QUANTIZED_DIR)
+    parser.add_argument("--resolution", type=int, default=config.RESOLUTION)
+    args = parser.parse_args()
+
+    model_name = args.model
+    checkpoint_path = args.checkpoint or best_checkpoint_path(model_name)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    model = load_model(model_name, checkpoint_path)
+
+    batches = calibration_batches(args.calibration_samples, resolution=args.resolution)
+    print(f"Calibrando com {sum(len(b) for b in batches)} imagens de {config.DATA_DIR_VAL}")
+
+    quantized = quantize_fx(copy.deepcopy(model), batches, args.engine)
+    int8_pt = save_torchscript(quantized, batches[0][:1], os.path.join(args.output_dir, f"{model_name}.int8.pt"), args.engine)
+    int8_onnx = quantize_onnx(model, batches, args.output_dir, model_name, args.resolution)
+    print(f"Artefatos salvos: {int8_pt}, {int8_onnx}")
+
+    test_dataset = datasets.ImageFolder(config.DATA_DIR_TEST, transform=build_transform(args.resolution), loader=build_loader(args.resolution))
+    test_loader = DataLoader(test_dataset, batch_size=config.BATCH_SIZE, shuffle=False, num_workers=8)
+
+    rows = [
+        evaluate("fp32", TorchBackend(model), os.path.getsize(checkpoint_path), test_loader, model_name, args.resolution),
+        evaluate("int8-pytorch", load_artifact(int8_pt), os.path.getsize(int8_pt), test_loader, model_name, args.resolution),
+        evaluate("int8-onnx", load_artifact(int8_onnx), os.path.getsize(int8_onnx), test_loader, model_name, args.resolution),
+    ]
+    csv_path = f"../results/quantization_{model_name}.csv"
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    for row in rows:
+        row["Delta_Acuracia"] = row["Test_Acuracia"] - rows[0]["Test_Acuracia"]
+        append_results(row, csv_path)
+        print(f"{row['Variant']:>13} | acc {row['Test_Acuracia']:.4f} ({row['Delta_Acuracia']:+.4f}) | "
+              f"{row['Size_MB']:6.1f} MB | {row['Latency_b1_ms']:7.2f} ms (lote 1)")
+    print(f"Resultados adicionados em {csv_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import io
+import os
+import json
+import random
+import tarfile
+from torch.utils.data import IterableDataset, get_worker_info
+import config
+from preprocessing import open_image
+from distributed import get_rank, get_world_size
+
+# --------------------------------------------------------------------------
+# Leitura dos shards .tar gerados por dataset-processing/data_spliting.py --format shards
+# --------------------------------------------------------------------------
+# Os shards são lidos sequencialmente (sem leituras aleatórias de arquivos pequenos).
+# A aleatoriedade vem de duas etapas: a ordem dos shards é embaralhada a cada época
+# e as amostras passam por um buffer de embaralhamento em memória.
+#
+# No treino distribuído, a divisão entre processos é por índice de amostra (na ordem
+# dos shards da época, igual em todos os processos): o processo r fica com as amostras
+# r, r + N, r + 2N, ... e todos param em len(dataset), então cada processo roda o mesmo
+# número de passos (os all-reduce de myutils.train não ficam esperando um processo que
+# já terminou). Dentro de um processo, os shards inteiros são divididos entre os workers.
+
+
+class ShardedImageDataset(IterableDataset):
+    """
+    Dataset iterável sobre os shards de um split. Cada worker do DataLoader lê um
+    subconjunto disjunto dos shards; no treino distribuído, cada processo entrega
+    exatamente len(dataset) amostras (as sobras da divisão por processos são descartadas).
+    Chame set_epoch() antes de cada época para variar a ordem quando shuffle=True.
+    Com 'resolution', a imagem é decodificada perto de resolution x resolution
+    (preprocessing.open_image); sem ela, só o limite de pixels é aplicado.
+    """
+
+    def __init__(self, split, shards_dir=config.SHARDS_DIR, transform=None, shuffle=False,
+                 buffer_size=1000, seed=config.RANDOM_SEED, rank=None, world_size=None, resolution=None):
+        with open(os.path.join(shards_dir, "index.json")) as f:
+            index = json.load(f)
+        self.shards_dir = shards_dir
+        self.shards = index["splits"][split]
+        self.classes = index["classes"]
+        self.class_to_idx = index["class_to_idx"]
+        self.transform = transform
+        self.target_size = (resolution, resolution) if resolution else None
+        self.shuffle = shuffle
+        self.buffer_size = buffer_size
+        self.seed = seed
+        self.epoch = 0
+        # Lido na criação (processo do treino), não dentro dos workers do DataLoader
+        self.rank = get_rank() if rank is None else rank
+        self.world_size = get_world_size() if world_size is None else world_size
+        assert len(self.shards) >= self.world_size, \
+            f"Split '{split}' tem {len(self.shards)} shards para {self.world_size} processos; gere shards menores"
+
+    def __len__(self):
+        return sum(shard["count"] for shard in self.shards) // self.world_size
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _worker_shards(self):
+        """
+        [(arquivo, índice global da primeira amostra)] dos shards deste worker.
+        """
+        shards = list(self.shards)
+        if self.shuffle:
+            random.Random(self.seed + self.epoch).shuffle(shards)
+        offsets, offset = [], 0
+        for shard in shards:
+            offsets.append((shard["file"], offset))
+            offset += shard["count"]
+        worker = get_worker_info()
+        if worker is not None:
+            offsets = offsets[worker.id::worker.num_workers]
+        return offsets
+
+    def _rank_samples(self):
+        # Só as amostras deste processo, até o mesmo total para todos
+        end = len(self) * self.world_size
+        for name, offset in self._worker_shards():
+            if offset >= end:
+                continue
+            yield from self._read_shard(name, lambda i: offset + i < end and (offset + i) % self.world_size == self.rank)
+
+    def _read_shard(self, name, keep=None):
+        """
+        (bytes da imagem, rótulo) das amostras do shard com keep(posição no shard) verdadeiro.
+        O tar é aberto com acesso aleatório: o conteúdo das amostras puladas não é lido
+        (só os cabeçalhos), então cada processo lê do disco apenas a sua fração.
+        """
+        image_bytes, position = None, 0
+        with tarfile.open(os.path.join(self.shards_dir, name), "r:") as tar:
+            for member in tar:
+                is_label = member.name.endswith(".cls")
+                if keep is None or keep(position):
+                    data = tar.extractfile(member).read()
+                    if is_label:
+                        yield image_bytes, int(data)
+                    else:
+                        image_bytes = data
+                position += is_label
+
+    def _decode(self, image_bytes, label):
+        image = open_image(io.BytesIO(image_bytes), self.target_size)
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, label
+
+    def __iter__(self):
+        samples = self._rank_samples()
+        if not self.shuffle:
+            for image_bytes, label in samples:
+                yield self._decode(image_bytes, label)
+            return
+
+        worker = get_worker_info()
+        rng = random.Random(self.seed + self.epoch + (worker.id if worker is not None else 0))
+        # Guarda os bytes ainda codificados no buffer; só decodifica ao entregar a amostra
+        buffer = []
+        for sample in samples:
+            if len(buffer) < self.buffer_size:
+                buffer.append(sample)
+                continue
+            i = rng.randrange(len(buffer))
+            buffer[i], sample = sample, buffer[i]
+            yield self._decode(*sample)
+        rng.shuffle(buffer)
+        for sample in buffer:
+            yield self._decode(*sample)
@@ -0,0 +1,120 @@
+import os
+import argparse
+import itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+import config
+
+# --------------------------------------------------------------------------
+# Varredura de modelos/hiperparâmetros em paralelo
+# --------------------------------------------------------------------------
+# Cada combinação da grade vira uma execução de general_test.run_experiment num
+# processo separado, com um número fixo de threads (orçamento de núcleos por execução).
+# O dataset é compilado uma única vez para o cache uint8 (tensor_cache.py) e todas as
+# execuções leem o mesmo memmap, compartilhado pelo page cache do sistema.
+# Os resultados vão para uma única tabela; execuções que já têm resultado são puladas.
+
+RESULTS_PATH = "../results/sweep.csv"
+KEY_COLUMNS = ["Model_Name", "Batch_Size", "Dropout", "Weight_Decay", "Resolution", "Num_Unfrozen", "Epochs"]
+
+
+def build_grid(models, batch_sizes, dropouts, weight_decays, resolutions, unfrozen, num_epochs):
+    grid = []
+    for model_name, bs, p, wd, res, unf in itertools.product(models, batch_sizes, dropouts, weight_decays, resolutions, unfrozen):
+        grid.append({
+            "Model_Name": model_name,
+            "Batch_Size": bs,
+            "Dropout": p,
+            "Weight_Decay": wd,
+            "Resolution": res,
+            "Num_Unfrozen": unf,
+            "Epochs": num_epochs,
+        })
+    return grid
+
+
+def run_id(run):
+    return (f"{run['Model_Name']}-bs{run['Batch_Size']}-p{run['Dropout']}-wd{run['Weight_Decay']}"
+            f"-r{run['Resolution']}-u{run['Num_Unfrozen']}-e{run['Epochs']}")
+
+
+def completed_runs(results_path=RESULTS_PATH):
+    if not os.path.exists(results_path):
+        return set()
+    df = pd.read_csv(results_path)
+    return {run_id(row) for row in df[KEY_COLUMNS].to_dict("records")}
+
+
+def _init_worker(threads):
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+
+def _run(run, loader_workers):
+    # Importado no worker: cada processo monta o próprio modelo e DataLoaders
+    from general_test import run_experiment
+
+    result = run_experiment(
+        model_name=run["Model_Name"],
+        num_epochs=run["Epochs"],
+        batch_size=run["Batch_Size"],
+        dropout=run["Dropout"],
+        weight_decay=run["Weight_Decay"],
+        resolution=run["Resolution"],
+        num_unfrozen=run["Num_Unfrozen"],
+        save_dir=f"../best_model/{run['Model_Name']}/sweep/",
+        save_model_name=run_id(run),
+        data_format="cache",
+        num_workers=loader_workers,
+    )
+    return {**run, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Varredura paralela sobre o zoológico de modelos do general_test.py")
+    parser.add_argument("--models", nargs="+", default=["ResNet18", "EfficientNetB0", "MobileNetV2", "ConvNext-Nano", "ViTB16"])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[config.BATCH_SIZE])
+    parser.add_argument("--dropouts", nargs="+", type=float, default=[config.P])
+    parser.add_argument("--weight-decays", nargs="+", type=float, default=[config.WEIGHT_DECAY])
+    parser.add_argument("--resolutions", nargs="+", type=int, default=[config.RESOLUTION])
+    parser.add_argument("--unfrozen", nargs="+", type=int, default=[config.NUM_UNFROZEN])
+    parser.add_argument("--epochs", type=int, default=config.NUM_EPOCHS)
+    parser.add_argument("--parallel-runs", type=int, default=2, help="Execuções simultâneas")
+    parser.add_argument("--threads-per-run", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="Núcleos de cada execução")
+    parser.add_argument("--loader-workers", type=int, default=1, help="Workers do DataLoader de cada execução")
+    parser.add_argument("--results", default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    grid = build_grid(args.models, args.batch_sizes, args.dropouts, args.weight_decays, args.resolutions, args.unfrozen, args.epochs)
+    done = completed_runs(args.results)
+    pending = [run for run in grid if run_id(run) not in done]
+    print(f"{len(grid)} combinações, {len(grid) - len(pending)} já concluídas, {len(pending)} a executar")
+    if not pending:
+        return
+
+    # Decodifica o dataset uma vez por resolução, antes de abrir os processos
+    from tensor_cache import compile_split
+    for resolution in sorted({run["Resolution"] for run in pending}):
+        for root in (config.DATA_DIR_TRAIN, config.DATA_DIR_VAL, config.DATA_DIR_TEST):
+            compile_split(root, resolution=resolution)
+
+    context = mp.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.parallel_runs, mp_context=context,
+                             initializer=_init_worker, initargs=(args.threads_per_run,)) as pool:
+        futures = {pool.submit(_run, run, args.loader_workers): run for run in pending}
+        for future in as_completed(futures):
+            run = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:
+                print(f"[falhou] {run_id(run)}: {e}")
+                continue
+            header = not os.path.exists(args.results)
+            pd.DataFrame([row]).to_csv(args.results, mode="a", header=header, index=False)
+            print(f"[ok] {run_id(run)}: acurácia de teste {row['Test_Acuracia']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Dataset
+from torchvision import datasets
+from concurrent.futures import ProcessPoolExecutor
+import config
+from distributed import is_main_process, barrier
+from preprocessing import open_image
+
+# --------------------------------------------------------------------------
+# Cache de imagens pré-decodificadas (uint8, N x 3 x RESOLUTION x RESOLUTION)
+# --------------------------------------------------------------------------
+# Cada split vira uma pasta <split>-<resolução> em CACHE_DIR com:
+#   images.u8  -> np.memmap uint8 (N, 3, R, R), já redimensionado
+#   labels.npy -> rótulos (N,)
+#   meta.json  -> classes, class_to_idx, caminhos originais e a impressão digital
+# A impressão digital combina a lista de arquivos (caminho, tamanho, mtime) e a
+# resolução; se qualquer um mudar, o split é recompilado automaticamente.
+# A decodificação é a mesma do ImageFolder/shards (preprocessing.open_image), em modo
+# draft perto da resolução quando config.DRAFT_DECODE está ligado.
+# A normalização NÃO é feita aqui: ela roda no lote, já no device (myutils.normalize_batch).
+# No treino distribuído só o rank 0 compila; os demais esperam numa barreira e leem o
+# cache pronto. Os temporários levam o pid, então execuções separadas não se atropelam.
+
+CACHE_VERSION = 2
+
+
+def source_fingerprint(image_folder, resolution):
+    digest = hashlib.sha1(f"v{CACHE_VERSION}-{resolution}-draft={config.DRAFT_DECODE}".encode())
+    for path, label in image_folder.samples:
+        stat = os.stat(path)
+        digest.update(f"{path}|{label}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def split_cache_dir(root, resolution=config.RESOLUTION, cache_dir=config.CACHE_DIR):
+    # Uma pasta por resolução: um sweep com várias resoluções nunca recompila o cache
+    # que outro processo está lendo
+    name = os.path.basename(os.path.normpath(root))
+    return os.path.join(cache_dir, f"{name}-{resolution}")
+
+
+def _decode_chunk(args):
+    """
+    Decodifica e redimensiona um bloco de imagens direto no memmap de saída.
+    """
+    paths, start, out_path, total, resolution = args
+    out = np.memmap(out_path, dtype=np.uint8, mode="r+", shape=(total, 3, resolution, resolution))
+    target_size = (resolution, resolution) if config.DRAFT_DECODE else None
+    for i, path in enumerate(paths):
+        with open(path, "rb") as f:
+            img = open_image(f, target_size).resize((resolution, resolution), Image.BILINEAR)
+        out[start + i] = np.asarray(img).transpose(2, 0, 1)
+    out.flush()
+    return len(paths)
+
+
+def compile_split(root, cache_dir=config.CACHE_DIR, resolution=config.RESOLUTION, num_workers=8, chunk_size=256):
+    """
+    Compila um split no formato ImageFolder para o cache memory-mapped.
+    Não faz nada se o cache existente ainda corresponde à pasta e à resolução.
+    Retorna a pasta do cache.
+    """
+    out_dir = split_cache_dir(root, resolution, cache_dir)
+    if is_main_process():
+        _compile_split(root, out_dir, resolution, num_workers, chunk_size)
+    barrier()  # Os outros processos só abrem o cache depois que o rank 0 terminou
+    return out_dir
+
+
+def _compile_split(root, out_dir, resolution, num_workers, chunk_size):
+    image_folder = datasets.ImageFolder(root)
+    fingerprint = source_fingerprint(image_folder, resolution)
+    meta_path = os.path.join(out_dir, "meta.json")
+
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f).get("fingerprint") == fingerprint:
+                return
+        print(f"Cache desatualizado para {root}, recompilando...")
+
+    os.makedirs(out_dir, exist_ok=True)
+    total = len(image_folder.samples)
+    paths = [path for path, _ in image_folder.samples]
+    tmp_path = os.path.join(out_dir, f"images.u8.{os.getpid()}.tmp")
+    np.memmap(tmp_path, dtype=np.uint8, mode="w+", shape=(total, 3, resolution, resolution)).flush()
+
+    jobs = [
+        (paths[start:start + chunk_size], start, tmp_path, total, resolution)
+        for start in range(0, total, chunk_size)
+    ]
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        done = 0
+        for n in pool.map(_decode_chunk, jobs):
+            done += n
+            print(f"\r{root}: {done}/{total} imagens", end="")
+    print()
+
+    labels_tmp = os.path.join(out_dir, f"labels.{os.getpid()}.tmp.npy")
+    np.save(labels_tmp, np.asarray(image_folder.targets, dtype=np.int64))
+    os.replace(labels_tmp, os.path.join(out_dir, "labels.npy"))
+    os.replace(tmp_path, os.path.join(out_dir, "images.u8"))
+    meta = {
+        "fingerprint": fingerprint,
+        "root": root,
+        "resolution": resolution,
+        "shape": [total, 3, resolution, resolution],
+        "classes": image_folder.classes,
+        "class_to_idx": image_folder.class_to_idx,
+        "paths": paths,
+    }
+    # meta.json é escrito por último: só existe quando o cache está completo
+    meta_tmp = f"{meta_path}.{os.getpid()}.tmp"
+    with open(meta_tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(meta_tmp, meta_path)
+
+
+class CachedImageDataset(Dataset):
+    """
+    Substituto do ImageFolder que lê do cache memory-mapped.
+    Retorna (imagem uint8 3xRxR, rótulo); normalize o lote com myutils.normalize_batch.
+    """
+
+    def __init__(self, cache_path):
+        with open(os.path.join(cache_path, "meta.json")) as f:
+            meta = json.load(f)
+        self.cache_path = cache_path
+        self.shape = tuple(meta["shape"])
+        self.classes = meta["classes"]
+        self.class_to_idx = meta["class_to_idx"]
+        self.targets = np.load(os.path.join(cache_path, "labels.npy")).tolist()
+        self.samples = list(zip(meta["paths"], self.targets))
+        self._images = None  # aberto sob demanda, em cada worker do DataLoader
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def images(self):
+        if self._images is None:
+            self._images = np.memmap(os.path.join(self.cache_path, "images.u8"), dtype=np.uint8, mode="r", shape=self.shape)
+        return self._images
+
+    def __getitem__(self, index):
+        return torch.from_numpy(np.array(self.images[index])), self.targets[index]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_images"] = None
+        return state
+
+
+def cached_dataset(root, cache_dir=config.CACHE_DIR, resolution=config.RESOLUTION, num_workers=8):
+    """
+    Compila o split se necessário e retorna o CachedImageDataset correspondente.
+    """
+    return CachedImageDataset(compile_split(root, cache_dir, resolution, num_workers))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compila os splits do dataset para o cache uint8 memory-mapped")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--resolution", type=int, default=config.RESOLUTION)
+    args = parser.parse_args()
+    for split_root in [config.DATA_DIR_TRAIN, config.DATA_DIR_VAL, config.DATA_DIR_TEST]:
+        path = compile_split(split_root, resolution=args.resolution, num_workers=args.workers)
+        print(f"{split_root} -> {path}")
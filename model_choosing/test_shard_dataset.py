@@ -0,0 +1,63 @@
+import io
+import json
+import tarfile
+import pytest
+from torch.utils.data import DataLoader
+from shard_dataset import ShardedImageDataset
+
+# Rode com: cd model_choosing && python -m pytest -q test_shard_dataset.py
+
+
+def write_split(shards_dir, counts):
+    """
+    Shards falsos: o .cls de cada amostra guarda o índice global dela, para conferir
+    quais amostras cada processo recebeu.
+    """
+    shards, i = [], 0
+    for n, count in enumerate(counts):
+        name = f"train-{n:05d}.tar"
+        with tarfile.open(shards_dir / name, "w") as tar:
+            for _ in range(count):
+                for member, data in ((f"{i:08d}.jpg", b"jpg"), (f"{i:08d}.cls", str(i).encode())):
+                    info = tarfile.TarInfo(member)
+                    info.size = len(data)
+                    tar.addfile(info, io.BytesIO(data))
+                i += 1
+        shards.append({"file": name, "count": count, "bytes": 3 * count})
+    index = {"classes": ["a"], "class_to_idx": {"a": 0}, "splits": {"train": shards}}
+    (shards_dir / "index.json").write_text(json.dumps(index))
+
+
+def rank_samples(shards_dir, rank, world_size, shuffle=False, num_workers=0):
+    dataset = ShardedImageDataset("train", shards_dir=str(shards_dir), shuffle=shuffle, buffer_size=4,
+                                  rank=rank, world_size=world_size)
+    dataset._decode = lambda image_bytes, label: label
+    dataset.set_epoch(1)
+    if num_workers:
+        loader = DataLoader(dataset, batch_size=None, num_workers=num_workers)
+        return len(dataset), [int(label) for label in loader]
+    return len(dataset), list(dataset)
+
+
+@pytest.mark.parametrize("counts, world_size, num_workers", [
+    ([15, 15, 15, 3], 2, 0),
+    ([15, 15, 15, 3], 3, 0),
+    ([15, 15, 15, 3], 2, 3),  # Menos shards que processos x workers
+    ([7, 2], 2, 2),
+])
+@pytest.mark.parametrize("shuffle", [False, True])
+def test_ranks_get_equal_disjoint_samples(tmp_path, counts, world_size, num_workers, shuffle):
+    write_split(tmp_path, counts)
+    results = [rank_samples(tmp_path, rank, world_size, shuffle, num_workers) for rank in range(world_size)]
+    expected = sum(counts) // world_size
+    for length, samples in results:
+        assert length == expected
+        assert len(samples) == expected
+    seen = [label for _, samples in results for label in samples]
+    assert len(set(seen)) == len(seen)
+
+
+def test_rejects_fewer_shards_than_ranks(tmp_path):
+    write_split(tmp_path, [10])
+    with pytest.raises(AssertionError):
+        rank_samples(tmp_path, 0, 2)
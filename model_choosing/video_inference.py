@@ -0,0 +1,213 @@
+import os
+import sys
+import time
+import queue
+import argparse
+import threading
+import numpy as np
+import cv2
+import torch
+from PIL import Image
+import config
+from myutils import normalize_batch
+from eval_utils import build_transform
+from model_registry import load_model
+from backends import TorchBackend, load_artifact
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dataset-processing"))
+from image_extraction import video_info, sample_targets, read_frames
+
+# --------------------------------------------------------------------------
+# Classificação de um vídeo inteiro, sem gravar frames em disco
+# --------------------------------------------------------------------------
+# Uma thread produtora lê o vídeo com a mesma lógica de seek/grab de image_extraction.py,
+# amostra um frame a cada --every-seconds, reduz para RESOLUTION x RESOLUTION com o mesmo
+# transform do treino/teste (eval_utils.build_transform no modo uint8: Resize do PIL) e
+# coloca o frame (uint8) numa fila limitada. O consumidor junta lotes de --batch-size frames,
+# normaliza o lote de uma vez (myutils.normalize_batch) e roda um forward por lote.
+# A decodificação do próximo lote acontece enquanto o modelo processa o atual.
+#
+# Saída: probabilidades por frame suavizadas no tempo (média móvel exponencial), por
+# segmento de --segment-seconds e do clipe inteiro (média dos frames). Quando a confiança
+# do clipe passa de --stop-confidence (depois de --min-frames frames), a leitura para.
+#
+# Ex.: python video_inference.py ../videos/clipe.mp4 --model MobileNetV2
+#      python video_inference.py clipe.mp4 --artifact ../quantized-models/MobileNetV2.int8.pt
+
+CLASS_NAMES = ['Black Clover', 'Blue Lock', 'Naruto']
+_END = object()
+
+
+def load_serving_model(model_name="MobileNetV2", checkpoint_path=None, artifact=None, device="cpu"):
+    """
+    Mesmo modelo do servidor/front-end: um artefato exportado (ONNX/TorchScript) ou o checkpoint .pth.
+    """
+    if artifact:
+        return load_artifact(artifact, device)
+    checkpoint_path = checkpoint_path or config.SERVING_CHECKPOINT.format(model=model_name)
+    return TorchBackend(load_model(model_name, checkpoint_path, device), device)
+
+
+class FrameProducer(threading.Thread):
+    """
+    Lê e reduz os frames amostrados numa thread própria; entrega (n, índice, frame RGB uint8 HxWx3)
+    na fila e um marcador no fim. stop() interrompe a leitura (parada antecipada).
+    """
+
+    def __init__(self, video_path, max_frames=None, resolution=config.RESOLUTION, every_seconds=config.VIDEO_EVERY_SECONDS,
+                 max_queue=config.VIDEO_QUEUE):
+        super().__init__(daemon=True)
+        self.video_path = video_path
+        self.resolution = resolution
+        self.every_seconds = every_seconds
+        self.max_frames = max_frames
+        self.transform = build_transform(resolution, uint8=True)
+        self.total, self.fps = video_info(video_path)
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _put(self, item):
+        # Com a fila cheia, espera em fatias curtas para perceber um stop() do consumidor
+        while not self._stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run(self):
+        vid = cv2.VideoCapture(self.video_path)
+        try:
+            end = self.total if self.total > 0 else sys.maxsize
+            targets = sample_targets(0, end, self.fps, stride=1, every_seconds=self.every_seconds)
+            for n, idx, frame in read_frames(vid, targets):
+                if self.max_frames and n >= self.max_frames:
+                    break
+                frame = self.transform(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+                if not self._put((n, idx, frame)):
+                    return
+            self._put(_END)
+        except Exception as e:
+            self._put(e)
+        finally:
+            vid.release()
+
+
+def _next_batch(frames_queue, batch_size):
+    """
+    Bloqueia pelo primeiro item e completa o lote com o que já estiver na fila.
+    """
+    items = [frames_queue.get()]
+    while len(items) < batch_size and items[-1] is not _END and not isinstance(items[-1], Exception):
+        try:
+            items.append(frames_queue.get_nowait())
+        except queue.Empty:
+            break
+    return items
+
+
+def classify_video(video_path, model, device="cpu", batch_size=config.VIDEO_BATCH_SIZE,
+                   every_seconds=config.VIDEO_EVERY_SECONDS, segment_seconds=config.VIDEO_SEGMENT_SECONDS,
+                   smoothing=config.VIDEO_SMOOTHING, stop_confidence=config.VIDEO_STOP_CONFIDENCE,
+                   min_frames=config.VIDEO_MIN_FRAMES, max_frames=None, resolution=config.RESOLUTION):
+    """
+    Probabilidades do clipe, de cada segmento e de cada frame amostrado (suavizadas).
+    'model' é qualquer backend de backends.py; 'stop_confidence=None' lê o vídeo inteiro.
+    """
+    start_time = time.time()
+    producer = FrameProducer(video_path, max_frames, resolution, every_seconds)
+    producer.start()
+    times, probs = [], []
+    smoothed, state = [], None
+    stopped_early = False
+    try:
+        done = False
+        while not done:
+            items = _next_batch(producer.queue, batch_size)
+            if items[-1] is _END or isinstance(items[-1], Exception):
+                if isinstance(items[-1], Exception):
+                    raise items[-1]
+                done = True
+                items = items[:-1]
+            if not items:
+                break
+            batch = torch.from_numpy(np.stack([frame for _, _, frame in items])).permute(0, 3, 1, 2)
+            with torch.no_grad():
+                batch_probs = torch.softmax(model(normalize_batch(batch.to(device))).float(), dim=1).cpu().numpy()
+            for (_, idx, _), frame_probs in zip(items, batch_probs):
+                state = frame_probs if state is None else smoothing * state + (1 - smoothing) * frame_probs
+                times.append(idx / producer.fps)
+                probs.append(frame_probs)
+                smoothed.append(state)
+            clip = np.mean(probs, axis=0)
+            if stop_confidence is not None and len(probs) >= min_frames and clip.max() >= stop_confidence:
+                stopped_early = not done
+                break
+    finally:
+        producer.stop()
+    producer.join()
+
+    if not probs:
+        raise ValueError(f"Nenhum frame lido de {video_path}")
+    times, probs, smoothed = np.array(times), np.array(probs), np.array(smoothed)
+    clip = probs.mean(axis=0)
+    segments = []
+    segment_ids = (times // segment_seconds).astype(int)
+    for segment in np.unique(segment_ids):
+        mask = segment_ids == segment
+        segments.append({
+            "start_s": segment * segment_seconds,
+            "end_s": (segment + 1) * segment_seconds,
+            "frames": int(mask.sum()),
+            "probabilities": smoothed[mask].mean(axis=0),
+        })
+    return {
+        "probabilities": clip,
+        "prediction": int(clip.argmax()),
+        "segments": segments,
+        "frame_times": times,
+        "frame_probabilities": smoothed,
+        "frames": len(probs),
+        "stopped_early": stopped_early,
+        "seconds": time.time() - start_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classifica vídeos inteiros (decodificação em thread + inferência em lote)")
+    parser.add_argument("videos", nargs="+")
+    parser.add_argument("--model", default="MobileNetV2")
+    parser.add_argument("--checkpoint", help="Padrão: ../frontend/streamlit/best<modelo>-more-images-5unfrozen_100.pth")
+    parser.add_argument("--artifact", help="Artefato exportado (.onnx / .int8.pt) no lugar do checkpoint")
+    parser.add_argument("--every-seconds", type=float, default=config.VIDEO_EVERY_SECONDS)
+    parser.add_argument("--batch-size", type=int, default=config.VIDEO_BATCH_SIZE)
+    parser.add_argument("--segment-seconds", type=float, default=config.VIDEO_SEGMENT_SECONDS)
+    parser.add_argument("--smoothing", type=float, default=config.VIDEO_SMOOTHING, help="Peso do histórico na média móvel (0 desativa)")
+    parser.add_argument("--stop-confidence", type=float, default=config.VIDEO_STOP_CONFIDENCE, help="0 lê o vídeo inteiro")
+    parser.add_argument("--min-frames", type=int, default=config.VIDEO_MIN_FRAMES)
+    parser.add_argument("--max-frames", type=int)
+    args = parser.parse_args()
+
+    cv2.setNumThreads(1)  # A thread produtora não disputa os núcleos com o forward
+    model = load_serving_model(args.model, args.checkpoint, args.artifact)
+    for video_path in args.videos:
+        result = classify_video(video_path, model, batch_size=args.batch_size, every_seconds=args.every_seconds,
+                                segment_seconds=args.segment_seconds, smoothing=args.smoothing,
+                                stop_confidence=args.stop_confidence or None, min_frames=args.min_frames,
+                                max_frames=args.max_frames)
+        print(f"\n{video_path}: {CLASS_NAMES[result['prediction']]} "
+              f"({result['frames']} frames em {result['seconds']:.1f}s, {result['frames'] / result['seconds']:.1f} frames/s"
+              f"{', parada antecipada' if result['stopped_early'] else ''})")
+        print("  clipe: " + " | ".join(f"{name} {p:.3f}" for name, p in zip(CLASS_NAMES, result["probabilities"])))
+        for segment in result["segments"]:
+            best = int(segment["probabilities"].argmax())
+            print(f"  {segment['start_s']:7.1f}-{segment['end_s']:7.1f}s: {CLASS_NAMES[best]:<13} "
+                  f"{segment['probabilities'][best]:.3f} ({segment['frames']} frames)")
+
+
+if __name__ == "__main__":
+    main()